@@ -0,0 +1,135 @@
+"""Compares database round trips of the single-transaction deposit pipeline
+with the former two-session flow (referral bonus commit, then deposit commit).
+
+    POSTGRES_DB=moon_bench python -m benchmarks.deposit_roundtrips --deposits 500
+"""
+import asyncio
+import time
+import uuid
+from decimal import Decimal
+
+import click
+from sqlalchemy import event
+
+import src.support.models  # noqa: F401  (registers Ticket/Message for the User mapper)
+from src.database import async_session, engine
+from src.users.models import User
+from src.users.schemas import RegisterUser
+from src.users.service import UserService
+from src.wallet.models import PaymentSystem, Transaction, TransactionStatus, TransactionType
+from src.wallet.schemas import CreateDeposit, CreateTransaction
+from src.wallet.service import TransactionService, apply_transaction_to_balance
+
+
+class RoundTrips:
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+        self.connections = 0
+
+    def listen(self):
+        event.listen(engine.sync_engine, 'before_cursor_execute', self._statement)
+        event.listen(engine.sync_engine, 'commit', self._commit)
+        event.listen(engine.sync_engine.pool, 'checkout', self._checkout)
+
+    def remove(self):
+        event.remove(engine.sync_engine, 'before_cursor_execute', self._statement)
+        event.remove(engine.sync_engine, 'commit', self._commit)
+        event.remove(engine.sync_engine.pool, 'checkout', self._checkout)
+
+    def _statement(self, *args):
+        self.statements += 1
+
+    def _commit(self, *args):
+        self.commits += 1
+
+    def _checkout(self, *args):
+        self.connections += 1
+
+
+async def legacy_deposit(user: User, deposit: CreateDeposit):
+    """The flow `/wallet/deposit` used before the pipeline, kept for comparison."""
+    async with async_session() as session:
+        if not user.has_deposited:
+            if user.referrer_id:
+                referrer = await session.get(User, user.referrer_id)
+                referral_bonus = Decimal(deposit.amount) * Decimal(referrer.referral_bonus_rate or 0.1)
+                referrer.referral_earnings = (referrer.referral_earnings or Decimal(0)) + referral_bonus
+                referral_transaction = Transaction(
+                    payment_system=PaymentSystem.internal,
+                    amount=referral_bonus,
+                    type=TransactionType.REFERRAL,
+                    user_id=user.referrer_id,
+                    status=TransactionStatus.CONFIRMED
+                )
+                session.add(referral_transaction)
+                await apply_transaction_to_balance(session, referral_transaction)
+            user.has_deposited = True
+            await session.merge(user)
+            await session.commit()
+
+        async with TransactionService() as service:
+            await service.create_transaction(CreateTransaction(
+                payment_system=deposit.payment_system,
+                amount=deposit.amount,
+                type=TransactionType.IN,
+                user_id=user.id,
+                status=TransactionStatus.CONFIRMED
+            ))
+
+
+async def pipeline_deposit(user: User, deposit: CreateDeposit):
+    async with TransactionService() as service:
+        await service.create_deposit(user.id, deposit)
+
+
+async def referred_users(count: int):
+    async with UserService() as service:
+        referrer = await service.register_user(RegisterUser(
+            username=uuid.uuid4().hex[:10], password='bench', fingerprint=uuid.uuid4().hex
+        ))
+    users = []
+    for _ in range(count):
+        async with UserService() as service:
+            users.append(await service.register_user(RegisterUser(
+                username=uuid.uuid4().hex[:10], password='bench', fingerprint=uuid.uuid4().hex,
+                referrer_id=referrer.id
+            )))
+    return users
+
+
+async def measure(name: str, deposit_fn, users):
+    deposit = CreateDeposit(payment_system=PaymentSystem.card, amount=Decimal(100))
+    trips = RoundTrips()
+    trips.listen()
+    started = time.perf_counter()
+    try:
+        for user in users:
+            await deposit_fn(user, deposit)
+    finally:
+        trips.remove()
+    elapsed = time.perf_counter() - started
+
+    n = len(users)
+    click.echo(
+        f"{name:>9}: {trips.statements / n:5.1f} statements, {trips.commits / n:.1f} commits, "
+        f"{trips.connections / n:.1f} connection checkouts, {elapsed / n * 1000:6.2f} ms per first deposit"
+    )
+
+
+@click.command()
+@click.option("--deposits", default=200, type=int, help="First deposits of referred users per flow.")
+def main(deposits: int) -> None:
+    """Measures round trips per first deposit with a referral bonus."""
+
+    async def run():
+        engine.echo = False
+        await measure('legacy', legacy_deposit, await referred_users(deposits))
+        await measure('pipeline', pipeline_deposit, await referred_users(deposits))
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
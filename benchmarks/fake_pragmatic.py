@@ -0,0 +1,288 @@
+"""Stand-in for the Pragmatic API, to load-test `src.providers.pragmatic` on one
+machine. Serves the endpoints `make_request` and `request_catalog` call,
+rejects requests whose `X-Sign` doesn't match `generate_headers`, and injects
+latency, 5xx errors and 429s at the given rates. With `--callback-url`, every
+`games/init` also plays the session like a game would: signed balance, bet,
+win, refund and rollback callbacks against our wallet.
+
+    PRAGMATIC_MERCHANT_ID=bench PRAGMATIC_MERCHANT_KEY=secret \\
+        python -m benchmarks.fake_pragmatic --port 8800 --latency-ms 40 --error-rate 0.05 --throttle-rate 0.02
+
+then point the API at it with `PRAGMATIC_BASE_API_URL=http://localhost:8800`
+(same merchant id and key). `GET /__stats` returns what the server saw.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import aiohttp
+import click
+from aiohttp import web
+
+from src.providers.pragmatic.utils import generate_headers, verify_signature
+
+GAME_TYPES = ('slots', 'live', 'roulette', 'blackjack', 'crash')
+GAME_TAGS = ('new', 'hot', 'megaways', 'jackpot', 'bonus-buy')
+
+
+@dataclass
+class Faults:
+    # Mean added latency and its uniform jitter, seconds
+    latency: float = 0.0
+    jitter: float = 0.0
+    # Share of requests answered 500, and 429 with Retry-After
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: int = 1
+
+
+@dataclass
+class Play:
+    # Where games/init sends the session's callbacks, None to not play
+    callback_url: Optional[str] = None
+    spins: int = 20
+    stake: float = 1.0
+    win_rate: float = 0.4
+    refund_rate: float = 0.02
+    rollback_rate: float = 0.02
+
+
+def make_games(count: int) -> List[dict]:
+    rng = random.Random(count)
+    return [
+        {
+            'uuid': uuid.UUID(int=rng.getrandbits(128)).hex,
+            'name': f"{rng.choice(('Sweet', 'Gates of', 'Big', 'Wolf', 'Mega', 'Sugar'))} "
+                    f"{rng.choice(('Bonanza', 'Olympus', 'Bass', 'Gold', 'Rush', 'Roulette'))} {i}",
+            'image': f'https://images.example/{i}.png',
+            'type': rng.choice(GAME_TYPES),
+            'provider': rng.choice(('Pragmatic Play', 'Reel Kingdom', 'Fat Panda')),
+            'technology': 'html5',
+            'has_lobby': rng.random() < 0.1,
+            'is_mobile': True,
+            'has_freespins': rng.random() < 0.5,
+            'tags': [{'code': tag, 'label': tag.title()} for tag in rng.sample(GAME_TAGS, rng.randint(0, 2))],
+        }
+        for i in range(count)
+    ]
+
+
+class FakePragmatic:
+    def __init__(self, faults: Faults, play: Play, games: int = 2000, page_size: int = 500):
+        self.faults = faults
+        self.play = play
+        self.games = make_games(games)
+        self.page_size = page_size
+        self.freespins: Dict[str, dict] = {}
+        self.requests = Counter()
+        self.responses = Counter()
+        self.bad_signatures = 0
+        self.callbacks = Counter()
+        self.callback_seconds = 0.0
+        self._plays = set()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+        routes = {
+            ('GET', 'games'): self.games_list,
+            ('GET', 'games/lobby'): self.lobby,
+            ('POST', 'games/init'): self.init,
+            ('GET', 'limits'): self.static({'limits': [{'id': i, 'bet': i * 0.1} for i in range(1, 21)]}),
+            ('GET', 'limits/freespin'): self.static({'limits': [{'id': i, 'bet': i * 0.2} for i in range(1, 11)]}),
+            ('GET', 'jackpots'): self.jackpots,
+            ('GET', 'freespins/bets'): self.static({'bets': [{'id': i, 'total_bet': i * 0.5} for i in range(1, 11)]}),
+            ('POST', 'freespins/set'): self.freespins_set,
+            ('GET', 'freespins/get'): self.freespins_get,
+            ('POST', 'freespins/cancel'): self.freespins_cancel,
+            ('POST', 'balance/notify'): self.static({'success': True}),
+            ('POST', 'self-validate'): self.static({'success': True, 'log': []}),
+        }
+        for (method, path), handler in routes.items():
+            app.router.add_route(method, f'/{path}', handler)
+        app.router.add_get('/__stats', self.stats)
+        app.on_cleanup.append(self.close)
+        return app
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        if request.path == '/__stats':
+            return await handler(request)
+        self.requests[request.path] += 1
+        response = await self.respond(request, handler)
+        self.responses[response.status] += 1
+        return response
+
+    async def respond(self, request: web.Request, handler) -> web.StreamResponse:
+        # make_request signs the query parameters only, form bodies are not signed
+        if not verify_signature(dict(request.query), request.headers):
+            self.bad_signatures += 1
+            return web.json_response({'detail': 'Invalid signature'}, status=401)
+
+        faults = self.faults
+        delay = faults.latency + random.uniform(-faults.jitter, faults.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        roll = random.random()
+        if roll < faults.throttle_rate:
+            return web.json_response({'detail': 'Too many requests'}, status=429,
+                                     headers={'Retry-After': str(faults.retry_after)})
+        if roll < faults.throttle_rate + faults.error_rate:
+            return web.json_response({'detail': 'Injected error'}, status=500)
+        return await handler(request)
+
+    def static(self, body):
+        async def handler(request: web.Request):
+            return self.conditional(request, body)
+        return handler
+
+    def conditional(self, request: web.Request, body) -> web.Response:
+        etag = f'"{hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()}"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.json_response(body, headers={'ETag': etag})
+
+    async def games_list(self, request: web.Request):
+        page = int(request.query.get('page', 1))
+        start = (page - 1) * self.page_size
+        return self.conditional(request, {
+            'items': self.games[start:start + self.page_size],
+            '_meta': {
+                'totalCount': len(self.games),
+                'pageCount': -(-len(self.games) // self.page_size),
+                'currentPage': page,
+                'perPage': self.page_size,
+            },
+        })
+
+    async def lobby(self, request: web.Request):
+        return web.json_response({'lobby': [{'id': i, 'name': f'Table {i}'} for i in range(1, 6)]})
+
+    async def jackpots(self, request: web.Request):
+        # Changes every few seconds, like the real feed
+        tick = int(time.time() // 5)
+        return self.conditional(request, {'jackpots': [{'id': i, 'amount': 10_000 + tick * i} for i in range(1, 4)]})
+
+    async def init(self, request: web.Request):
+        data = await request.post()
+        if self.play.callback_url:
+            task = asyncio.create_task(self.play_session(dict(data)))
+            self._plays.add(task)
+            task.add_done_callback(self._plays.discard)
+        url = f"https://games.example/{data.get('game_uuid')}?session={data.get('session_id')}"
+        return web.json_response({'url': url})
+
+    async def freespins_set(self, request: web.Request):
+        data = await request.post()
+        freespin_id = data.get('freespin_id')
+        if not freespin_id or not data.get('player_id'):
+            return web.json_response({'detail': 'Data validation failed'}, status=422)
+        self.freespins.setdefault(freespin_id, dict(data))
+        return web.json_response({'freespin_id': freespin_id})
+
+    async def freespins_get(self, request: web.Request):
+        campaign = self.freespins.get(request.query.get('freespin_id'))
+        if campaign is None:
+            return web.json_response({'detail': 'Resource not found'}, status=404)
+        return web.json_response(campaign)
+
+    async def freespins_cancel(self, request: web.Request):
+        data = await request.post()
+        if self.freespins.pop(data.get('freespin_id'), None) is None:
+            return web.json_response({'detail': 'Resource not found'}, status=404)
+        return web.json_response({'success': True})
+
+    async def play_session(self, init: dict):
+        """Plays like a game client: balance, then bets with some wins, an
+        occasional refund of a bet and rollback of a bet and its win."""
+        play = self.play
+        common = {'player_id': init['player_id'], 'currency': init['currency'], 'session_id': init['session_id']}
+        game = {**common, 'game_uuid': init['game_uuid']}
+        await self.callback({'action': 'balance', **common})
+        for _ in range(play.spins):
+            bet_id = uuid.uuid4().hex
+            status = await self.callback({'action': 'bet', **game, 'amount': play.stake, 'transaction_id': bet_id})
+            if status != 200:
+                break
+            if random.random() < play.refund_rate:
+                await self.callback({'action': 'refund', **game, 'amount': play.stake,
+                                     'transaction_id': uuid.uuid4().hex, 'bet_transaction_id': bet_id})
+                continue
+            reversed_ids = [bet_id]
+            if random.random() < play.win_rate:
+                win_id = uuid.uuid4().hex
+                await self.callback({'action': 'win', **game, 'amount': play.stake * 2, 'transaction_id': win_id})
+                reversed_ids.append(win_id)
+            if random.random() < play.rollback_rate:
+                await self.callback({'action': 'rollback', 'player_id': init['player_id'],
+                                     'game_uuid': init['game_uuid'], 'currency': init['currency'],
+                                     'transaction_id': uuid.uuid4().hex,
+                                     'rollback_transactions': ','.join(reversed_ids)})
+
+    async def callback(self, params: dict) -> int:
+        params = {name: str(value) for name, value in params.items()}
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        started = time.perf_counter()
+        try:
+            async with self._session.post(self.play.callback_url, params=params,
+                                          headers=generate_headers(params)) as response:
+                status = response.status
+        except aiohttp.ClientError:
+            status = 0
+        self.callback_seconds += time.perf_counter() - started
+        self.callbacks[f"{params['action']} {status}"] += 1
+        return status
+
+    async def stats(self, request: web.Request):
+        return web.json_response(self.snapshot())
+
+    def snapshot(self) -> dict:
+        callbacks = sum(self.callbacks.values())
+        return {
+            'requests': dict(self.requests),
+            'responses': {str(status): count for status, count in self.responses.items()},
+            'bad_signatures': self.bad_signatures,
+            'freespins': len(self.freespins),
+            'callbacks': dict(self.callbacks),
+            'callback_mean_ms': round(self.callback_seconds / callbacks * 1000, 2) if callbacks else None,
+            'sessions_playing': len(self._plays),
+        }
+
+    async def close(self, app: web.Application = None):
+        for task in list(self._plays):
+            task.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", default=8800, type=int)
+@click.option("--games", default=2000, type=int, help="Games in the catalog.")
+@click.option("--latency-ms", default=0.0, type=float, help="Mean added latency.")
+@click.option("--jitter-ms", default=0.0, type=float, help="Uniform jitter around the latency.")
+@click.option("--error-rate", default=0.0, type=float, help="Share of requests answered 500.")
+@click.option("--throttle-rate", default=0.0, type=float, help="Share of requests answered 429.")
+@click.option("--retry-after", default=1, type=int, help="Retry-After of the 429s, seconds.")
+@click.option("--callback-url", default=None, help="Our callback endpoint; games/init then plays the session.")
+@click.option("--spins", default=20, type=int, help="Bets per played session.")
+def main(host: str, port: int, games: int, latency_ms: float, jitter_ms: float, error_rate: float,
+         throttle_rate: float, retry_after: int, callback_url: Optional[str], spins: int) -> None:
+    """Runs the fake Pragmatic API until interrupted."""
+    fake = FakePragmatic(
+        Faults(latency_ms / 1000, jitter_ms / 1000, error_rate, throttle_rate, retry_after),
+        Play(callback_url, spins),
+        games
+    )
+    web.run_app(fake.app(), host=host, port=port)
+
+
+if __name__ == "__main__":
+    main()
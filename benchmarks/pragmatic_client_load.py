@@ -0,0 +1,105 @@
+"""Load on our Pragmatic client against the in-process fake API: latency of
+`make_request` through retries, the circuit breaker and the bulkhead, and how
+many upstream requests each call cost.
+
+    python -m benchmarks.pragmatic_client_load --calls 5000 --concurrency 100 --latency-ms 30 --error-rate 0.05
+
+Pool, breaker, bulkhead and deadline come from the usual `PRAGMATIC_*` settings.
+"""
+import asyncio
+import time
+from collections import Counter
+from typing import Dict, List
+
+import click
+from aiohttp import web
+from fastapi import HTTPException
+
+from benchmarks.fake_pragmatic import FakePragmatic, Faults, Play
+from src.providers.pragmatic.client import pragmatic_client, pragmatic_guard
+from src.providers.pragmatic.utils import make_request
+from src.settings import Settings
+
+# What a lobby worker mostly does, reads, with some writes that are not retried
+CALLS = (
+    ("GET", "games/lobby", {"game_uuid": "g1", "currency": "EUR"}, None),
+    ("GET", "limits", None, None),
+    ("GET", "freespins/get", {"freespin_id": "load"}, None),
+    ("POST", "balance/notify", None, {"balance": "10", "session_id": "load"}),
+)
+
+
+def percentile(values: List[float], share: float) -> float:
+    return values[max(int(len(values) * share) - 1, 0)]
+
+
+async def call(latencies: Dict[str, List[float]], outcomes: Counter, index: int):
+    method, endpoint, params, data = CALLS[index % len(CALLS)]
+    started = time.perf_counter()
+    try:
+        await make_request(method, endpoint, params, data)
+        outcome = "ok"
+    except HTTPException as e:
+        outcome = str(e.status_code)
+    latencies.setdefault(method, []).append(time.perf_counter() - started)
+    outcomes[f"{method} {outcome}"] += 1
+
+
+@click.command()
+@click.option("--calls", default=2000, type=int)
+@click.option("--concurrency", default=50, type=int, help="Calls in flight.")
+@click.option("--port", default=8801, type=int, help="Port of the fake API.")
+@click.option("--latency-ms", default=20.0, type=float)
+@click.option("--jitter-ms", default=10.0, type=float)
+@click.option("--error-rate", default=0.02, type=float)
+@click.option("--throttle-rate", default=0.01, type=float)
+def main(calls: int, concurrency: int, port: int, latency_ms: float, jitter_ms: float, error_rate: float,
+         throttle_rate: float) -> None:
+    """Runs `calls` requests, `concurrency` at a time, and prints latencies and retry cost."""
+    Settings.PRAGMATIC_BASE_API_URL = f"http://127.0.0.1:{port}"
+    Settings.PRAGMATIC_MERCHANT_ID = Settings.PRAGMATIC_MERCHANT_ID or "bench"
+    Settings.PRAGMATIC_MERCHANT_KEY = Settings.PRAGMATIC_MERCHANT_KEY or "bench"
+
+    async def run():
+        fake = FakePragmatic(Faults(latency_ms / 1000, jitter_ms / 1000, error_rate, throttle_rate), Play())
+        runner = web.AppRunner(fake.app())
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+
+        latencies: Dict[str, List[float]] = {}
+        outcomes = Counter()
+        queue = iter(range(calls))
+
+        async def worker():
+            for index in queue:
+                await call(latencies, outcomes, index)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        await pragmatic_client.close()
+        await runner.cleanup()
+
+        server = fake.snapshot()
+        upstream = sum(server["requests"].values())
+        click.echo(f"{calls} calls in {elapsed:.1f} s, {calls / elapsed:.0f}/s, "
+                   f"{upstream} upstream requests ({upstream / calls:.2f} per call), "
+                   f"bad signatures {server['bad_signatures']}")
+        click.echo(f"upstream answers {server['responses']}")
+        click.echo(f"outcomes {dict(sorted(outcomes.items()))}")
+        for method, values in sorted(latencies.items()):
+            values.sort()
+            click.echo(
+                f"{method:>4}: {len(values):6} calls, p50 {percentile(values, 0.5) * 1000:7.2f} ms, "
+                f"p95 {percentile(values, 0.95) * 1000:7.2f} ms, p99 {percentile(values, 0.99) * 1000:7.2f} ms, "
+                f"max {values[-1] * 1000:7.2f} ms"
+            )
+        click.echo(f"guard {pragmatic_guard.stats()}")
+        if server["bad_signatures"]:
+            raise click.ClickException("the fake API rejected signatures")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Latency of provider wallet callbacks settled against our ledger: players
+spin in parallel, each one bet (and sometimes a win) after another, like
+games send them.
+
+    POSTGRES_DB=moon_bench python -m benchmarks.provider_wallet_latency --players 50 --spins 200
+"""
+import asyncio
+import random
+import time
+import uuid
+from decimal import Decimal
+from typing import Dict, List
+
+import click
+
+import src.support.models  # noqa: F401  (registers Ticket/Message for the User mapper)
+from src.database import engine
+from src.providers.service import ProviderWalletService
+from src.users.schemas import RegisterUser
+from src.users.service import UserService
+from src.wallet.models import PaymentSystem, TransactionStatus, TransactionType
+from src.wallet.schemas import CreateTransaction
+from src.wallet.service import TransactionService
+
+PROVIDER = 'benchmark'
+
+
+async def funded_player(amount: Decimal) -> int:
+    async with UserService() as service:
+        user = await service.register_user(RegisterUser(
+            username=uuid.uuid4().hex[:10], password='bench', fingerprint=uuid.uuid4().hex
+        ))
+    async with TransactionService() as service:
+        await service.create_transaction(CreateTransaction(
+            payment_system=PaymentSystem.card,
+            type=TransactionType.IN,
+            amount=amount,
+            user_id=user.id,
+            status=TransactionStatus.CONFIRMED
+        ))
+    return user.id
+
+
+async def callback(latencies: Dict[str, List[float]], action: str, *args):
+    started = time.perf_counter()
+    async with ProviderWalletService(PROVIDER) as service:
+        await getattr(service, action)(*args)
+    latencies.setdefault(action, []).append(time.perf_counter() - started)
+
+
+async def play(user_id: int, spins: int, stake: Decimal, win_rate: float, latencies: Dict[str, List[float]]):
+    for _ in range(spins):
+        await callback(latencies, 'bet', user_id, uuid.uuid4().hex, stake)
+        if random.random() < win_rate:
+            await callback(latencies, 'win', user_id, uuid.uuid4().hex, stake * 2)
+        if random.random() < 0.01:
+            # A retried callback is answered from provider_transactions
+            transaction_id = uuid.uuid4().hex
+            await callback(latencies, 'bet', user_id, transaction_id, stake)
+            await callback(latencies, 'bet', user_id, transaction_id, stake)
+
+
+def percentile(values: List[float], share: float) -> float:
+    return values[max(int(len(values) * share) - 1, 0)]
+
+
+@click.command()
+@click.option("--players", default=50, type=int, help="Players spinning in parallel.")
+@click.option("--spins", default=100, type=int, help="Bets per player.")
+@click.option("--win-rate", default=0.4, type=float)
+@click.option("--target-p99-ms", default=50.0, type=float, help="Fail if a p99 is above this.")
+def main(players: int, spins: int, win_rate: float, target_p99_ms: float) -> None:
+    """Measures p50/p95/p99 of bet and win callbacks under parallel load."""
+
+    async def run():
+        engine.echo = False
+        stake = Decimal(1)
+        user_ids = await asyncio.gather(*(funded_player(stake * spins * 2) for _ in range(players)))
+
+        # Opens the pool connections and prepares statements before measuring
+        await asyncio.gather(*(play(user_id, 1, stake, win_rate, {}) for user_id in user_ids))
+
+        latencies: Dict[str, List[float]] = {}
+        started = time.perf_counter()
+        await asyncio.gather(*(play(user_id, spins, stake, win_rate, latencies) for user_id in user_ids))
+        elapsed = time.perf_counter() - started
+        await engine.dispose()
+
+        total = sum(len(values) for values in latencies.values())
+        click.echo(f"{total} callbacks in {elapsed:.1f} s, {total / elapsed:.0f}/s, "
+                   f"pool size {engine.pool.size()} + overflow")
+        failed = False
+        for action, values in sorted(latencies.items()):
+            values.sort()
+            p99 = percentile(values, 0.99) * 1000
+            failed = failed or p99 > target_p99_ms
+            click.echo(
+                f"{action:>4}: {len(values):6} calls, p50 {percentile(values, 0.5) * 1000:6.2f} ms, "
+                f"p95 {percentile(values, 0.95) * 1000:6.2f} ms, p99 {p99:6.2f} ms, max {values[-1] * 1000:6.2f} ms"
+            )
+        if failed:
+            raise click.ClickException(f"p99 above {target_p99_ms} ms")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Seeds a partitioned `transactions` table (50M rows by default) and compares
+EXPLAIN ANALYZE of date bounded wallet queries against an unpartitioned copy.
+
+Run it against a scratch database only, the copy doubles the data:
+
+    POSTGRES_DB=moon_bench python -m benchmarks.transaction_partitions --rows 50000000
+"""
+import asyncio
+import re
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, List, Tuple
+
+import click
+from sqlalchemy import event, text
+
+import src.support.models  # noqa: F401  (registers Ticket/Message for the User mapper)
+from src.database import engine
+from src.wallet.partitions import add_months, create_partitions
+from src.wallet.service import TransactionService
+
+from .wallet_indexes import StatementCapture, heaviest_user, seed
+
+FLAT_TABLE = 'transactions_flat'
+
+
+async def build_flat_copy():
+    async with engine.begin() as conn:
+        await conn.execute(text(f'DROP TABLE IF EXISTS {FLAT_TABLE}'))
+        await conn.execute(text(f'CREATE TABLE {FLAT_TABLE} (LIKE transactions INCLUDING DEFAULTS INCLUDING INDEXES)'))
+        await conn.execute(text(f'INSERT INTO {FLAT_TABLE} SELECT * FROM transactions'))
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+        await conn.execute(text('VACUUM ANALYZE transactions'))
+        await conn.execute(text(f'VACUUM ANALYZE {FLAT_TABLE}'))
+
+
+async def consume(stream):
+    async for _ in stream:
+        pass
+
+
+def service_calls(user_id: int, cursor: str) -> List[Tuple[str, Callable[[TransactionService], Awaitable]]]:
+    month_ago = datetime.now() - timedelta(days=30)
+    day_ago = datetime.now() - timedelta(days=1)
+    return [
+        ('get_transactions (last 30 days)', lambda s: s.get_transactions(1, 20, user_id, date_from=month_ago)),
+        ('get_transactions (cursor)', lambda s: s.get_transactions(1, 20, user_id, cursor=cursor)),
+        ('get_total_transactions_by_user (last 30 days)',
+         lambda s: s.get_total_transactions_by_user(user_id, date_from=month_ago)),
+        ('get_total_transactions_by_user (all time)', lambda s: s.get_total_transactions_by_user(user_id)),
+        ('stream_transactions (last day)', lambda s: consume(s.stream_transactions(date_from=day_ago))),
+        ('get_last_withdrawal_attempt', lambda s: s.get_last_withdrawal_attempt(user_id)),
+        ('aggregate_balances (no date bound)', lambda s: s.aggregate_balances(user_id)),
+    ]
+
+
+def execution_time(plan: str) -> str:
+    match = re.search(r'Execution Time: ([\d.]+ ms)', plan)
+    return match.group(1) if match else '?'
+
+
+async def explain(statement: str, parameters) -> str:
+    async with engine.connect() as conn:
+        result = await conn.exec_driver_sql('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters)
+        return '\n'.join(row[0] for row in result)
+
+
+async def explain_all(user_id: int, cursor: str) -> List[Tuple[str, str, str]]:
+    plans = []
+    for name, call in service_calls(user_id, cursor):
+        capture = StatementCapture()
+        event.listen(engine.sync_engine, 'before_cursor_execute', capture)
+        try:
+            async with TransactionService() as service:
+                await call(service)
+        finally:
+            event.remove(engine.sync_engine, 'before_cursor_execute', capture)
+
+        for statement, parameters in capture.statements:
+            flat_statement = re.sub(r'\btransactions\b', FLAT_TABLE, statement)
+            plans.append((
+                name,
+                await explain(flat_statement, parameters),
+                await explain(statement, parameters),
+            ))
+    return plans
+
+
+@click.command()
+@click.option("--users", default=100_000, type=int)
+@click.option("--rows", default=50_000_000, type=int)
+@click.option("--batch", default=1_000_000, type=int)
+@click.option("--skip-seed", is_flag=True, help="Reuse rows and the copy from an earlier run.")
+@click.option("--output", default="explain_transaction_partitions.md", type=click.Path(dir_okay=False))
+def main(users: int, rows: int, batch: int, skip_seed: bool, output: str) -> None:
+    """Writes EXPLAIN ANALYZE of wallet queries on unpartitioned vs partitioned transactions."""
+
+    async def run():
+        engine.echo = False
+        if not skip_seed:
+            current = date.today().replace(day=1)
+            # The seed spreads rows over the last two years
+            async with engine.begin() as conn:
+                await create_partitions(conn, add_months(current, -25), add_months(current, 4))
+            await seed(users, rows, batch)
+            await build_flat_copy()
+
+        user_id, cursor = await heaviest_user()
+        plans = await explain_all(user_id, cursor)
+        await engine.dispose()
+
+        with open(output, 'w', encoding='utf-8') as report:
+            report.write(f"# Transaction partition plans ({datetime.now().isoformat()}, user {user_id})\n\n")
+            report.write("| Query | Unpartitioned | Partitioned |\n|---|---|---|\n")
+            for name, flat, partitioned in plans:
+                report.write(f"| {name} | {execution_time(flat)} | {execution_time(partitioned)} |\n")
+            for name, flat, partitioned in plans:
+                report.write(f"\n## {name}\n\n### Unpartitioned\n```\n{flat}\n```\n")
+                report.write(f"\n### Partitioned\n```\n{partitioned}\n```\n")
+        click.echo(f"Plans written to {output}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
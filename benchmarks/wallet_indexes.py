@@ -0,0 +1,172 @@
+"""Seeds a large `transactions` table and records EXPLAIN ANALYZE of every
+wallet hot query with and without the indexes from migration 116be1919b64.
+
+Run it against a scratch database only, it inserts millions of rows:
+
+    POSTGRES_DB=moon_bench python -m benchmarks.wallet_indexes --rows 5000000
+"""
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, List, Tuple
+
+import click
+from sqlalchemy import event, text
+from sqlalchemy.schema import CreateIndex
+
+import src.support.models  # noqa: F401  (registers Ticket/Message for the User mapper)
+from src.database import engine
+from src.wallet.models import Transaction
+from src.wallet.service import TransactionService, encode_cursor
+
+SEED_USERS = """
+    INSERT INTO users (username, password, role, created_at, active)
+    SELECT 'bench_' || md5(random()::text), '', 'user', now(), true
+    FROM generate_series(1, :users)
+    RETURNING id
+"""
+
+SEED_TRANSACTIONS = """
+    INSERT INTO transactions (payment_system, type, amount, from_account, to_account, created_at, status, user_id)
+    SELECT
+        'card',
+        (ARRAY['IN', 'IN', 'OUT', 'BONUS', 'REFERRAL'])[1 + floor(random() * 5)]::transactiontype,
+        round((random() * 1000)::numeric, 2),
+        '',
+        '',
+        now() - random() * interval '730 days',
+        (ARRAY['CONFIRMED', 'CONFIRMED', 'CONFIRMED', 'PENDING', 'REJECTED'])[1 + floor(random() * 5)]
+            ::transactionstatus,
+        -- skewed towards low ids so a few "whales" get a long history
+        :first_user + floor(power(random(), 3) * :users)::int
+    FROM generate_series(1, :batch)
+"""
+
+INDEXES = [index for index in Transaction.__table__.indexes if index.name.startswith('ix_transactions_')]
+
+
+class StatementCapture:
+    """Records the SQL the service emits, so plans match the real queries."""
+
+    def __init__(self):
+        self.statements: List[Tuple[str, tuple]] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.statements.append((statement, parameters))
+
+
+async def seed(users: int, rows: int, batch: int):
+    async with engine.begin() as conn:
+        ids = (await conn.execute(text(SEED_USERS), {'users': users})).scalars().all()
+    first_user = min(ids)
+    for offset in range(0, rows, batch):
+        async with engine.begin() as conn:
+            await conn.execute(text(SEED_TRANSACTIONS), {
+                'first_user': first_user,
+                'users': users,
+                'batch': min(batch, rows - offset),
+            })
+        click.echo(f"seeded {min(offset + batch, rows)}/{rows} transactions")
+
+
+async def vacuum():
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+        await conn.execute(text('VACUUM ANALYZE transactions'))
+
+
+async def drop_indexes():
+    async with engine.begin() as conn:
+        for index in INDEXES:
+            await conn.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+    await vacuum()
+
+
+async def create_indexes():
+    async with engine.begin() as conn:
+        for index in INDEXES:
+            await conn.execute(CreateIndex(index, if_not_exists=True))
+    await vacuum()
+
+
+def service_calls(user_id: int, cursor: str) -> List[Tuple[str, Callable[[TransactionService], Awaitable]]]:
+    return [
+        ('get_transactions (page 1)', lambda s: s.get_transactions(1, 20, user_id)),
+        ('get_transactions (page 500, offset)', lambda s: s.get_transactions(500, 20, user_id)),
+        ('get_transactions (cursor)', lambda s: s.get_transactions(1, 20, user_id, cursor=cursor)),
+        ('get_transactions (types=0,1)', lambda s: s.get_transactions(1, 20, user_id, '0,1')),
+        ('get_total_transactions_by_user', lambda s: s.get_total_transactions_by_user(user_id)),
+        ('aggregate_balances', lambda s: s.aggregate_balances(user_id)),
+        ('get_latest_bonus_earn_transaction', lambda s: s.get_latest_bonus_earn_transaction(user_id)),
+        ('get_last_withdrawal_attempt', lambda s: s.get_last_withdrawal_attempt(user_id)),
+        ('get_pending_withdrawals', lambda s: s.get_pending_withdrawals()),
+    ]
+
+
+async def explain_all(user_id: int, cursor: str) -> List[Tuple[str, str]]:
+    plans = []
+    for name, call in service_calls(user_id, cursor):
+        capture = StatementCapture()
+        event.listen(engine.sync_engine, 'before_cursor_execute', capture)
+        try:
+            async with TransactionService() as service:
+                await call(service)
+        finally:
+            event.remove(engine.sync_engine, 'before_cursor_execute', capture)
+
+        async with engine.connect() as conn:
+            for statement, parameters in capture.statements:
+                result = await conn.exec_driver_sql(
+                    'EXPLAIN (ANALYZE, BUFFERS) ' + statement,
+                    parameters
+                )
+                plans.append((name, '\n'.join(row[0] for row in result)))
+    return plans
+
+
+async def heaviest_user() -> Tuple[int, str]:
+    async with engine.connect() as conn:
+        user_id = (await conn.execute(text(
+            'SELECT user_id FROM transactions GROUP BY user_id ORDER BY count(*) DESC LIMIT 1'
+        ))).scalar_one()
+    # A cursor half way through the user's history, as a deep page would have
+    async with TransactionService() as service:
+        total = await service.get_total_transactions_by_user(user_id)
+        middle = await service.get_transactions(max(total // 40, 1), 20, user_id)
+    return user_id, encode_cursor(middle[-1])
+
+
+@click.command()
+@click.option("--users", default=20_000, type=int)
+@click.option("--rows", default=2_000_000, type=int)
+@click.option("--batch", default=500_000, type=int)
+@click.option("--skip-seed", is_flag=True, help="Reuse rows seeded by an earlier run.")
+@click.option("--output", default="explain_wallet_indexes.md", type=click.Path(dir_okay=False))
+def main(users: int, rows: int, batch: int, skip_seed: bool, output: str) -> None:
+    """Seeds transactions and writes EXPLAIN ANALYZE before/after the wallet indexes."""
+
+    async def run():
+        engine.echo = False
+        if not skip_seed:
+            await seed(users, rows, batch)
+
+        await drop_indexes()
+        user_id, cursor = await heaviest_user()
+        before = await explain_all(user_id, cursor)
+
+        await create_indexes()
+        after = await explain_all(user_id, cursor)
+        await engine.dispose()
+
+        with open(output, 'w', encoding='utf-8') as report:
+            report.write(f"# Wallet index plans ({datetime.now().isoformat()}, user {user_id})\n")
+            for (name, plan_before), (_, plan_after) in zip(before, after):
+                report.write(f"\n## {name}\n\n### Before\n```\n{plan_before}\n```\n")
+                report.write(f"\n### After\n```\n{plan_after}\n```\n")
+        click.echo(f"Plans written to {output}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
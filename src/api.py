@@ -1,6 +1,10 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 
 from logging_config import setup_logging  # Импортируем настройку логирования
 
@@ -9,12 +13,29 @@ from src.users.route import router as user_router
 from src.wallet.route import router as wallet_router
 
 # providers
+import src.providers.pragmatic.callbacks  # noqa: F401  (registers Pragmatic's adapter and callback actions)
+from src.providers.adapters import providers
 from src.providers.pragmatic.route import router as pragmatic_provider_router
+from src.providers.route import router as provider_router
+from src.providers.sessions import game_sessions
+from src.settings import Settings
 
 # Настройка глобального логирования
 setup_logging()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for adapter in providers.values():
+        await adapter.client.start()
+    sweeper = asyncio.create_task(game_sessions.sweep_forever(Settings.GAME_SESSION_SWEEP_INTERVAL))
+    yield
+    sweeper.cancel()
+    for adapter in providers.values():
+        await adapter.client.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,11 +49,14 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"]
 )
+# Game lists and history pages; small responses are sent as is
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 app.include_router(user_router)
 app.include_router(wallet_router)
 app.include_router(support_router)
 app.include_router(chat_router)
+app.include_router(provider_router)
 app.include_router(pragmatic_provider_router)
 
 if __name__ == "__main__":
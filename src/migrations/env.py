@@ -10,7 +10,10 @@ from src.database import Base
 from src.settings import Settings
 from src.support.models import Message, Ticket
 from src.users.models import User
-from src.wallet.models import Transaction
+from src.providers.models import FreespinCampaign, Game, GameSession, ProviderTransaction
+from src.wallet.models import (BalanceCheckpoint, IdempotencyKey, PromoCode,
+                              PromoCodeRedemption, Transaction, WalletBalance,
+                              WalletDailyRollup)
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -43,6 +46,16 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 
+
+
+def include_name(name, type_, parent_names):
+    """Monthly partitions of `transactions` (attached or detached) are
+    managed by src.wallet.partitions, not by the models."""
+    if type_ == 'table':
+        return not (name.startswith('transactions_y') or name == 'transactions_default')
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -65,6 +78,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -74,7 +88,7 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(connection=connection, target_metadata=target_metadata, include_name=include_name)
 
     with context.begin_transaction():
         context.run_migrations()
@@ -0,0 +1,49 @@
+"""Promo codes and their redemptions
+
+Revision ID: 08e8b03f2c36
+Revises: 33cf5b58d0f0
+Create Date: 2026-10-17 16:05:44.913520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '08e8b03f2c36'
+down_revision: Union[str, None] = '33cf5b58d0f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('promo_codes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('code', sa.String(), nullable=False),
+    sa.Column('amount', sa.DECIMAL(), nullable=False),
+    sa.Column('max_redemptions', sa.Integer(), nullable=True),
+    sa.Column('redemptions_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('per_user_limit', sa.Integer(), nullable=False, server_default='1'),
+    sa.Column('active', sa.Boolean(), nullable=False, server_default=sa.true()),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_promo_codes_code'), 'promo_codes', ['code'], unique=True)
+    op.create_table('promo_code_redemptions',
+    sa.Column('promo_code_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('uses', sa.Integer(), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['promo_code_id'], ['promo_codes.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('promo_code_id', 'user_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('promo_code_redemptions')
+    op.drop_index(op.f('ix_promo_codes_code'), table_name='promo_codes')
+    op.drop_table('promo_codes')
@@ -0,0 +1,56 @@
+"""Indexes for wallet hot queries
+
+Revision ID: 116be1919b64
+Revises: fa7d0f6cb63c
+Create Date: 2026-10-17 11:40:52.730114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '116be1919b64'
+down_revision: Union[str, None] = 'fa7d0f6cb63c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps `transactions` writable while the indexes build
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_transactions_user_created',
+            'transactions',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_include=['type', 'status', 'amount'],
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+        op.create_index(
+            'ix_transactions_user_type_created',
+            'transactions',
+            ['user_id', 'type', sa.text('created_at DESC')],
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+        op.create_index(
+            'ix_transactions_pending_withdrawals',
+            'transactions',
+            ['created_at'],
+            postgresql_where=sa.text("type = 'OUT' AND status = 'PENDING'"),
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_transactions_pending_withdrawals', table_name='transactions',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_transactions_user_type_created', table_name='transactions',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_transactions_user_created', table_name='transactions',
+                      postgresql_concurrently=True, if_exists=True)
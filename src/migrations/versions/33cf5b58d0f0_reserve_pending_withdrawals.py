@@ -0,0 +1,37 @@
+"""Reserve pending withdrawals in wallet_balances
+
+Revision ID: 33cf5b58d0f0
+Revises: f9aa9be387b8
+Create Date: 2026-10-17 14:48:36.021877
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '33cf5b58d0f0'
+down_revision: Union[str, None] = 'f9aa9be387b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('wallet_balances', sa.Column('reserved', sa.DECIMAL(), nullable=False, server_default='0'))
+    op.execute("""
+        UPDATE wallet_balances w
+        SET reserved = pending.amount
+        FROM (
+            SELECT user_id, SUM(amount) AS amount
+            FROM transactions
+            WHERE type = 'OUT' AND status = 'PENDING'
+            GROUP BY user_id
+        ) pending
+        WHERE pending.user_id = w.user_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('wallet_balances', 'reserved')
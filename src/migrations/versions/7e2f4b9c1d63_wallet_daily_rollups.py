@@ -0,0 +1,46 @@
+"""Daily wallet rollups
+
+Revision ID: 7e2f4b9c1d63
+Revises: c3d7a9e1f024
+Create Date: 2026-10-17 21:04:37.556120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e2f4b9c1d63'
+down_revision: Union[str, None] = 'c3d7a9e1f024'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('wallet_daily_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('type', postgresql.ENUM(name='transactiontype', create_type=False), nullable=False),
+    sa.Column('status', postgresql.ENUM(name='transactionstatus', create_type=False), nullable=False),
+    sa.Column('amount', sa.DECIMAL(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'type', 'status')
+    )
+    # Writers lock `transactions` out while the history is summed, so no
+    # transaction is missed or counted twice
+    op.execute('LOCK TABLE transactions IN SHARE MODE')
+    op.execute("""
+        INSERT INTO wallet_daily_rollups (user_id, day, type, status, amount, count)
+        SELECT user_id, created_at::date, type, status, sum(amount), count(*)
+        FROM transactions
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id, created_at::date, type, status
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('wallet_daily_rollups')
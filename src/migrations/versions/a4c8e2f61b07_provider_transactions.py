@@ -0,0 +1,48 @@
+"""Provider transactions and game transaction types
+
+Revision ID: a4c8e2f61b07
+Revises: 7e2f4b9c1d63
+Create Date: 2026-10-17 22:31:48.208114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c8e2f61b07'
+down_revision: Union[str, None] = '7e2f4b9c1d63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ADD VALUE can't be used by the transaction that added it, commit it apart
+    with op.get_context().autocommit_block():
+        for value in ('BET', 'WIN', 'REFUND'):
+            op.execute(f"ALTER TYPE transactiontype ADD VALUE IF NOT EXISTS '{value}'")
+
+    op.create_table('provider_transactions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('provider', sa.String(), nullable=False),
+    sa.Column('provider_transaction_id', sa.String(), nullable=False),
+    sa.Column('action', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('game_uuid', sa.String(), nullable=True),
+    sa.Column('amount', sa.DECIMAL(), nullable=False),
+    sa.Column('reference_id', sa.String(), nullable=True),
+    sa.Column('transaction_id', sa.Integer(), nullable=True),
+    sa.Column('reversed_by', sa.String(), nullable=True),
+    sa.Column('balance', sa.DECIMAL(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('provider', 'provider_transaction_id', name='uq_provider_transactions_provider_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('provider_transactions')
+    # Postgres can't drop enum values; BET/WIN/REFUND stay in transactiontype
@@ -0,0 +1,51 @@
+"""Freespin campaigns
+
+Revision ID: b6d1f0e3a925
+Revises: e27c9d40b8a1
+Create Date: 2026-10-18 01:12:37.904215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d1f0e3a925'
+down_revision: Union[str, None] = 'e27c9d40b8a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('freespin_campaigns',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('provider', sa.String(), nullable=False),
+    sa.Column('campaign', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('freespin_id', sa.String(), nullable=False),
+    sa.Column('game_uuid', sa.String(), nullable=False),
+    sa.Column('currency', sa.String(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('valid_from', sa.Integer(), nullable=False),
+    sa.Column('valid_until', sa.Integer(), nullable=False),
+    sa.Column('bet_id', sa.Integer(), nullable=True),
+    sa.Column('total_bet_id', sa.Integer(), nullable=True),
+    sa.Column('denomination', sa.DECIMAL(), nullable=True),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('issued_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('provider', 'campaign', 'user_id', name='uq_freespin_campaigns_player')
+    )
+    op.create_index('ix_freespin_campaigns_progress', 'freespin_campaigns',
+                    ['provider', 'campaign', 'status', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_freespin_campaigns_progress', table_name='freespin_campaigns')
+    op.drop_table('freespin_campaigns')
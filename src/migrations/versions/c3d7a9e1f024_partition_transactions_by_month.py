@@ -0,0 +1,134 @@
+"""Partition transactions by month of created_at
+
+Revision ID: c3d7a9e1f024
+Revises: 5b1e0c7d9a42
+Create Date: 2026-10-17 19:30:11.208544
+
+Rewrites `transactions` as a RANGE partitioned table with one partition per
+month from the oldest row to three months ahead, plus a DEFAULT partition.
+Writes are blocked while the rows are copied; run it in a maintenance window.
+Later months are created by `python -m src.wallet.partitions`.
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d7a9e1f024'
+down_revision: Union[str, None] = '5b1e0c7d9a42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = 'id, payment_system, type, amount, from_account, to_account, created_at, status, user_id'
+
+MONTHS_AHEAD = 3
+
+
+def add_months(month: date, months: int) -> date:
+    month_index = month.year * 12 + month.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def create_indexes() -> None:
+    op.create_index(
+        'ix_transactions_user_created',
+        'transactions',
+        ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+        postgresql_include=['type', 'status', 'amount']
+    )
+    op.create_index(
+        'ix_transactions_user_id_id',
+        'transactions',
+        ['user_id', 'id'],
+        postgresql_include=['type', 'status', 'amount']
+    )
+    op.create_index(
+        'ix_transactions_user_type_created',
+        'transactions',
+        ['user_id', 'type', sa.text('created_at DESC')]
+    )
+    op.create_index(
+        'ix_transactions_pending_withdrawals',
+        'transactions',
+        ['created_at'],
+        postgresql_where=sa.text("type = 'OUT' AND status = 'PENDING'")
+    )
+
+
+def upgrade() -> None:
+    op.execute('LOCK TABLE transactions IN EXCLUSIVE MODE')
+    op.execute('ALTER TABLE transactions RENAME TO transactions_unpartitioned')
+    # The sequence would be dropped together with the old table
+    op.execute('ALTER SEQUENCE transactions_id_seq OWNED BY NONE')
+    op.execute("""
+        CREATE TABLE transactions (
+            id integer NOT NULL DEFAULT nextval('transactions_id_seq'),
+            payment_system paymentsystem NOT NULL,
+            type transactiontype NOT NULL,
+            amount numeric NOT NULL,
+            from_account varchar,
+            to_account varchar,
+            created_at timestamp without time zone NOT NULL,
+            status transactionstatus NOT NULL,
+            user_id integer REFERENCES users (id)
+        ) PARTITION BY RANGE (created_at)
+    """)
+
+    oldest = op.get_bind().execute(sa.text(
+        'SELECT date_trunc(\'month\', min(created_at))::date FROM transactions_unpartitioned'
+    )).scalar()
+    current = date.today().replace(day=1)
+    month = min(oldest or current, current)
+    while month < add_months(current, MONTHS_AHEAD + 1):
+        next_month = add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE transactions_y{month:%Y}m{month:%m} PARTITION OF transactions "
+            f"FOR VALUES FROM ('{month}') TO ('{next_month}')"
+        )
+        month = next_month
+    op.execute('CREATE TABLE transactions_default PARTITION OF transactions DEFAULT')
+
+    op.execute(f"""
+        INSERT INTO transactions ({COLUMNS})
+        SELECT id, payment_system, type, amount, from_account, to_account,
+               coalesce(created_at, now()), status, user_id
+        FROM transactions_unpartitioned
+    """)
+    op.execute('DROP TABLE transactions_unpartitioned')
+    op.execute('ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id')
+
+    # A unique constraint of a partitioned table must include the partition key
+    op.create_primary_key('transactions_pkey', 'transactions', ['id', 'created_at'])
+    create_indexes()
+    op.execute('ANALYZE transactions')
+
+
+def downgrade() -> None:
+    op.execute('LOCK TABLE transactions IN EXCLUSIVE MODE')
+    op.execute('ALTER TABLE transactions RENAME TO transactions_partitioned')
+    op.execute('ALTER SEQUENCE transactions_id_seq OWNED BY NONE')
+    op.execute("""
+        CREATE TABLE transactions (
+            id integer NOT NULL DEFAULT nextval('transactions_id_seq'),
+            payment_system paymentsystem NOT NULL,
+            type transactiontype NOT NULL,
+            amount numeric NOT NULL,
+            from_account varchar,
+            to_account varchar,
+            created_at timestamp without time zone,
+            user_id integer REFERENCES users (id),
+            status transactionstatus NOT NULL
+        )
+    """)
+    op.execute(f'INSERT INTO transactions ({COLUMNS}) SELECT {COLUMNS} FROM transactions_partitioned')
+    # Drops the partitions as well, detached ones are left alone
+    op.execute('DROP TABLE transactions_partitioned')
+    op.execute('ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id')
+
+    op.create_primary_key('transactions_pkey', 'transactions', ['id'])
+    op.create_unique_constraint('transactions_id_key', 'transactions', ['id'])
+    create_indexes()
+    op.execute('ANALYZE transactions')
@@ -0,0 +1,33 @@
+"""Games aggregator
+
+Revision ID: c83a5e7d2f14
+Revises: b6d1f0e3a925
+Create Date: 2026-10-18 02:41:09.552106
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c83a5e7d2f14'
+down_revision: Union[str, None] = 'b6d1f0e3a925'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Every game synced so far came from Pragmatic
+    op.add_column('games', sa.Column('aggregator', sa.String(), nullable=False, server_default='pragmatic'))
+    op.alter_column('games', 'aggregator', server_default=None)
+    op.drop_constraint('games_pkey', 'games', type_='primary')
+    op.create_primary_key('games_pkey', 'games', ['aggregator', 'uuid'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('games_pkey', 'games', type_='primary')
+    op.execute("DELETE FROM games WHERE aggregator <> 'pragmatic'")
+    op.create_primary_key('games_pkey', 'games', ['uuid'])
+    op.drop_column('games', 'aggregator')
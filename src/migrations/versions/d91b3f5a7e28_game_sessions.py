@@ -0,0 +1,38 @@
+"""Game sessions
+
+Revision ID: d91b3f5a7e28
+Revises: a4c8e2f61b07
+Create Date: 2026-10-17 23:12:05.731942
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd91b3f5a7e28'
+down_revision: Union[str, None] = 'a4c8e2f61b07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('game_sessions',
+    sa.Column('provider', sa.String(), nullable=False),
+    sa.Column('session_id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('game_uuid', sa.String(), nullable=False),
+    sa.Column('currency', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('provider', 'session_id')
+    )
+    op.create_index(op.f('ix_game_sessions_expires_at'), 'game_sessions', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_game_sessions_expires_at'), table_name='game_sessions')
+    op.drop_table('game_sessions')
@@ -0,0 +1,41 @@
+"""Games catalog
+
+Revision ID: e27c9d40b8a1
+Revises: d91b3f5a7e28
+Create Date: 2026-10-18 00:04:51.318627
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e27c9d40b8a1'
+down_revision: Union[str, None] = 'd91b3f5a7e28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('games',
+    sa.Column('uuid', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('image', sa.String(), nullable=True),
+    sa.Column('type', sa.String(), nullable=True),
+    sa.Column('provider', sa.String(), nullable=True),
+    sa.Column('technology', sa.String(), nullable=True),
+    sa.Column('has_lobby', sa.Boolean(), nullable=False),
+    sa.Column('is_mobile', sa.Boolean(), nullable=False),
+    sa.Column('has_freespins', sa.Boolean(), nullable=False),
+    sa.Column('tags', postgresql.ARRAY(sa.String()), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.Column('synced_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('uuid')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('games')
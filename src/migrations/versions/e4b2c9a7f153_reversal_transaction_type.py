@@ -0,0 +1,28 @@
+"""Reversal transaction type
+
+Revision ID: e4b2c9a7f153
+Revises: c83a5e7d2f14
+Create Date: 2026-10-18 04:12:37.301845
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b2c9a7f153'
+down_revision: Union[str, None] = 'c83a5e7d2f14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ADD VALUE can't be used by the transaction that added it, commit it apart
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE transactiontype ADD VALUE IF NOT EXISTS 'REVERSAL'")
+
+
+def downgrade() -> None:
+    # Postgres can't drop enum values; REVERSAL stays in transactiontype
+    pass
@@ -0,0 +1,38 @@
+"""Daily bonus claim state in wallet_balances
+
+Revision ID: e606e12323f5
+Revises: 08e8b03f2c36
+Create Date: 2026-10-17 17:21:30.664087
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e606e12323f5'
+down_revision: Union[str, None] = '08e8b03f2c36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('wallet_balances', sa.Column('last_bonus_claim_at', sa.DateTime(), nullable=True))
+    # Eligibility used to be derived from the latest BONUS row, keep it that way for existing users
+    op.execute("""
+        UPDATE wallet_balances w
+        SET last_bonus_claim_at = bonus.created_at
+        FROM (
+            SELECT user_id, MAX(created_at) AS created_at
+            FROM transactions
+            WHERE type = 'BONUS'
+            GROUP BY user_id
+        ) bonus
+        WHERE bonus.user_id = w.user_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('wallet_balances', 'last_bonus_claim_at')
@@ -0,0 +1,30 @@
+"""Freespin campaign claim leases
+
+Revision ID: f2a6d8c4b317
+Revises: e4b2c9a7f153
+Create Date: 2026-10-18 05:03:44.918236
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a6d8c4b317'
+down_revision: Union[str, None] = 'e4b2c9a7f153'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('freespin_campaigns', sa.Column('run_id', sa.String(), nullable=True))
+    op.add_column('freespin_campaigns', sa.Column('claimed_until', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    # Rows a run was sending go back to the queue
+    op.execute("UPDATE freespin_campaigns SET status = 'pending' WHERE status = 'sending'")
+    op.drop_column('freespin_campaigns', 'claimed_until')
+    op.drop_column('freespin_campaigns', 'run_id')
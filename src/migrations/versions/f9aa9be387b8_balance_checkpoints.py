@@ -0,0 +1,47 @@
+"""Balance checkpoints
+
+Revision ID: f9aa9be387b8
+Revises: 116be1919b64
+Create Date: 2026-10-17 13:15:07.562981
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f9aa9be387b8'
+down_revision: Union[str, None] = '116be1919b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('balance_checkpoints',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('last_transaction_id', sa.Integer(), nullable=False),
+    sa.Column('balance', sa.DECIMAL(), nullable=False),
+    sa.Column('bonus', sa.DECIMAL(), nullable=False),
+    sa.Column('pure', sa.DECIMAL(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_transactions_user_id_id',
+            'transactions',
+            ['user_id', 'id'],
+            postgresql_include=['type', 'status', 'amount'],
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_transactions_user_id_id', table_name='transactions',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_table('balance_checkpoints')
@@ -0,0 +1,50 @@
+"""Materialized wallet_balances ledger
+
+Revision ID: fa7d0f6cb63c
+Revises: 4de7645b1297
+Create Date: 2026-10-17 10:02:11.418254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fa7d0f6cb63c'
+down_revision: Union[str, None] = '4de7645b1297'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('wallet_balances',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('balance', sa.DECIMAL(), nullable=False),
+    sa.Column('bonus', sa.DECIMAL(), nullable=False),
+    sa.Column('pure', sa.DECIMAL(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # Backfill from the existing history, same as `python -m src.wallet.rebuild_balances`
+    op.execute("""
+        INSERT INTO wallet_balances (user_id, balance, bonus, pure, updated_at)
+        SELECT
+            user_id,
+            COALESCE(SUM(amount) FILTER (WHERE type IN ('IN', 'BONUS', 'REFERRAL') AND status = 'CONFIRMED'), 0)
+                - COALESCE(SUM(amount) FILTER (WHERE type = 'OUT' AND status = 'CONFIRMED'), 0),
+            COALESCE(SUM(amount) FILTER (WHERE type = 'BONUS' AND status = 'CONFIRMED'), 0),
+            COALESCE(SUM(amount) FILTER (WHERE type = 'IN' AND status = 'CONFIRMED'), 0)
+                - COALESCE(SUM(amount) FILTER (WHERE type = 'OUT' AND status = 'CONFIRMED'), 0),
+            now()
+        FROM transactions
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('wallet_balances')
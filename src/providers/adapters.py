@@ -0,0 +1,83 @@
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, NamedTuple, Optional, Type
+
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+from .client import ProviderClient
+
+
+class CallbackAction(NamedTuple):
+    # Validates the callback's parameters; None hands the handler the raw dict
+    schema: Optional[Type[BaseModel]]
+    handler: Callable[[Any], Awaitable[Any]]
+
+
+class ProviderAdapter(ABC):
+    """What a game aggregator plugs into `src.providers`: request signing and
+    callback verification, transport over its own `ProviderClient`, the
+    callbacks it sends us and its games catalog.
+
+    Callback actions are registered in a dict with `@adapter.action(...)`,
+    so dispatching one is a single lookup however many there are. An
+    adapter missing one of the abstract methods fails when it is created.
+    """
+
+    def __init__(self, name: str, client: ProviderClient):
+        self.name = name
+        self.client = client
+        self.actions: Dict[str, CallbackAction] = {}
+        self.dispatched = Counter()
+
+    @abstractmethod
+    def sign_request(self, params: dict) -> dict:
+        """Headers authenticating a request with `params` to the provider."""
+
+    @abstractmethod
+    def verify_callback(self, params: dict, headers: Mapping[str, str]) -> bool:
+        ...
+
+    @abstractmethod
+    async def request(self, method: str, endpoint: str, params: dict = None, data: dict = None) -> Any:
+        """Calls the provider API through `client`, raising `HTTPException` on errors."""
+
+    @abstractmethod
+    async def fetch_games(self) -> List[dict]:
+        """The provider's whole games catalog as `games` rows, see `GameService.sync_games`."""
+
+    def action(self, name: str, schema: Optional[Type[BaseModel]] = None):
+        def register(handler: Callable[[Any], Awaitable[Any]]):
+            self.actions[name] = CallbackAction(schema, handler)
+            return handler
+        return register
+
+    async def dispatch(self, action: str, params: dict) -> Any:
+        entry = self.actions.get(action)
+        if entry is None:
+            raise HTTPException(status_code=400, detail="Invalid action")
+        self.dispatched[action] += 1
+        if entry.schema is None:
+            return await entry.handler(params)
+        try:
+            payload = entry.schema.model_validate(params)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        return await entry.handler(payload)
+
+    def stats(self) -> dict:
+        return {
+            'pool': self.client.stats(),
+            'resilience': self.client.guard.stats(),
+            'callbacks': dict(self.dispatched),
+        }
+
+
+# Adapters by name, the `{provider}` of `/providers/{provider}/callback`
+providers: Dict[str, ProviderAdapter] = {}
+
+
+def register_provider(adapter: ProviderAdapter) -> ProviderAdapter:
+    providers[adapter.name] = adapter
+    return adapter
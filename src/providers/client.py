@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, NamedTuple, Optional, TypeVar
+
+import aiohttp
+import backoff
+from fastapi import HTTPException
+
+from .resilience import Bulkhead, CircuitBreaker, ProviderGuard, ProviderUnavailable, is_retryable
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class ClientProfile(NamedTuple):
+    """Connection pool, timeouts (seconds) and limits of one provider's client."""
+    pool_limit: int = 100
+    pool_limit_per_host: int = 50
+    keepalive_timeout: float = 30
+    dns_cache_ttl: int = 300
+    connect_timeout: float = 3
+    read_timeout: float = 10
+    total_timeout: float = 15
+    # Calls in flight and seconds a call may wait for a slot
+    max_concurrency: int = 50
+    bulkhead_wait: float = 1
+    # Consecutive failures that open the circuit, seconds before a probe
+    breaker_failures: int = 5
+    breaker_reset_timeout: float = 30
+    # Deadline of a call over all its retries
+    deadline: float = 20
+    max_tries: int = 3
+
+
+class PoolStats:
+    """Counters fed by aiohttp tracing, to see whether the pool is saturated."""
+
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.errors = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        # Requests that waited for a free connection, and for how long in total
+        self.queued = 0
+        self.queued_seconds = 0.0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._request_start)
+        trace.on_request_end.append(self._request_end)
+        trace.on_request_exception.append(self._request_exception)
+        trace.on_connection_queued_start.append(self._queued_start)
+        trace.on_connection_queued_end.append(self._queued_end)
+        trace.on_connection_create_end.append(self._connection_created)
+        trace.on_connection_reuseconn.append(self._connection_reused)
+        return trace
+
+    async def _request_start(self, session, context, params):
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    async def _request_end(self, session, context, params):
+        self.in_flight -= 1
+
+    async def _request_exception(self, session, context, params):
+        self.in_flight -= 1
+        self.errors += 1
+
+    async def _queued_start(self, session, context, params):
+        context.queued_at = time.monotonic()
+
+    async def _queued_end(self, session, context, params):
+        self.queued += 1
+        self.queued_seconds += time.monotonic() - context.queued_at
+
+    async def _connection_created(self, session, context, params):
+        self.connections_created += 1
+
+    async def _connection_reused(self, session, context, params):
+        self.connections_reused += 1
+
+
+class ProviderClient:
+    """One keep-alive `aiohttp.ClientSession` per worker and provider, with
+    the provider's own pool, timeouts, circuit breaker and bulkhead, so a
+    slow provider only uses up its own connections and slots.
+
+    Started and closed by the application lifespan; scripts that never run
+    the lifespan get a session on first use.
+    """
+
+    def __init__(self, name: str, profile: ClientProfile):
+        self.name = name
+        self.profile = profile
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+        self.pool_stats = PoolStats()
+        self.guard = ProviderGuard(
+            name,
+            CircuitBreaker(name, profile.breaker_failures, profile.breaker_reset_timeout),
+            Bulkhead(name, profile.max_concurrency, profile.bulkhead_wait),
+            profile.deadline
+        )
+
+    async def start(self):
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                self._session = self._create_session()
+
+    async def close(self):
+        async with self._lock:
+            if self._session is not None:
+                await self._session.close()
+                self._session = None
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def call(self, method: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        """Runs a request through the circuit breaker and bulkhead, retrying
+        what `is_retryable` allows within the profile's deadline."""
+
+        @backoff.on_exception(backoff.expo, Exception, max_tries=self.profile.max_tries,
+                              giveup=lambda e: not is_retryable(e, method))
+        async def retried():
+            return await self.guard.attempt(attempt)
+
+        try:
+            return await self.guard.run(retried)
+        except ProviderUnavailable as e:
+            headers = {"Retry-After": str(math.ceil(e.retry_after))} if e.retry_after else None
+            raise HTTPException(status_code=503, detail="Provider unavailable", headers=headers)
+        except TimeoutError:
+            raise HTTPException(status_code=504, detail="Provider timed out")
+        except aiohttp.ClientError:
+            raise HTTPException(status_code=502, detail="Provider request failed")
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        profile = self.profile
+        connector = aiohttp.TCPConnector(
+            limit=profile.pool_limit,
+            limit_per_host=profile.pool_limit_per_host,
+            keepalive_timeout=profile.keepalive_timeout,
+            ttl_dns_cache=profile.dns_cache_ttl,
+            enable_cleanup_closed=True,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=profile.total_timeout,
+            connect=profile.connect_timeout,
+            sock_read=profile.read_timeout,
+        )
+        logger.info(f"Opening {self.name} connection pool: limit {connector.limit}, "
+                    f"per host {connector.limit_per_host}")
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[self.pool_stats.trace_config()],
+        )
+
+    def stats(self) -> dict:
+        stats = self.pool_stats
+        profile = self.profile
+        # All requests go to one host, its limit is the effective pool size
+        capacity = profile.pool_limit_per_host or profile.pool_limit
+        return {
+            'open': self._session is not None and not self._session.closed,
+            'limit': profile.pool_limit,
+            'limit_per_host': profile.pool_limit_per_host,
+            'requests': stats.requests,
+            'in_flight': stats.in_flight,
+            'max_in_flight': stats.max_in_flight,
+            'errors': stats.errors,
+            'connections_created': stats.connections_created,
+            'connections_reused': stats.connections_reused,
+            'queued': stats.queued,
+            'queued_seconds': stats.queued_seconds,
+            'saturation': stats.in_flight / capacity if capacity else 0.0,
+        }
@@ -3,6 +3,7 @@ from typing import Annotated
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
 
+from src.providers.models import UserRole
 from src.providers.schemas import ReadProfile
 from src.providers.service import UserService
 from src.users.security import decode_token
@@ -34,3 +35,11 @@ async def get_current_active_user(
     if not current_user.active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+
+async def get_current_admin_user(
+        current_user: Annotated[ReadProfile, Depends(get_current_active_user)],
+):
+    if current_user.role not in (UserRole.admin, UserRole.superuser):
+        raise HTTPException(status_code=403, detail="Not enough rights")
+    return current_user
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from src.providers.pragmatic.utils import make_request
+from src.providers.resilience import RateLimiter, is_transient
+from src.providers.service import FREESPIN_PARAMS, FreespinCampaignService
+from src.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+PROVIDER = "pragmatic"
+
+# Times a worker waits out an unavailable provider before leaving the row for the next run
+UNAVAILABLE_RETRIES = 3
+
+
+class CampaignRun:
+    """Issues the pending freespins of one campaign to Pragmatic.
+
+    A producer claims pending rows in id order and queues them; `workers`
+    tasks send them, together no faster than `rate` per second. Results are
+    written back in batches. Rows the provider rejects are `failed`; rows
+    that hit a timeout or outage go back to `pending` for the next run, which
+    first asks the provider whether an earlier attempt got through.
+
+    Claimed rows are `sending` under a lease of `lease` seconds, so runs of
+    other workers or of the CLI skip them. A row is only sent while enough of
+    its lease is left for the call to finish, and batches are sized to be
+    sent well within it.
+    """
+
+    def __init__(self, campaign: str, workers: int, rate: float, batch: int = 500,
+                 lease: float = Settings.PRAGMATIC_FREESPIN_LEASE):
+        self.campaign = campaign
+        self.workers = workers
+        self.batch = batch
+        self.lease = lease
+        self.run_id = uuid.uuid4().hex
+        # A row may take a freespins/get and a freespins/set, each up to the deadline
+        self.margin = timedelta(seconds=2 * Settings.PRAGMATIC_DEADLINE)
+        self.claim_size = max(workers, min(batch, int(rate * (lease - self.margin.total_seconds()) / 2)))
+        self.limiter = RateLimiter(rate, burst=workers)
+        self.issued = 0
+        self.failed = 0
+        self.deferred = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._results: List[dict] = []
+
+    async def run(self) -> dict:
+        self.started_at = time.monotonic()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [asyncio.create_task(self._work(queue)) for _ in range(self.workers)]
+        reporter = asyncio.create_task(self._report())
+        try:
+            after_id = 0
+            while True:
+                async with FreespinCampaignService(PROVIDER) as service:
+                    rows = await service.claim_pending(
+                        self.campaign, self.run_id, after_id, self.claim_size, self.lease
+                    )
+                if not rows:
+                    break
+                after_id = rows[-1].id
+                for row in rows:
+                    await queue.put(row)
+                await self._flush()
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in (*workers, reporter):
+                task.cancel()
+            await self._flush()
+            self.finished_at = time.monotonic()
+        logger.info(f"Freespin campaign {self.campaign} finished: {self.stats()}")
+        return self.stats()
+
+    async def _work(self, queue: asyncio.Queue):
+        while (row := await queue.get()) is not None:
+            try:
+                status, error = await self._issue(row)
+            except Exception as e:
+                logger.exception(f"Issuing freespins {row.freespin_id} failed")
+                status, error = 'pending', str(e)
+            if status == 'issued':
+                self.issued += 1
+            elif status == 'failed':
+                self.failed += 1
+            else:
+                self.deferred += 1
+            self._results.append({
+                'id': row.id,
+                'status': status,
+                'error': error,
+                'issued_at': datetime.now() if status == 'issued' else None,
+            })
+            if len(self._results) >= self.batch:
+                await self._flush()
+
+    async def _issue(self, row) -> Tuple[str, Optional[str]]:
+        error = None
+        for _ in range(UNAVAILABLE_RETRIES):
+            await self.limiter.acquire()
+            if datetime.now() + self.margin >= row.claimed_until:
+                # Another run may take the row over before the call ends
+                return 'pending', error or 'Claim expired before sending'
+            try:
+                if row.attempts > 1 and await self._exists(row.freespin_id):
+                    return 'issued', None
+                await make_request("POST", "freespins/set", data=freespin_data(row))
+                return 'issued', None
+            except HTTPException as e:
+                if not is_transient(e):
+                    return 'failed', str(e.detail)
+                error = str(e.detail)
+                retry_after = (e.headers or {}).get("Retry-After")
+                if e.status_code != 503 or retry_after is None:
+                    return 'pending', error
+                # Circuit open or bulkhead full, no request went out
+                await asyncio.sleep(float(retry_after))
+        return 'pending', error
+
+    async def _exists(self, freespin_id: str) -> bool:
+        try:
+            await make_request("GET", "freespins/get", {"freespin_id": freespin_id})
+        except HTTPException as e:
+            if e.status_code == 404:
+                return False
+            raise
+        return True
+
+    async def _flush(self):
+        results, self._results = self._results, []
+        if results:
+            async with FreespinCampaignService(PROVIDER) as service:
+                await service.save_results(self.run_id, results)
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(10)
+            logger.info(f"Freespin campaign {self.campaign}: {self.stats()}")
+
+    def stats(self) -> dict:
+        elapsed = ((self.finished_at or time.monotonic()) - self.started_at) if self.started_at else 0.0
+        done = self.issued + self.failed + self.deferred
+        return {
+            'issued': self.issued,
+            'failed': self.failed,
+            'deferred': self.deferred,
+            'elapsed_seconds': round(elapsed, 3),
+            'per_second': round(done / elapsed, 2) if elapsed else 0.0,
+            'rate_limited_seconds': round(self.limiter.waited_seconds, 3),
+        }
+
+
+def freespin_data(row) -> dict:
+    data = {name: getattr(row, name) for name in FREESPIN_PARAMS}
+    if data['denomination'] is not None:
+        data['denomination'] = str(data['denomination'])
+    # Form data can't carry None
+    data = {name: value for name, value in data.items() if value is not None}
+    return {
+        "player_id": str(row.user_id),
+        "player_name": row.username or str(row.user_id),
+        "freespin_id": row.freespin_id,
+        **data,
+    }
+
+
+# Runs started by this worker's API, by campaign
+campaign_runs: Dict[str, Tuple[CampaignRun, asyncio.Task]] = {}
+
+
+def start_campaign_run(campaign: str, workers: int, rate: float) -> CampaignRun:
+    """Runs the campaign in the background unless this worker already does."""
+    current = campaign_runs.get(campaign)
+    if current is not None and not current[1].done():
+        return current[0]
+    run = CampaignRun(campaign, workers, rate)
+    task = asyncio.create_task(run.run())
+    task.add_done_callback(_log_failure)
+    campaign_runs[campaign] = (run, task)
+    return run
+
+
+def _log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Freespin campaign run failed", exc_info=task.exception())
+
@@ -0,0 +1,125 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.settings import Settings
+
+from .schemas import ReadGame
+
+
+def _key(value: str) -> str:
+    return value.strip().casefold()
+
+
+class GameIndex:
+    """Immutable in-memory index of the active games.
+
+    Filters are sets of positions in the name-sorted list, intersected
+    smallest first. Name search returns names starting with the query, then
+    names with a word starting with it (bisect over the sorted words), then
+    names merely containing it.
+    """
+
+    def __init__(self, games: Iterable[ReadGame] = ()):
+        games = sorted(games, key=lambda game: (_key(game.name), game.uuid))
+        self.games = [game.model_dump(mode='json') for game in games]
+        # Changes whenever the listed games do, the same in every worker
+        self.version = hashlib.sha1(json.dumps(self.games, sort_keys=True).encode()).hexdigest()[:16]
+        self._names = [_key(game.name) for game in games]
+        self._words: List[Tuple[str, int]] = sorted(
+            (word, position)
+            for position, name in enumerate(self._names)
+            for word in set(name.split())
+        )
+        self.by_provider: Dict[str, Set[int]] = {}
+        self.by_type: Dict[str, Set[int]] = {}
+        self.by_tag: Dict[str, Set[int]] = {}
+        for position, game in enumerate(games):
+            if game.provider:
+                self.by_provider.setdefault(_key(game.provider), set()).add(position)
+            if game.type:
+                self.by_type.setdefault(_key(game.type), set()).add(position)
+            for tag in game.tags:
+                self.by_tag.setdefault(_key(tag), set()).add(position)
+
+    def search(
+        self,
+        q: Optional[str] = None,
+        provider: Optional[str] = None,
+        type: Optional[str] = None,
+        tag: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 50
+    ) -> Tuple[int, List[dict]]:
+        filters = [
+            index.get(_key(value), set())
+            for index, value in ((self.by_provider, provider), (self.by_type, type), (self.by_tag, tag))
+            if value
+        ]
+        allowed = None
+        if filters:
+            filters.sort(key=len)
+            allowed = filters[0].intersection(*filters[1:])
+
+        if q and _key(q):
+            positions = [position for position in self._match(_key(q)) if allowed is None or position in allowed]
+        elif allowed is not None:
+            positions = sorted(allowed)
+        else:
+            positions = range(len(self.games))
+
+        return len(positions), [self.games[position] for position in positions[offset:offset + limit]]
+
+    def _match(self, query: str) -> List[int]:
+        prefix, words, contains = [], [], []
+        seen = set()
+
+        start = bisect.bisect_left(self._names, query)
+        for position in range(start, len(self._names)):
+            if not self._names[position].startswith(query):
+                break
+            prefix.append(position)
+            seen.add(position)
+
+        start = bisect.bisect_left(self._words, (query, -1))
+        for word, position in self._words[start:]:
+            if not word.startswith(query):
+                break
+            if position not in seen:
+                words.append(position)
+                seen.add(position)
+        words.sort()
+
+        for position, name in enumerate(self._names):
+            if position not in seen and query in name:
+                contains.append(position)
+        return prefix + words + contains
+
+
+class GameIndexCache:
+    """Per-process `GameIndex`, rebuilt from `games` every `ttl` seconds so
+    each worker picks up what the sync job wrote.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.index = GameIndex()
+        self._loaded_at = float('-inf')
+        self._lock = asyncio.Lock()
+
+    async def get(self, load: Callable[[], Awaitable[List[ReadGame]]]) -> GameIndex:
+        if time.monotonic() - self._loaded_at > self.ttl:
+            async with self._lock:
+                if time.monotonic() - self._loaded_at > self.ttl:
+                    self.index = GameIndex(await load())
+                    self._loaded_at = time.monotonic()
+        return self.index
+
+    def invalidate(self):
+        self._loaded_at = float('-inf')
+
+
+game_index = GameIndexCache(Settings.GAMES_INDEX_TTL)
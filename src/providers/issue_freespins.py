@@ -0,0 +1,34 @@
+import asyncio
+
+import click
+
+import src.support.models  # noqa: F401  (registers Ticket/Message for the User mapper)
+import src.wallet.models  # noqa: F401
+from src.providers.freespins import PROVIDER, CampaignRun
+from src.providers.pragmatic.client import pragmatic_client
+from src.providers.service import FreespinCampaignService
+from src.settings import Settings
+
+
+@click.command()
+@click.option("--campaign", required=True, help="Campaign created through /providers/pragmatic/freespins/bulk.")
+@click.option("--workers", default=Settings.PRAGMATIC_FREESPIN_WORKERS, type=int, help="Requests in flight.")
+@click.option("--rate", default=Settings.PRAGMATIC_FREESPIN_RATE, type=float, help="Requests per second.")
+def main(campaign: str, workers: int, rate: float) -> None:
+    """Issues the pending freespins of a campaign, resuming an interrupted run."""
+
+    async def run():
+        try:
+            stats = await CampaignRun(campaign, workers, rate).run()
+        finally:
+            await pragmatic_client.close()
+        async with FreespinCampaignService(PROVIDER) as service:
+            progress = await service.get_progress(campaign)
+        print(f"Issued {stats['issued']}, failed {stats['failed']}, deferred {stats['deferred']} "
+              f"in {stats['elapsed_seconds']}s ({stats['per_second']}/s); campaign now {progress}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
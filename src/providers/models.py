@@ -1,143 +1,121 @@
-import enum
 from datetime import datetime
-from uuid import uuid4
 
-import sqlalchemy
+from sqlalchemy import DECIMAL, Boolean, Column, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint
+from sqlalchemy.dialects.postgresql import ARRAY
 
 from src.database import Base
-
-
-class UserRole(enum.Enum):
-    user = 'user'
-    admin = 'admin'
-    support = 'support'
-    superuser = 'superuser'
-
-
-class User(Base):
-    __table_args__ = dict(extend_existing=True)
-    __tablename__ = 'users'
-
-    id = sqlalchemy.Column(
-        sqlalchemy.Integer,
-        primary_key=True,
-        index=True,
-    )
-
-    referrer_id = sqlalchemy.Column(
-        sqlalchemy.Integer,
-        sqlalchemy.ForeignKey('users.id'),
-        nullable=True,
-    )
-
-    username = sqlalchemy.Column(
-        sqlalchemy.String,
-        index=True,
-        unique=True,
-    )
-
-    password = sqlalchemy.Column(
-        sqlalchemy.String(64)
-    )
-
-    fullname = sqlalchemy.Column(
-        sqlalchemy.String,
-        default=None
-    )
-
-    avatar = sqlalchemy.Column(
-        sqlalchemy.String,
-        default=None
-    )
-
-    telegram_id = sqlalchemy.Column(
-        sqlalchemy.Integer,
-        default=None
-    )
-
-    telegram_fullname = sqlalchemy.Column(
-        sqlalchemy.String,
-        default=None
-    )
-
-    telegram_username = sqlalchemy.Column(
-        sqlalchemy.String,
-        default=None
-    )
-
-    telegram_code = sqlalchemy.Column(
-        sqlalchemy.String,
-        default=lambda: uuid4().hex
-    )
-
-    vk_id = sqlalchemy.Column(
-        sqlalchemy.Integer,
-        default=None
-    )
-
-    active = sqlalchemy.Column(
-        sqlalchemy.Boolean,
-        default=True
-    )
-
-    fingerprint = sqlalchemy.Column(sqlalchemy.String)
-
-    fingerprint_hash = sqlalchemy.Column(sqlalchemy.String)
-
-    role = sqlalchemy.Column(
-        sqlalchemy.Enum(UserRole),
-        nullable=False
-    )
-
-    created_at = sqlalchemy.Column(
-        sqlalchemy.DateTime,
-        default=datetime.now
-    )
-
-    has_deposited = sqlalchemy.Column(  # Добавлено новое поле
-        sqlalchemy.Boolean,
-        default=False
-    )
-
-    referral_bonus_rate = sqlalchemy.Column(  # Добавлено новое поле
-        sqlalchemy.Float,
-        default=0.1
-    )
-
-    referral_earnings = sqlalchemy.Column(  # Новое поле
-        sqlalchemy.Numeric,
-        default=0.0
-    )
-
-    referral_count = sqlalchemy.Column(  # Новое поле для хранения количества рефералов
-        sqlalchemy.Integer,
-        default=0
-    )
-
-    transactions = sqlalchemy.orm.relationship(
-        'Transaction',
-        back_populates='user'
-    )
-
-    tickets = sqlalchemy.orm.relationship(
-        'Ticket',
-        back_populates='user'
-    )
-
-    messages = sqlalchemy.orm.relationship(
-        'Message',
-        back_populates='user'
-    )
-
-    # Relationship to self, reverse for referrer
-    referrer = sqlalchemy.orm.relationship(
-        'User',
-        remote_side=[id],
-        back_populates='referrals'
-    )
-
-    # Relationship to self, forward for referrals
-    referrals = sqlalchemy.orm.relationship(
-        'User',
-        back_populates='referrer'
+# One mapped class per table: a second `User` on the same Base makes
+# relationship('User') ambiguous once both modules are imported
+from src.users.models import User, UserRole  # noqa: F401
+
+
+class ProviderTransaction(Base):
+    """A game provider's wallet callback (bet, win, refund, rollback) keyed by
+    the provider's own transaction id; retries of a callback find it here and
+    get the stored result back instead of moving money twice.
+    """
+    __tablename__ = 'provider_transactions'
+    id = Column(Integer, primary_key=True)
+    provider = Column(String, nullable=False)
+    provider_transaction_id = Column(String, nullable=False)
+    # bet, win, refund, rollback; `void` marks the id of a bet or win that
+    # was refunded or rolled back before it arrived, so it is never booked
+    action = Column(String, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    game_uuid = Column(String, nullable=True)
+    amount = Column(DECIMAL, nullable=False, default=0)
+    # Provider id of the bet a refund is for
+    reference_id = Column(String, nullable=True)
+
+    # Wallet transaction booked for the callback, NULL if it moved no money
+    transaction_id = Column(Integer, nullable=True)
+    # Provider id of the refund or rollback that reversed this bet or win
+    reversed_by = Column(String, nullable=True)
+    # Playable balance reported back, replayed to retries
+    balance = Column(DECIMAL, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint('provider', 'provider_transaction_id', name='uq_provider_transactions_provider_id'),
+    )
+
+
+class GameSession(Base):
+    """A game launched through a provider's init call; its callbacks carry
+    `session_id` and are resolved to the player through this table.
+    """
+    __tablename__ = 'game_sessions'
+    provider = Column(String, primary_key=True)
+    session_id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    game_uuid = Column(String, nullable=False)
+    currency = Column(String, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.now)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class Game(Base):
+    """A game of an aggregator's catalog, copied by `src.providers.sync_games`."""
+    __tablename__ = 'games'
+    # Adapter the game is launched through, see `src.providers.adapters`
+    aggregator = Column(String, primary_key=True)
+    uuid = Column(String, primary_key=True)
+    name = Column(String, nullable=False)
+    image = Column(String, nullable=True)
+    type = Column(String, nullable=True)
+    # Game studio as named by the aggregator, not our integration
+    provider = Column(String, nullable=True)
+    technology = Column(String, nullable=True)
+    has_lobby = Column(Boolean, nullable=False, default=False)
+    is_mobile = Column(Boolean, nullable=False, default=False)
+    has_freespins = Column(Boolean, nullable=False, default=False)
+    tags = Column(ARRAY(String), nullable=False, default=list)
+
+    # Games dropped from the upstream catalog are kept but not listed
+    active = Column(Boolean, nullable=False, default=True)
+    synced_at = Column(DateTime, nullable=False)
+
+
+class FreespinCampaign(Base):
+    """One player's freespins of a bulk campaign, issued to the provider by
+    `src.providers.freespins`. Runs only send the rows still `pending`, or
+    `sending` under an expired lease, so an interrupted run resumes where it
+    stopped and concurrent runs never send a row twice.
+    """
+    __tablename__ = 'freespin_campaigns'
+    id = Column(Integer, primary_key=True)
+    provider = Column(String, nullable=False)
+    # Name of the bulk campaign the row belongs to
+    campaign = Column(String, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    # Sent to the provider, `<campaign>-<user_id>`
+    freespin_id = Column(String, nullable=False)
+
+    game_uuid = Column(String, nullable=False)
+    currency = Column(String, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    valid_from = Column(Integer, nullable=False)
+    valid_until = Column(Integer, nullable=False)
+    bet_id = Column(Integer, nullable=True)
+    total_bet_id = Column(Integer, nullable=True)
+    denomination = Column(DECIMAL, nullable=True)
+
+    # pending, sending (claimed by a run), issued, failed (rejected by the
+    # provider, not retried)
+    status = Column(String, nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    # Run that claimed the row and until when; after that another run may reclaim it
+    run_id = Column(String, nullable=True)
+    claimed_until = Column(DateTime, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.now)
+    issued_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('provider', 'campaign', 'user_id', name='uq_freespin_campaigns_player'),
+        # Runs walk a campaign's pending rows in id order
+        Index('ix_freespin_campaigns_progress', 'provider', 'campaign', 'status', 'id'),
     )
@@ -0,0 +1,56 @@
+from typing import List, Mapping
+
+from src.providers.adapters import ProviderAdapter, register_provider
+
+from .client import pragmatic_client
+from .utils import generate_headers, make_request, verify_signature
+
+
+def parse_game(item: dict) -> dict:
+    """Maps a Pragmatic catalog item to `games` columns."""
+    tags = []
+    for tag in item.get('tags') or []:
+        # Either plain codes or {"code": ..., "label": ...}
+        tag = tag.get('code') if isinstance(tag, dict) else tag
+        if tag:
+            tags.append(str(tag))
+    return {
+        'uuid': str(item['uuid']),
+        'name': item.get('name') or '',
+        'image': item.get('image'),
+        'type': item.get('type'),
+        'provider': item.get('provider'),
+        'technology': item.get('technology'),
+        'has_lobby': bool(item.get('has_lobby')),
+        'is_mobile': bool(item.get('is_mobile')),
+        'has_freespins': bool(item.get('has_freespins')),
+        'tags': tags,
+    }
+
+
+class PragmaticAdapter(ProviderAdapter):
+    def sign_request(self, params: dict) -> dict:
+        return generate_headers(params)
+
+    def verify_callback(self, params: dict, headers: Mapping[str, str]) -> bool:
+        return verify_signature(params, headers)
+
+    async def request(self, method: str, endpoint: str, params: dict = None, data: dict = None):
+        return await make_request(method, endpoint, params, data)
+
+    async def fetch_games(self) -> List[dict]:
+        """Reads every page of the games list."""
+        games, page, page_count = [], 1, 1
+        while page <= page_count:
+            body = await self.request("GET", "games", {"page": page})
+            if isinstance(body, list):
+                items = body
+            else:
+                items = body.get('items', [])
+                page_count = (body.get('_meta') or {}).get('pageCount', 1)
+            games.extend(parse_game(item) for item in items)
+            page += 1
+        return games
+
+
+pragmatic = register_provider(PragmaticAdapter("pragmatic", pragmatic_client))
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Dict, Hashable, NamedTuple, Optional
+
+from src.cache import TTLCache
+from src.settings import Settings
+
+from .utils import request_catalog
+
+logger = logging.getLogger(__name__)
+
+# Seconds a catalog response is served without asking Pragmatic
+CATALOG_TTLS = {
+    'games': 300,
+    'limits': 3600,
+    'limits/freespin': 3600,
+    'jackpots': 15,
+    'freespins/bets': 600,
+}
+
+
+class CatalogEntry(NamedTuple):
+    body: Any
+    # Our validator for the frontend, a hash of the body
+    etag: str
+    # Upstream validators for conditional revalidation
+    upstream_etag: Optional[str]
+    upstream_last_modified: Optional[str]
+    fetched_at: float
+
+
+def body_etag(body: Any) -> str:
+    payload = json.dumps(body, sort_keys=True, separators=(',', ':'), default=str).encode()
+    return f'"{hashlib.sha1(payload).hexdigest()}"'
+
+
+class CatalogCache:
+    """Per-worker cache of Pragmatic catalog responses keyed by endpoint and params.
+
+    A fresh entry is served as is. Past its TTL but within the stale window
+    it is still served while one background request revalidates it with
+    If-None-Match/If-Modified-Since; a 304 only renews it. Older entries are
+    fetched inline, concurrent misses of one key share a single request.
+    """
+
+    def __init__(self, ttls: Dict[str, float], stale_ttl: float, maxsize: int = 1000):
+        self.ttls = ttls
+        self.stale_ttl = stale_ttl
+        self._entries = TTLCache(maxsize=maxsize, ttl=max(ttls.values()) + stale_ttl)
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.errors = 0
+
+    async def get(self, endpoint: str, params: Optional[dict] = None) -> CatalogEntry:
+        key = (endpoint, tuple(sorted((params or {}).items())))
+        entry: Optional[CatalogEntry] = self._entries.get(key)
+        ttl = self.ttls[endpoint]
+
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < ttl:
+                self.hits += 1
+                return entry
+            if age < ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._load(key, endpoint, params, entry)
+                return entry
+
+        self.misses += 1
+        return await self._load(key, endpoint, params, entry)
+
+    def _load(self, key: Hashable, endpoint: str, params: Optional[dict],
+              entry: Optional[CatalogEntry]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, endpoint, params, entry))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _fetch(self, key: Hashable, endpoint: str, params: Optional[dict], entry: Optional[CatalogEntry]):
+        try:
+            response = await request_catalog(
+                endpoint,
+                params,
+                etag=entry.upstream_etag if entry else None,
+                last_modified=entry.upstream_last_modified if entry else None
+            )
+        except Exception as e:
+            self.errors += 1
+            if entry is None:
+                raise
+            # Keep serving the stale copy until the stale window runs out
+            logger.warning(f"Revalidating Pragmatic {endpoint} failed: {e}")
+            return entry
+
+        if response.status == 304 and entry is not None:
+            self.revalidated += 1
+            entry = entry._replace(fetched_at=time.monotonic())
+        else:
+            entry = CatalogEntry(
+                body=response.body,
+                etag=body_etag(response.body),
+                upstream_etag=response.etag,
+                upstream_last_modified=response.last_modified,
+                fetched_at=time.monotonic()
+            )
+        self._entries.set(key, entry)
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'revalidated': self.revalidated,
+            'errors': self.errors,
+        }
+
+
+catalog_cache = CatalogCache(CATALOG_TTLS, Settings.PRAGMATIC_CATALOG_STALE_TTL)
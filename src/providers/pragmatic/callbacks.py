@@ -0,0 +1,133 @@
+"""Pragmatic's wallet callbacks, registered as actions of its adapter and
+dispatched by `/providers/pragmatic/callback`."""
+from decimal import Decimal
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+from src.providers.service import PlayerNotFound, ProviderWalletService, TransactionConflict
+from src.providers.sessions import GameSessionInfo, game_sessions
+from src.wallet.service import InsufficientFunds
+
+from .adapter import pragmatic
+from .schemas import BalanceRequest, BetRequest, CallbackResponse, RefundRequest, RollbackRequest, WinRequest
+
+PROVIDER = pragmatic.name
+
+
+def get_player_id(player_id: str) -> int:
+    # Games are launched with our user id as the player id
+    try:
+        return int(player_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=404, detail="Player not found")
+
+
+async def resolve_player(
+        player_id: str,
+        session_id: Optional[str],
+        currency: Optional[str] = None,
+        required: bool = False
+) -> Tuple[int, Optional[GameSessionInfo]]:
+    """Resolves a callback's player through its game session, from memory on
+    the hot path. Settlements of an expired session fall back to `player_id`,
+    a bet needs a live one.
+    """
+    info = await game_sessions.get(PROVIDER, session_id) if session_id else None
+    if info is None:
+        if required:
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+        return get_player_id(player_id), None
+    if str(info.user_id) != player_id:
+        raise HTTPException(status_code=403, detail="Session belongs to another player")
+    if currency and currency != info.currency:
+        raise HTTPException(status_code=400, detail="Currency does not match the session")
+    return info.user_id, info
+
+
+def get_amount(amount: float) -> Decimal:
+    if amount is None or amount < 0:
+        raise HTTPException(status_code=400, detail="Invalid amount")
+    # Through str, so 0.1 stays 0.1 and not its binary float expansion
+    return Decimal(str(amount))
+
+
+async def settle(call):
+    """Runs a wallet callback against our ledger, mapping wallet errors to HTTP ones."""
+    try:
+        async with ProviderWalletService(PROVIDER) as service:
+            return await call(service)
+    except PlayerNotFound:
+        raise HTTPException(status_code=404, detail="Player not found")
+    except InsufficientFunds:
+        raise HTTPException(status_code=400, detail="Insufficient funds")
+    except TransactionConflict:
+        raise HTTPException(status_code=409, detail="Transaction id already used")
+
+
+@pragmatic.action("balance", BalanceRequest)
+async def handle_balance(balance_request: BalanceRequest):
+    user_id, _ = await resolve_player(balance_request.player_id, balance_request.session_id, balance_request.currency)
+    balance = await settle(lambda service: service.get_balance(user_id))
+    return CallbackResponse(balance=balance)
+
+
+@pragmatic.action("bet", BetRequest)
+async def handle_bet(bet_request: BetRequest):
+    user_id, session = await resolve_player(
+        bet_request.player_id, bet_request.session_id, bet_request.currency, required=True
+    )
+    amount = get_amount(bet_request.amount)
+    game_uuid = bet_request.game_uuid or session.game_uuid
+    result = await settle(lambda service: service.bet(user_id, bet_request.transaction_id, amount, game_uuid))
+    return CallbackResponse(balance=result.balance, transaction_id=result.transaction_id)
+
+
+@pragmatic.action("win", WinRequest)
+async def handle_win(win_request: WinRequest):
+    user_id, _ = await resolve_player(win_request.player_id, win_request.session_id, win_request.currency)
+    amount = get_amount(win_request.amount)
+    result = await settle(lambda service: service.win(
+        user_id, win_request.transaction_id, amount, win_request.game_uuid
+    ))
+    return CallbackResponse(balance=result.balance, transaction_id=result.transaction_id)
+
+
+@pragmatic.action("refund", RefundRequest)
+async def handle_refund(refund_request: RefundRequest):
+    user_id, _ = await resolve_player(refund_request.player_id, refund_request.session_id, refund_request.currency)
+    result = await settle(lambda service: service.refund(
+        user_id, refund_request.transaction_id, refund_request.bet_transaction_id, refund_request.game_uuid
+    ))
+    return CallbackResponse(balance=result.balance, transaction_id=result.transaction_id)
+
+
+@pragmatic.action("rollback", RollbackRequest)
+async def handle_rollback(rollback_request: RollbackRequest):
+    user_id = get_player_id(rollback_request.player_id)
+    result = await settle(lambda service: service.rollback(
+        user_id, rollback_request.transaction_id, rollback_request.rollback_transactions, rollback_request.game_uuid
+    ))
+    return CallbackResponse(balance=result.balance, transaction_id=result.transaction_id)
+
+
+FREESPIN_FIELDS = (
+    "player_id", "player_name", "currency", "quantity", "valid_from", "valid_until",
+    "game_uuid", "freespin_id", "bet_id", "total_bet_id", "denomination"
+)
+
+
+@pragmatic.action("freespins/set")
+async def handle_freespins_set(params: dict):
+    data = {name: params[name] for name in FREESPIN_FIELDS if params.get(name) is not None}
+    return await pragmatic.request("POST", "freespins/set", data=data)
+
+
+@pragmatic.action("freespins/get")
+async def handle_freespins_get(params: dict):
+    return await pragmatic.request("GET", "freespins/get", {"freespin_id": params.get("freespin_id")})
+
+
+@pragmatic.action("freespins/cancel")
+async def handle_freespins_cancel(params: dict):
+    return await pragmatic.request("POST", "freespins/cancel", data={"freespin_id": params.get("freespin_id")})
@@ -0,0 +1,20 @@
+from src.providers.client import ClientProfile, ProviderClient
+from src.settings import Settings
+
+PRAGMATIC_PROFILE = ClientProfile(
+    pool_limit=Settings.PRAGMATIC_POOL_LIMIT,
+    pool_limit_per_host=Settings.PRAGMATIC_POOL_LIMIT_PER_HOST,
+    keepalive_timeout=Settings.PRAGMATIC_KEEPALIVE_TIMEOUT,
+    dns_cache_ttl=Settings.PRAGMATIC_DNS_CACHE_TTL,
+    connect_timeout=Settings.PRAGMATIC_CONNECT_TIMEOUT,
+    read_timeout=Settings.PRAGMATIC_READ_TIMEOUT,
+    total_timeout=Settings.PRAGMATIC_TOTAL_TIMEOUT,
+    max_concurrency=Settings.PRAGMATIC_MAX_CONCURRENCY,
+    bulkhead_wait=Settings.PRAGMATIC_BULKHEAD_WAIT,
+    breaker_failures=Settings.PRAGMATIC_BREAKER_FAILURES,
+    breaker_reset_timeout=Settings.PRAGMATIC_BREAKER_RESET_TIMEOUT,
+    deadline=Settings.PRAGMATIC_DEADLINE,
+)
+
+pragmatic_client = ProviderClient("Pragmatic", PRAGMATIC_PROFILE)
+pragmatic_guard = pragmatic_client.guard
@@ -1,11 +1,19 @@
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
 
-from src.providers.dependencies import get_current_active_user
-from src.providers.pragmatic.schemas import BalanceRequest, BetRequest, WinRequest, RefundRequest, RollbackRequest
+from src.providers.dependencies import get_current_active_user, get_current_admin_user
+from src.providers.freespins import PROVIDER as FREESPIN_PROVIDER, campaign_runs, start_campaign_run
+from src.providers.pragmatic.callbacks import PROVIDER
+from src.providers.pragmatic.schemas import BulkFreespinRequest, FreespinCampaignProgress
 from src.providers.schemas import SelfValidateResponse, ReadProfile
+from src.providers.pragmatic.cache import CATALOG_TTLS, catalog_cache
+from src.providers.pragmatic.client import pragmatic_client, pragmatic_guard
 from src.providers.pragmatic.utils import make_request
+from src.providers.service import FreespinCampaignService, SessionTaken
+from src.settings import Settings
+from src.providers.sessions import game_sessions
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,9 +22,19 @@ router = APIRouter(prefix="/providers/pragmatic",
                    tags=["Providers", "Pragmatic"])
 
 
+async def catalog_response(request: Request, endpoint: str, params: dict = None) -> Response:
+    """Serves a cached catalog response with an ETag, 304 if the client has it."""
+    entry = await catalog_cache.get(endpoint, params)
+    headers = {"ETag": entry.etag, "Cache-Control": f"max-age={CATALOG_TTLS[endpoint]}"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if entry.etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(entry.body, headers=headers)
+
+
 @router.get("/games")
-async def get_games():
-    return await make_request("GET", "games")
+async def get_games(request: Request):
+    return await catalog_response(request, "games")
 
 
 @router.post("/games/lobby")
@@ -26,13 +44,20 @@ async def get_lobby(game_uuid: str, currency: str, ):
 
 
 @router.post("/games/init")
-async def init_game_session(game_uuid: str, player_id: str, player_name: str, currency: str, session_id: str,
+async def init_game_session(game_uuid: str, currency: str, session_id: str,
                             return_url: str = None, language: str = None,
+                            user: ReadProfile = Depends(get_current_active_user),
                             ):
+    # Registered first: the game may call back for the balance before init returns
+    try:
+        await game_sessions.open(PROVIDER, session_id, user.id, game_uuid, currency)
+    except SessionTaken:
+        raise HTTPException(status_code=409, detail="Session belongs to another player")
+
     data = {
         "game_uuid": game_uuid,
-        "player_id": player_id,
-        "player_name": player_name,
+        "player_id": str(user.id),
+        "player_name": user.username,
         "currency": currency,
         "session_id": session_id,
         "return_url": return_url,
@@ -41,166 +66,19 @@ async def init_game_session(game_uuid: str, player_id: str, player_name: str, cu
     return await make_request("POST", "games/init", data=data)
 
 
-@router.post("/callback")
-async def callback(
-        action: str = Query(...),
-        player_id: str = Query(None),
-        game_uuid: str = Query(None),
-        amount: float = Query(None),
-        currency: str = Query(None),
-        transaction_id: str = Query(None),
-        session_id: str = Query(None),
-        type: str = Query(None),
-        bet_transaction_id: str = Query(None),
-        rollback_transactions: str = Query(None),
-        freespin_id: str = Query(None),
-        quantity: int = Query(None),
-        valid_from: int = Query(None),
-        valid_until: int = Query(None),
-        player_name: str = Query(None),
-        denomination: float = Query(None)
-):
-    if action == "balance":
-        return await handle_balance(BalanceRequest(
-            player_id=player_id,
-            currency=currency,
-            session_id=session_id
-        ))
-    elif action == "bet":
-        return await handle_bet(BetRequest(
-            player_id=player_id,
-            game_uuid=game_uuid,
-            amount=amount,
-            currency=currency,
-            transaction_id=transaction_id,
-            session_id=session_id,
-            type=type
-        ))
-    elif action == "win":
-        return await handle_win(WinRequest(
-            player_id=player_id,
-            game_uuid=game_uuid,
-            amount=amount,
-            currency=currency,
-            transaction_id=transaction_id,
-            session_id=session_id,
-            type=type
-        ))
-    elif action == "refund":
-        return await handle_refund(RefundRequest(
-            player_id=player_id,
-            game_uuid=game_uuid,
-            amount=amount,
-            currency=currency,
-            transaction_id=transaction_id,
-            session_id=session_id,
-            bet_transaction_id=bet_transaction_id
-        ))
-    elif action == "rollback":
-        return await handle_rollback(RollbackRequest(
-            player_id=player_id,
-            game_uuid=game_uuid,
-            currency=currency,
-            transaction_id=transaction_id,
-            rollback_transactions=rollback_transactions.split(",") if rollback_transactions else []
-        ))
-    elif action == "freespins/set":
-        return await set_freespin_campaign(player_id=player_id,
-                                           player_name=player_name,
-                                           currency=currency,
-                                           quantity=quantity,
-                                           valid_from=valid_from,
-                                           valid_until=valid_until,
-                                           game_uuid=game_uuid,
-                                           freespin_id=freespin_id,
-                                           bet_id=None,
-                                           total_bet_id=None,
-                                           denomination=denomination)
-    elif action == "freespins/get":
-        return await get_freespin_campaign(freespin_id=freespin_id)
-    elif action == "freespins/cancel":
-        return await cancel_freespin_campaign(freespin_id=freespin_id)
-    else:
-        raise HTTPException(status_code=400, detail="Invalid action")
-
-
-async def handle_balance(balance_request: BalanceRequest):
-    data = {
-        "action": "balance",
-        "player_id": balance_request.player_id,
-        "currency": balance_request.currency,
-        "session_id": balance_request.session_id,
-    }
-    return await make_request("POST", "balance", data=data)
-
-
-async def handle_bet(bet_request: BetRequest):
-    data = {
-        "action": "bet",
-        "player_id": bet_request.player_id,
-        "game_uuid": bet_request.game_uuid,
-        "amount": bet_request.amount,
-        "currency": bet_request.currency,
-        "transaction_id": bet_request.transaction_id,
-        "session_id": bet_request.session_id,
-        "type": bet_request.type,
-    }
-    return await make_request("POST", "bet", data=data)
-
-
-async def handle_win(win_request: WinRequest):
-    data = {
-        "action": "win",
-        "player_id": win_request.player_id,
-        "game_uuid": win_request.game_uuid,
-        "amount": win_request.amount,
-        "currency": win_request.currency,
-        "transaction_id": win_request.transaction_id,
-        "session_id": win_request.session_id,
-        "type": win_request.type,
-    }
-    return await make_request("POST", "win", data=data)
-
-
-async def handle_refund(refund_request: RefundRequest):
-    data = {
-        "action": "refund",
-        "player_id": refund_request.player_id,
-        "game_uuid": refund_request.game_uuid,
-        "amount": refund_request.amount,
-        "currency": refund_request.currency,
-        "transaction_id": refund_request.transaction_id,
-        "session_id": refund_request.session_id,
-        "bet_transaction_id": refund_request.bet_transaction_id,
-    }
-    return await make_request("POST", "refund", data=data)
-
-
-async def handle_rollback(rollback_request: RollbackRequest):
-    data = {
-        "action": "rollback",
-        "player_id": rollback_request.player_id,
-        "game_uuid": rollback_request.game_uuid,
-        "currency": rollback_request.currency,
-        "transaction_id": rollback_request.transaction_id,
-        "rollback_transactions": rollback_request.rollback_transactions,
-    }
-    return await make_request("POST", "rollback", data=data)
-
-
 @router.get("/limits")
-async def get_limits():
-    return await make_request("GET", "limits")
+async def get_limits(request: Request):
+    return await catalog_response(request, "limits")
 
 
 @router.get("/limits/freespin")
-async def get_freespin_limits():
-    return await make_request("GET", "limits/freespin")
+async def get_freespin_limits(request: Request):
+    return await catalog_response(request, "limits/freespin")
 
 
 @router.get("/jackpots")
-async def get_jackpots():
-    return await make_request("GET", "jackpots")
+async def get_jackpots(request: Request):
+    return await catalog_response(request, "jackpots")
 
 
 @router.post("/balance/notify")
@@ -213,9 +91,9 @@ async def notify_balance_change(balance: float, session_id: str, ):
 
 
 @router.get("/freespins/bets")
-async def get_freespin_bets(game_uuid: str, currency: str, ):
+async def get_freespin_bets(request: Request, game_uuid: str, currency: str, ):
     params = {"game_uuid": game_uuid, "currency": currency}
-    return await make_request("GET", "freespins/bets", params)
+    return await catalog_response(request, "freespins/bets", params)
 
 
 @router.post("/freespins/set")
@@ -239,6 +117,35 @@ async def set_freespin_campaign(player_id: str, player_name: str, currency: str,
     return await make_request("POST", "freespins/set", data=data)
 
 
+async def campaign_progress(campaign: str) -> FreespinCampaignProgress:
+    async with FreespinCampaignService(FREESPIN_PROVIDER) as service:
+        progress = await service.get_progress(campaign)
+    run, task = campaign_runs.get(campaign, (None, None))
+    return FreespinCampaignProgress(
+        campaign=campaign,
+        **progress,
+        running=task is not None and not task.done(),
+        run=run.stats() if run else None
+    )
+
+
+@router.post("/freespins/bulk", response_model=FreespinCampaignProgress, tags=["Admin"])
+async def create_bulk_freespins(request: BulkFreespinRequest, user: ReadProfile = Depends(get_current_admin_user)):
+    """Adds the segment's players to the campaign and starts issuing its
+    pending freespins in the background; repeat the call to resume a run."""
+    params = request.model_dump(exclude={'campaign', 'segment'})
+    async with FreespinCampaignService(FREESPIN_PROVIDER) as service:
+        added = await service.create_campaign(request.campaign, params, request.segment.model_dump())
+    logger.info(f"Freespin campaign {request.campaign}: {added} players added")
+    start_campaign_run(request.campaign, Settings.PRAGMATIC_FREESPIN_WORKERS, Settings.PRAGMATIC_FREESPIN_RATE)
+    return await campaign_progress(request.campaign)
+
+
+@router.get("/freespins/bulk/{campaign}", response_model=FreespinCampaignProgress, tags=["Admin"])
+async def get_bulk_freespins(campaign: str, user: ReadProfile = Depends(get_current_admin_user)):
+    return await campaign_progress(campaign)
+
+
 @router.get("/freespins/get")
 async def get_freespin_campaign(freespin_id: str, ):
     params = {"freespin_id": freespin_id}
@@ -251,6 +158,26 @@ async def cancel_freespin_campaign(freespin_id: str, ):
     return await make_request("POST", "freespins/cancel", data=data)
 
 
+@router.get("/pool/stats", tags=["Admin"])
+async def get_pool_stats(user: ReadProfile = Depends(get_current_admin_user)):
+    return pragmatic_client.stats()
+
+
+@router.get("/resilience/stats", tags=["Admin"])
+async def get_resilience_stats(user: ReadProfile = Depends(get_current_admin_user)):
+    return pragmatic_guard.stats()
+
+
+@router.get("/cache/stats", tags=["Admin"])
+async def get_catalog_cache_stats(user: ReadProfile = Depends(get_current_admin_user)):
+    return catalog_cache.stats()
+
+
+@router.get("/sessions/stats", tags=["Admin"])
+async def get_game_session_stats(user: ReadProfile = Depends(get_current_admin_user)):
+    return game_sessions.stats()
+
+
 @router.post("/self-validate", response_model=SelfValidateResponse)
 async def self_validate():
     return await make_request("POST", "self-validate")
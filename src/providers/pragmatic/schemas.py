@@ -1,10 +1,14 @@
-from pydantic import BaseModel
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from pydantic import BaseModel, Field, field_validator
 
 
 class BalanceRequest(BaseModel):
     player_id: str
     currency: str
-    session_id: str = None
+    session_id: Optional[str] = None
 
 
 class BetRequest(BaseModel):
@@ -14,7 +18,7 @@ class BetRequest(BaseModel):
     currency: str
     transaction_id: str
     session_id: str
-    type: str = "bet"
+    type: Optional[str] = "bet"
 
 
 class WinRequest(BaseModel):
@@ -24,7 +28,7 @@ class WinRequest(BaseModel):
     currency: str
     transaction_id: str
     session_id: str
-    type: str = "win"
+    type: Optional[str] = "win"
 
 
 class RefundRequest(BaseModel):
@@ -42,4 +46,50 @@ class RollbackRequest(BaseModel):
     game_uuid: str
     currency: str
     transaction_id: str
-    rollback_transactions: list
+    rollback_transactions: list[str] = []
+
+    @field_validator('rollback_transactions', mode='before')
+    @classmethod
+    def split_ids(cls, value):
+        # Sent as one comma-separated query parameter
+        if isinstance(value, str):
+            return [transaction_id for transaction_id in value.split(',') if transaction_id]
+        return value
+
+
+class CallbackResponse(BaseModel):
+    balance: Decimal
+    transaction_id: Optional[int] = None
+
+
+class FreespinSegment(BaseModel):
+    # Explicit players, or every player matching the filters below
+    user_ids: Optional[list[int]] = None
+    registered_from: Optional[datetime] = None
+    registered_to: Optional[datetime] = None
+    has_deposited: Optional[bool] = None
+    active: Optional[bool] = True
+
+
+class BulkFreespinRequest(BaseModel):
+    campaign: str = Field(pattern=r'^[A-Za-z0-9_.-]{1,64}$')
+    game_uuid: str
+    currency: str
+    quantity: int = Field(gt=0)
+    valid_from: int
+    valid_until: int
+    bet_id: Optional[int] = None
+    total_bet_id: Optional[int] = None
+    denomination: Optional[Decimal] = None
+    segment: FreespinSegment
+
+
+class FreespinCampaignProgress(BaseModel):
+    campaign: str
+    pending: int
+    sending: int = 0
+    issued: int
+    failed: int
+    # Run of this worker, if any: whether it's still going and its counters
+    running: bool
+    run: Optional[dict] = None
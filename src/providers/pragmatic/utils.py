@@ -1,13 +1,21 @@
-import aiohttp
-import backoff
 from fastapi import HTTPException
 import hashlib
 import hmac
 import time
 import uuid
+from typing import Any, NamedTuple, Optional
 
 from src.settings import Settings
 
+from .client import pragmatic_client
+
+
+def sign(params: dict, headers: dict) -> str:
+    merged_params = {**params, **headers}
+    sorted_params = sorted(merged_params.items())
+    query_string = "&".join(f"{k}={v}" for k, v in sorted_params)
+    return hmac.new(Settings.PRAGMATIC_MERCHANT_KEY.encode(), query_string.encode(), hashlib.sha1).hexdigest()
+
 
 def generate_headers(params: dict):
     nonce = uuid.uuid4().hex
@@ -19,21 +27,27 @@ def generate_headers(params: dict):
         "X-Nonce": nonce,
     }
 
-    merged_params = {**params, **headers}
-    sorted_params = sorted(merged_params.items())
-    query_string = "&".join(f"{k}={v}" for k, v in sorted_params)
-    sign = hmac.new(Settings.PRAGMATIC_MERCHANT_KEY.encode(), query_string.encode(), hashlib.sha1).hexdigest()
-
-    headers["X-Sign"] = sign
+    headers["X-Sign"] = sign(params, headers)
 
     return headers
 
 
-def handle_response(response):
+def verify_signature(params: dict, headers) -> bool:
+    """Checks the X-Sign of a callback, signed like our own requests."""
+    signed = {
+        name: headers.get(name)
+        for name in ("X-Merchant-Id", "X-Timestamp", "X-Nonce")
+    }
+    if signed["X-Merchant-Id"] != Settings.PRAGMATIC_MERCHANT_ID or None in signed.values():
+        return False
+    return hmac.compare_digest(sign(params, signed), headers.get("X-Sign", ""))
+
+
+async def handle_response(response):
     if response.status == 200:
-        return response.json()
+        return await response.json()
     elif response.status == 201:
-        return response.json()
+        return await response.json()
     elif response.status == 204:
         return {"detail": "No content"}
     elif response.status == 304:
@@ -60,19 +74,50 @@ def handle_response(response):
         raise HTTPException(status_code=430, detail="Unexpected error")
 
 
-@backoff.on_exception(backoff.expo, (aiohttp.ClientError, aiohttp.ClientResponseError),
-                      max_tries=3,
-                      giveup=lambda e: e.status not in [429, 430, 500, 503])
 async def make_request(method: str, endpoint: str, params: dict = None, data: dict = None):
     url = f"{Settings.PRAGMATIC_BASE_API_URL}/{endpoint}"
-    headers = generate_headers(params or {})
-
-    async with aiohttp.ClientSession() as session:
-        if method == "GET":
-            async with session.get(url, headers=headers) as response:
-                return await handle_response(response)
-        elif method == "POST":
-            async with session.post(url, headers=headers, data=data) as response:
-                return await handle_response(response)
-        else:
-            raise aiohttp.web.HTTPMethodNotAllowed(method, allowed_methods=["GET", "POST"])
+
+    if method not in ("GET", "POST"):
+        raise ValueError(f"Unsupported method {method}")
+
+    async def attempt():
+        # Signed per attempt, every retry gets a fresh nonce
+        headers = generate_headers(params or {})
+        # Shared keep-alive session, connections are reused across requests
+        session = await pragmatic_client.session()
+        async with session.request(method, url, headers=headers, params=params, data=data) as response:
+            return await handle_response(response)
+
+    return await pragmatic_client.call(method, attempt)
+
+
+class CatalogResponse(NamedTuple):
+    status: int
+    body: Any
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+async def request_catalog(endpoint: str, params: dict = None, etag: str = None, last_modified: str = None):
+    """GET with the upstream validators of a cached copy; a 304 comes back
+    with `status` 304 instead of a body."""
+    url = f"{Settings.PRAGMATIC_BASE_API_URL}/{endpoint}"
+
+    async def attempt():
+        headers = generate_headers(params or {})
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        session = await pragmatic_client.session()
+        async with session.get(url, headers=headers, params=params) as response:
+            body = await handle_response(response)
+            return CatalogResponse(
+                status=response.status,
+                body=body,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified")
+            )
+
+    return await pragmatic_client.call("GET", attempt)
@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import aiohttp
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Upstream answers meaning "try again later" rather than "your request is wrong";
+# 430 is what `handle_response` maps provider-side errors to
+RETRY_STATUSES = frozenset({429, 430, 500, 502, 503, 504})
+
+
+class ProviderUnavailable(Exception):
+    """Raised without calling the provider, the call is rejected locally."""
+
+    def __init__(self, provider: str, reason: str, retry_after: Optional[float] = None):
+        super().__init__(f"{provider} {reason}")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class CircuitOpen(ProviderUnavailable):
+    pass
+
+
+class BulkheadFull(ProviderUnavailable):
+    pass
+
+
+def error_status(e: BaseException) -> Optional[int]:
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status
+    if isinstance(e, HTTPException):
+        return e.status_code
+    return None
+
+
+def is_transient(e: BaseException) -> bool:
+    """Whether an error says the provider is unhealthy: timeouts, broken
+    connections and 429/5xx. Other 4xx are our own mistakes and prove the
+    provider up.
+    """
+    status = error_status(e)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def is_retryable(e: BaseException, method: str = "GET") -> bool:
+    """A GET is retried on any transient error. A POST may have been applied
+    by a provider that timed out or failed afterwards, so it is only retried
+    when it was never sent or explicitly throttled.
+    """
+    if method == "GET":
+        return is_transient(e)
+    return isinstance(e, aiohttp.ClientConnectorError) or error_status(e) == 429
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    Closed, it lets every call through and opens after `failure_threshold`
+    transient failures in a row. Open, it rejects calls for `reset_timeout`
+    seconds, then half-opens and lets `half_open_calls` probes through: a
+    successful probe closes it, a failed one opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.opened = 0
+        self.rejected = 0
+        self.successes = 0
+        self.failures = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def before_call(self) -> bool:
+        """Raises `CircuitOpen` unless the call may go out; True if it is a
+        half-open probe, which must end in `record_success`,
+        `record_failure` or `release_probe`.
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return False
+        if state == self.HALF_OPEN and self._probes < self.half_open_calls:
+            self._probes += 1
+            return True
+        self.rejected += 1
+        retry_after = max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+        raise CircuitOpen(self.name, "circuit is open", retry_after)
+
+    def release_probe(self):
+        """Gives back a probe slot whose call never went out."""
+        if self._state == self.HALF_OPEN:
+            self._probes = max(self._probes - 1, 0)
+
+    def record_success(self):
+        self.successes += 1
+        self._failures = 0
+        if self._state != self.CLOSED:
+            logger.info(f"{self.name} circuit closed")
+        self._state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                logger.warning(f"{self.name} circuit opened after {self._failures} failures")
+                self.opened += 1
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            'state': self.state,
+            'consecutive_failures': self._failures,
+            'opened': self.opened,
+            'rejected': self.rejected,
+            'successes': self.successes,
+            'failures': self.failures,
+        }
+
+
+class Bulkhead:
+    """Caps the calls in flight to one provider; a call waits at most
+    `max_wait` seconds for a slot and is rejected after that, so a slow
+    provider cannot queue up the whole event loop.
+    """
+
+    def __init__(self, name: str, limit: int, max_wait: float = 0.0):
+        self.name = name
+        self.limit = limit
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.max_active = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        if self._semaphore.locked() and self.max_wait <= 0:
+            self.rejected += 1
+            raise BulkheadFull(self.name, "has too many calls in flight")
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.max_wait or None)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise BulkheadFull(self.name, "has too many calls in flight")
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def stats(self) -> dict:
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'max_active': self.max_active,
+            'rejected': self.rejected,
+        }
+
+
+class ProviderGuard:
+    """Circuit breaker and bulkhead around each attempt of a provider call,
+    plus a deadline over all attempts of it.
+    """
+
+    def __init__(self, name: str, breaker: CircuitBreaker, bulkhead: Bulkhead, deadline: float):
+        self.name = name
+        self.breaker = breaker
+        self.bulkhead = bulkhead
+        self.deadline = deadline
+        self.deadline_exceeded = 0
+
+    async def attempt(self, call: Callable[[], Awaitable[T]]) -> T:
+        probe = self.breaker.before_call()
+        try:
+            await self.bulkhead.acquire()
+        except BaseException:
+            # Bulkhead full or deadline passed while waiting: the provider
+            # wasn't called, so a half-open probe proves nothing
+            if probe:
+                self.breaker.release_probe()
+            raise
+        try:
+            result = await call()
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except asyncio.CancelledError:
+            # Cut off by the deadline, the provider did not answer in time
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.bulkhead.release()
+        self.breaker.record_success()
+        return result
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        try:
+            async with asyncio.timeout(self.deadline):
+                return await call()
+        except TimeoutError:
+            self.deadline_exceeded += 1
+            raise
+
+    def stats(self) -> dict:
+        return {
+            'circuit': self.breaker.stats(),
+            'bulkhead': self.bulkhead.stats(),
+            'deadline': self.deadline,
+            'deadline_exceeded': self.deadline_exceeded,
+        }
+
+
+class RateLimiter:
+    """Token bucket: `rate` calls per second on average, bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waited_seconds = 0.0
+
+    async def acquire(self):
+        # Callers queue on the lock, so tokens go out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+                self.waited_seconds += wait
+                await asyncio.sleep(wait)
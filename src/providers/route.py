@@ -0,0 +1,65 @@
+import hashlib
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+
+from src.settings import Settings
+
+from .adapters import providers
+from .dependencies import get_current_admin_user
+from .games import game_index
+from .schemas import ReadGame, ReadGamesPage, ReadProfile
+from .service import GameService
+
+router = APIRouter(prefix="/providers", tags=["Providers"])
+
+
+async def load_games():
+    async with GameService() as service:
+        return [ReadGame.model_validate(game) for game in await service.get_active_games()]
+
+
+@router.get("/games", response_model=ReadGamesPage)
+async def get_games(
+        request: Request,
+        q: Optional[str] = Query(None, max_length=100, description="Name prefix or substring."),
+        provider: Optional[str] = None,
+        type: Optional[str] = None,
+        tag: Optional[str] = None,
+        page: int = Query(1, ge=1),
+        per_page: int = Query(50, ge=1, le=200),
+):
+    """Lobby listing from the local catalog index, never calls the upstream API."""
+    index = await game_index.get(load_games)
+    query = hashlib.sha1(str(sorted(request.query_params.items())).encode()).hexdigest()[:16]
+    headers = {
+        "ETag": f'"{index.version}-{query}"',
+        "Cache-Control": f"max-age={int(Settings.GAMES_INDEX_TTL)}",
+    }
+    if headers["ETag"] in (etag.strip() for etag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+
+    total, items = index.search(q, provider, type, tag, offset=(page - 1) * per_page, limit=per_page)
+    return JSONResponse(
+        {"total": total, "page": page, "per_page": per_page, "items": items},
+        headers=headers
+    )
+
+
+@router.post("/{provider}/callback")
+async def callback(provider: str, request: Request, action: str = Query(...)):
+    """Wallet callbacks of every provider, dispatched by `action` to the handler its adapter registered."""
+    adapter = providers.get(provider)
+    if adapter is None:
+        raise HTTPException(status_code=404, detail="Unknown provider")
+    params = dict(request.query_params)
+    if not adapter.verify_callback(params, request.headers):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    return await adapter.dispatch(action, params)
+
+
+@router.get("/stats", tags=["Admin"])
+async def get_provider_stats(user: ReadProfile = Depends(get_current_admin_user)):
+    """Pool, circuit and bulkhead of each provider's client, and callbacks by action."""
+    return {name: adapter.stats() for name, adapter in providers.items()}
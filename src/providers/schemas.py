@@ -27,3 +27,24 @@ class ReadProfile(ORM):
     role: UserRole
     telegram_code: str
     created_at: datetime
+
+
+class ReadGame(ORM):
+    aggregator: str
+    uuid: str
+    name: str
+    image: Optional[str]
+    type: Optional[str]
+    provider: Optional[str]
+    technology: Optional[str]
+    has_lobby: bool
+    is_mobile: bool
+    has_freespins: bool
+    tags: list[str]
+
+
+class ReadGamesPage(BaseModel):
+    total: int
+    page: int
+    per_page: int
+    items: list[ReadGame]
@@ -1,6 +1,39 @@
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Integer, String, and_, any_, bindparam, cast, func, literal, or_, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.future import select
+
 from src.service import BaseService
+from src.wallet.cache import balance_cache
+from src.wallet.models import PaymentSystem, Transaction, TransactionStatus, TransactionType, WalletBalance
+from src.wallet.service import (
+    DEBIT_TYPES, ZERO, InsufficientFunds, apply_rollup_deltas, balance_deltas, collect_balance_deltas,
+    collect_rollup_deltas, ensure_wallet
+)
+
+from .models import FreespinCampaign, Game, ProviderTransaction, User
+
+logger = logging.getLogger(__name__)
 
-from .models import User
+# What balance_deltas and the rollups read of a transaction
+TRANSACTION_COLUMNS = (
+    Transaction.id, Transaction.user_id, Transaction.type,
+    Transaction.status, Transaction.amount, Transaction.created_at
+)
+
+# Transaction booked to reverse each kind of callback
+COMPENSATIONS = {'bet': TransactionType.REFUND, 'win': TransactionType.REVERSAL}
+
+# Campaign parameters copied to every player's row and sent to the provider
+FREESPIN_PARAMS = (
+    'game_uuid', 'currency', 'quantity', 'valid_from', 'valid_until', 'bet_id', 'total_bet_id', 'denomination'
+)
 
 
 STATICS_PATH = './static/users/'
@@ -26,3 +59,487 @@ class UserService(BaseService):
 
     async def get_user_by_id(self, id: int) -> User:
         return await self.session.get(User, id)
+
+    async def get_user_by_username(self, username: str) -> User:
+        return (await self.session.execute(select(User).where(User.username == username))).scalar_one_or_none()
+
+
+class GameService(BaseService):
+
+    async def get_active_games(self) -> List[Game]:
+        result = await self.session.execute(select(Game).where(Game.active.is_(True)))
+        return list(result.scalars().all())
+
+    async def sync_games(self, aggregator: str, games: List[dict], batch: int = 1000) -> Tuple[int, int]:
+        """Upserts an aggregator's catalog and deactivates its games missing from it.
+
+        Returns (upserted, deactivated).
+        """
+        synced_at = datetime.now()
+        for start in range(0, len(games), batch):
+            stmt = insert(Game).values([
+                {**game, 'aggregator': aggregator, 'active': True, 'synced_at': synced_at}
+                for game in games[start:start + batch]
+            ])
+            await self.session.execute(stmt.on_conflict_do_update(
+                index_elements=[Game.aggregator, Game.uuid],
+                set_={
+                    column: stmt.excluded[column]
+                    for column in ('name', 'image', 'type', 'provider', 'technology', 'has_lobby',
+                                   'is_mobile', 'has_freespins', 'tags', 'active', 'synced_at')
+                }
+            ))
+
+        deactivated = (await self.session.execute(
+            update(Game)
+            .where(Game.aggregator == aggregator, Game.active.is_(True), Game.synced_at < synced_at)
+            .values(active=False)
+            .execution_options(synchronize_session=False)
+        )).rowcount
+        await self.session.commit()
+        logger.info(f"Synced {len(games)} {aggregator} games, deactivated {deactivated}")
+        return len(games), deactivated
+
+
+class FreespinCampaignService(BaseService):
+    """Per-player rows of bulk freespin campaigns, see `src.providers.freespins`."""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+
+    async def create_campaign(self, campaign: str, params: dict, segment: dict) -> int:
+        """Adds a pending row for every player of `segment` in one INSERT ... SELECT.
+
+        Players already in the campaign are skipped, so repeating the call
+        with a wider segment only adds the new ones. Returns how many were added.
+        """
+        query = select(
+            literal(self.provider),
+            literal(campaign),
+            User.id,
+            literal(f'{campaign}-') + cast(User.id, String),
+            *(literal(params.get(name), FreespinCampaign.__table__.c[name].type) for name in FREESPIN_PARAMS),
+            literal('pending'),
+            literal(0),
+            literal(datetime.now())
+        )
+        if segment.get('user_ids') is not None:
+            query = query.where(User.id == any_(bindparam('user_ids', segment['user_ids'], type_=ARRAY(Integer))))
+        if segment.get('registered_from') is not None:
+            query = query.where(User.created_at >= segment['registered_from'])
+        if segment.get('registered_to') is not None:
+            query = query.where(User.created_at < segment['registered_to'])
+        if segment.get('has_deposited') is not None:
+            query = query.where(User.has_deposited.is_(segment['has_deposited']))
+        if segment.get('active') is not None:
+            query = query.where(User.active.is_(segment['active']))
+
+        result = await self.session.execute(
+            insert(FreespinCampaign)
+            .from_select(
+                ['provider', 'campaign', 'user_id', 'freespin_id', *FREESPIN_PARAMS,
+                 'status', 'attempts', 'created_at'],
+                query
+            )
+            .on_conflict_do_nothing(constraint='uq_freespin_campaigns_player')
+        )
+        await self.session.commit()
+        return result.rowcount
+
+    async def claim_pending(self, campaign: str, run_id: str, after_id: int, limit: int, lease: float) -> List[Row]:
+        """Claims the next `limit` rows after `after_id` for `run_id` until
+        `lease` seconds from now: pending ones, and ones whose claim expired.
+
+        The rows are locked with SKIP LOCKED only while the UPDATE marks them
+        `sending`; after commit the status keeps other runs off them. The
+        attempt is counted up front, so a row sent again after a crash is
+        known to have been tried before.
+        """
+        now = datetime.now()
+        claimable = (
+            select(FreespinCampaign.id)
+            .where(
+                FreespinCampaign.provider == self.provider,
+                FreespinCampaign.campaign == campaign,
+                or_(
+                    FreespinCampaign.status == 'pending',
+                    and_(FreespinCampaign.status == 'sending', FreespinCampaign.claimed_until < now)
+                ),
+                FreespinCampaign.id > after_id
+            )
+            .order_by(FreespinCampaign.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        claimed = (
+            update(FreespinCampaign)
+            .where(FreespinCampaign.id.in_(claimable.scalar_subquery()))
+            .values(
+                status='sending',
+                run_id=run_id,
+                claimed_until=now + timedelta(seconds=lease),
+                attempts=FreespinCampaign.attempts + 1
+            )
+            .returning(FreespinCampaign.id, FreespinCampaign.user_id, FreespinCampaign.freespin_id,
+                       FreespinCampaign.attempts, FreespinCampaign.claimed_until,
+                       *(FreespinCampaign.__table__.c[name] for name in FREESPIN_PARAMS))
+            .cte('claimed')
+        )
+        rows = (await self.session.execute(
+            select(claimed, User.username).join(User, User.id == claimed.c.user_id).order_by(claimed.c.id)
+        )).all()
+        await self.session.commit()
+        return rows
+
+    async def save_results(self, run_id: str, results: List[dict]):
+        """Moves `{id, status, error, issued_at}` of sent rows from `sending`
+        to their result in one executemany. Rows another run reclaimed since
+        are left to it.
+        """
+        if not results:
+            return
+        table = FreespinCampaign.__table__
+        await self.session.execute(
+            update(table)
+            .where(
+                table.c.id == bindparam('row_id'),
+                table.c.status == 'sending',
+                table.c.run_id == run_id
+            )
+            .values(
+                status=bindparam('new_status'),
+                error=bindparam('new_error'),
+                issued_at=bindparam('new_issued_at'),
+                claimed_until=None
+            ),
+            [
+                {'row_id': row['id'], 'new_status': row['status'], 'new_error': row['error'],
+                 'new_issued_at': row['issued_at']}
+                for row in results
+            ]
+        )
+        await self.session.commit()
+
+    async def get_progress(self, campaign: str) -> Dict[str, int]:
+        counts = (await self.session.execute(
+            select(FreespinCampaign.status, func.count())
+            .where(FreespinCampaign.provider == self.provider, FreespinCampaign.campaign == campaign)
+            .group_by(FreespinCampaign.status)
+        )).all()
+        return {'pending': 0, 'sending': 0, 'issued': 0, 'failed': 0, **dict(counts)}
+
+
+class ProviderWalletException(Exception):
+    ...
+
+
+class PlayerNotFound(ProviderWalletException):
+    ...
+
+
+class TransactionConflict(ProviderWalletException):
+    """The provider transaction id was already used for another player or action."""
+
+
+class SessionTaken(ProviderWalletException):
+    """The game session id is registered to another player."""
+
+
+class WalletResult(NamedTuple):
+    # Playable balance after the callback: total balance minus reserved withdrawals
+    balance: Decimal
+    # Our `transactions.id`, None if the callback moved no money
+    transaction_id: Optional[int]
+    replayed: bool = False
+
+
+class ProviderWalletService(BaseService):
+    """Seamless wallet for game provider callbacks, settled against our own
+    `transactions` ledger in one database transaction per callback.
+
+    A bet is debited by a single conditional UPDATE of the player's
+    `wallet_balances` row, which also serializes the player's callbacks until
+    commit. The callback's `provider_transactions` row is inserted last; when
+    its provider transaction id is already taken, the work is rolled back and
+    the stored result is replayed, so a retry never moves money twice.
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+
+    async def get_balance(self, user_id: int) -> Decimal:
+        balance = (await self.session.execute(
+            select(WalletBalance.balance - WalletBalance.reserved).where(WalletBalance.user_id == user_id)
+        )).scalar_one_or_none()
+        if balance is not None:
+            return balance
+        if await self.session.get(User, user_id) is None:
+            raise PlayerNotFound()
+        return ZERO
+
+    async def bet(self, user_id: int, transaction_id: str, amount: Decimal, game_uuid: str = None) -> WalletResult:
+        return await self._book_callback('bet', TransactionType.BET, user_id, transaction_id, amount, game_uuid)
+
+    async def win(self, user_id: int, transaction_id: str, amount: Decimal, game_uuid: str = None) -> WalletResult:
+        return await self._book_callback('win', TransactionType.WIN, user_id, transaction_id, amount, game_uuid)
+
+    async def refund(
+        self,
+        user_id: int,
+        transaction_id: str,
+        bet_transaction_id: str,
+        game_uuid: str = None
+    ) -> WalletResult:
+        """Returns the stake of the bet `bet_transaction_id`, once, whatever amount the provider sends."""
+        bets, unknown = await self._reverse(user_id, [bet_transaction_id], ('bet',), transaction_id)
+        if not bets:
+            await self._void(user_id, unknown, transaction_id)
+            balance = await self.get_balance(user_id)
+            return await self._record('refund', user_id, transaction_id, ZERO, game_uuid, balance,
+                                      reference_id=bet_transaction_id)
+
+        refund, = await self._compensate(user_id, bets, game_uuid)
+        balance = await self._apply(user_id, balance_deltas(refund))
+        await apply_rollup_deltas(self.session, collect_rollup_deltas([refund]))
+        return await self._record('refund', user_id, transaction_id, refund.amount, game_uuid, balance,
+                                  refund.id, reference_id=bet_transaction_id)
+
+    async def rollback(
+        self,
+        user_id: int,
+        transaction_id: str,
+        rollback_transactions: List[str],
+        game_uuid: str = None
+    ) -> WalletResult:
+        """Reverses the listed bets and wins of the player that aren't reversed
+        yet, whatever their number in a fixed number of statements: one UPDATE
+        claims them, one INSERT books their compensating transactions and one
+        inserts voids for the ids we haven't seen.
+        """
+        targets, unknown = await self._reverse(user_id, rollback_transactions, ('bet', 'win'), transaction_id)
+
+        rows = await self._compensate(
+            user_id, [target for target in targets if target.transaction_id is not None], game_uuid
+        )
+        balance = await self._apply(user_id, collect_balance_deltas(rows).get(user_id, (ZERO, ZERO, ZERO, ZERO)))
+        await apply_rollup_deltas(self.session, collect_rollup_deltas(rows))
+        await self._void(user_id, unknown, transaction_id)
+        amount = sum((row.amount for row in rows), ZERO)
+        return await self._record('rollback', user_id, transaction_id, amount, game_uuid, balance)
+
+    async def _reverse(
+        self,
+        user_id: int,
+        transaction_ids: List[str],
+        actions: Tuple[str, ...],
+        reversed_by: str
+    ) -> Tuple[List[Row], List[str]]:
+        """Marks the player's unreversed callbacks among `transaction_ids` as
+        reversed by `reversed_by` in one UPDATE over the unique index.
+
+        Returns the claimed rows and the ids that weren't claimed: unknown
+        ones, and ones already reversed, which `_void` then leaves alone.
+        """
+        ids = list(dict.fromkeys(transaction_ids))
+        if not ids:
+            return [], []
+        claimed = (await self.session.execute(
+            update(ProviderTransaction)
+            .where(
+                ProviderTransaction.provider == self.provider,
+                ProviderTransaction.provider_transaction_id == any_(bindparam('ids', ids, type_=ARRAY(String))),
+                ProviderTransaction.user_id == user_id,
+                ProviderTransaction.action.in_(actions),
+                ProviderTransaction.reversed_by.is_(None)
+            )
+            .values(reversed_by=reversed_by)
+            .returning(ProviderTransaction.provider_transaction_id, ProviderTransaction.action,
+                       ProviderTransaction.transaction_id, ProviderTransaction.amount)
+            .execution_options(synchronize_session=False)
+        )).all()
+        done = {row.provider_transaction_id for row in claimed}
+        return claimed, [transaction_id for transaction_id in ids if transaction_id not in done]
+
+    async def _compensate(self, user_id: int, targets: List[Row], game_uuid: Optional[str]) -> List[Row]:
+        """Books a REFUND for each claimed bet and a REVERSAL for each claimed
+        win in one multi-row INSERT.
+
+        The reversed transactions themselves are never changed: rows behind a
+        balance checkpoint, in past days' rollups or in detached partitions
+        must stay as they are.
+        """
+        if not targets:
+            return []
+        now = datetime.now()
+        return (await self.session.execute(
+            insert(Transaction)
+            .values([
+                self._transaction_values(COMPENSATIONS[target.action], user_id, target.amount, game_uuid, now)
+                for target in targets
+            ])
+            .returning(*TRANSACTION_COLUMNS)
+        )).all()
+
+    async def _book_callback(
+        self,
+        action: str,
+        type: TransactionType,
+        user_id: int,
+        transaction_id: str,
+        amount: Decimal,
+        game_uuid: Optional[str]
+    ) -> WalletResult:
+        row = await self._insert(type, user_id, amount, game_uuid)
+        try:
+            balance = await self._apply(user_id, balance_deltas(row), check_funds=type == TransactionType.BET)
+        except InsufficientFunds:
+            await self.session.rollback()
+            # The retry of a bet that took the last of the balance
+            replay = await self._replay(action, user_id, transaction_id)
+            if replay is None:
+                raise
+            return replay
+        await apply_rollup_deltas(self.session, collect_rollup_deltas([row]))
+        return await self._record(action, user_id, transaction_id, amount, game_uuid, balance, row.id)
+
+    async def _insert(self, type: TransactionType, user_id: int, amount: Decimal, game_uuid: Optional[str]) -> Row:
+        stmt = (
+            insert(Transaction)
+            .values(**self._transaction_values(type, user_id, amount, game_uuid, datetime.now()))
+            .returning(*TRANSACTION_COLUMNS)
+        )
+        try:
+            return (await self.session.execute(stmt)).one()
+        except IntegrityError:
+            await self.session.rollback()
+            raise PlayerNotFound()
+
+    def _transaction_values(
+        self,
+        type: TransactionType,
+        user_id: int,
+        amount: Decimal,
+        game_uuid: Optional[str],
+        created_at: datetime
+    ) -> dict:
+        account = f'{self.provider}:{game_uuid or ""}'
+        debit = type in DEBIT_TYPES
+        return dict(
+            payment_system=PaymentSystem.internal,
+            type=type,
+            amount=amount,
+            user_id=user_id,
+            from_account='' if debit else account,
+            to_account=account if debit else '',
+            status=TransactionStatus.CONFIRMED,
+            created_at=created_at
+        )
+
+    async def _apply(self, user_id: int, deltas, check_funds: bool = False) -> Decimal:
+        """Adds (balance, bonus, pure, reserved) deltas to the player's ledger
+        row and returns the playable balance; with `check_funds` it must not
+        drop below zero, else `InsufficientFunds`.
+        """
+        balance, bonus, pure, reserved = deltas
+        if not any(deltas):
+            return await self.get_balance(user_id)
+
+        stmt = (
+            update(WalletBalance)
+            .where(WalletBalance.user_id == user_id)
+            .values(
+                balance=WalletBalance.balance + balance,
+                bonus=WalletBalance.bonus + bonus,
+                pure=WalletBalance.pure + pure,
+                reserved=WalletBalance.reserved + reserved,
+                updated_at=datetime.now()
+            )
+            .returning(WalletBalance.balance - WalletBalance.reserved)
+            .execution_options(synchronize_session=False)
+        )
+        if check_funds:
+            stmt = stmt.where(WalletBalance.balance - WalletBalance.reserved + balance >= 0)
+
+        result = (await self.session.execute(stmt)).scalar_one_or_none()
+        if result is None:
+            # Either the funds are short or the player has no ledger row yet
+            try:
+                await ensure_wallet(self.session, user_id)
+            except IntegrityError:
+                await self.session.rollback()
+                raise PlayerNotFound()
+            result = (await self.session.execute(stmt)).scalar_one_or_none()
+            if result is None:
+                raise InsufficientFunds()
+        return result
+
+    async def _void(self, user_id: int, transaction_ids: List[str], reversed_by: str):
+        """Reserves ids of bets or wins that were reversed before they arrived."""
+        if not transaction_ids:
+            return
+        now = datetime.now()
+        await self.session.execute(
+            insert(ProviderTransaction)
+            .values([
+                dict(provider=self.provider, provider_transaction_id=transaction_id, action='void',
+                     user_id=user_id, amount=ZERO, reversed_by=reversed_by, created_at=now)
+                for transaction_id in transaction_ids
+            ])
+            .on_conflict_do_nothing(constraint='uq_provider_transactions_provider_id')
+        )
+
+    async def _record(
+        self,
+        action: str,
+        user_id: int,
+        transaction_id: str,
+        amount: Decimal,
+        game_uuid: Optional[str],
+        balance: Decimal,
+        wallet_transaction_id: Optional[int] = None,
+        reference_id: Optional[str] = None
+    ) -> WalletResult:
+        """Stores the callback under its provider transaction id and commits,
+        or rolls back and replays when an earlier delivery already did.
+        """
+        stored = (await self.session.execute(
+            insert(ProviderTransaction)
+            .values(
+                provider=self.provider,
+                provider_transaction_id=transaction_id,
+                action=action,
+                user_id=user_id,
+                game_uuid=game_uuid,
+                amount=amount,
+                reference_id=reference_id,
+                transaction_id=wallet_transaction_id,
+                balance=balance,
+                created_at=datetime.now()
+            )
+            .on_conflict_do_nothing(constraint='uq_provider_transactions_provider_id')
+            .returning(ProviderTransaction.id)
+        )).scalar_one_or_none()
+        if stored is None:
+            await self.session.rollback()
+            return await self._replay(action, user_id, transaction_id)
+
+        await self.session.commit()
+        await balance_cache.invalidate(user_id)
+        return WalletResult(balance, wallet_transaction_id)
+
+    async def _replay(self, action: str, user_id: int, transaction_id: str) -> Optional[WalletResult]:
+        stored = (await self.session.execute(
+            select(ProviderTransaction.user_id, ProviderTransaction.action,
+                   ProviderTransaction.transaction_id, ProviderTransaction.balance)
+            .where(
+                ProviderTransaction.provider == self.provider,
+                ProviderTransaction.provider_transaction_id == transaction_id
+            )
+        )).first()
+        if stored is None:
+            return None
+        if stored.user_id != user_id or stored.action not in (action, 'void'):
+            raise TransactionConflict()
+        logger.info(f"Replaying {self.provider} {action} {transaction_id}")
+        balance = stored.balance if stored.balance is not None else await self.get_balance(user_id)
+        return WalletResult(balance, stored.transaction_id, replayed=True)
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.cache import TTLCache
+from src.database import async_session
+from src.settings import Settings
+
+from .models import GameSession
+from .service import PlayerNotFound, SessionTaken
+
+logger = logging.getLogger(__name__)
+
+
+class GameSessionInfo(NamedTuple):
+    user_id: int
+    game_uuid: str
+    currency: str
+    expires_at: datetime
+
+
+class GameSessionRegistry:
+    """`game_sessions` with a per-process LRU in front, so callbacks resolve
+    their player without a database round trip.
+
+    Entries expire with their session; a periodic sweep drops expired ones
+    so they don't hold LRU slots until they are pushed out.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self.swept = 0
+
+    async def open(self, provider: str, session_id: str, user_id: int, game_uuid: str,
+                   currency: str) -> GameSessionInfo:
+        """Registers a launched game, or extends the session if its player
+        relaunches it. A session id registered to another player raises
+        `SessionTaken`: callbacks are charged to the session's player.
+        """
+        now = datetime.now()
+        stmt = insert(GameSession).values(
+            provider=provider,
+            session_id=session_id,
+            user_id=user_id,
+            game_uuid=game_uuid,
+            currency=currency,
+            created_at=now,
+            expires_at=now + timedelta(seconds=self.ttl)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[GameSession.provider, GameSession.session_id],
+            set_={'expires_at': stmt.excluded.expires_at},
+            where=GameSession.user_id == stmt.excluded.user_id
+        ).returning(GameSession.user_id, GameSession.game_uuid, GameSession.currency, GameSession.expires_at)
+        async with async_session() as session:
+            try:
+                row = (await session.execute(stmt)).first()
+            except IntegrityError:
+                raise PlayerNotFound()
+            if row is None:
+                raise SessionTaken()
+            await session.commit()
+        info = GameSessionInfo(*row)
+        self._cache.set((provider, session_id), info)
+        return info
+
+    async def get(self, provider: str, session_id: str) -> Optional[GameSessionInfo]:
+        """The live session, from memory when this worker has seen it before."""
+        key = (provider, session_id)
+        info: Optional[GameSessionInfo] = self._cache.get(key)
+        if info is not None and info.expires_at > datetime.now():
+            self.hits += 1
+            return info
+
+        self.misses += 1
+        async with async_session() as session:
+            row = (await session.execute(
+                select(GameSession.user_id, GameSession.game_uuid, GameSession.currency, GameSession.expires_at)
+                .where(
+                    GameSession.provider == provider,
+                    GameSession.session_id == session_id,
+                    GameSession.expires_at > datetime.now()
+                )
+            )).first()
+        if row is None:
+            return None
+
+        info = GameSessionInfo(*row)
+        # Opened by another worker: cache it for no longer than it lives
+        self._cache.set(key, info, ttl=(info.expires_at - datetime.now()).total_seconds())
+        return info
+
+    def sweep(self) -> int:
+        swept = self._cache.expire()
+        self.swept += swept
+        return swept
+
+    async def sweep_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            swept = self.sweep()
+            if swept:
+                logger.info(f"Swept {swept} expired game sessions")
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'swept': self.swept,
+        }
+
+
+async def purge_expired_sessions(session: AsyncSession, limit: int) -> int:
+    """Deletes up to `limit` expired sessions, returns how many were removed."""
+    expired = (
+        select(GameSession.provider, GameSession.session_id)
+        .where(GameSession.expires_at <= datetime.now())
+        .order_by(GameSession.expires_at)
+        .limit(limit)
+    )
+    result = await session.execute(
+        delete(GameSession)
+        .where(tuple_(GameSession.provider, GameSession.session_id).in_(expired))
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return result.rowcount
+
+
+game_sessions = GameSessionRegistry(Settings.GAME_SESSION_CACHE_MAXSIZE, Settings.GAME_SESSION_TTL)
@@ -0,0 +1,49 @@
+import asyncio
+from typing import Tuple
+
+import click
+
+import src.providers.pragmatic.adapter  # noqa: F401  (registers the Pragmatic adapter)
+import src.support.models  # noqa: F401  (registers Ticket/Message for the User mapper)
+import src.wallet.models  # noqa: F401
+from src.providers.adapters import providers
+from src.providers.service import GameService
+
+
+@click.command()
+@click.option("--provider", "names", multiple=True, help="Aggregators to sync, all by default.")
+@click.option("--interval", default=0, type=int, help="Seconds between syncs; 0 syncs once and exits.")
+def main(names: Tuple[str, ...], interval: int) -> None:
+    """Copies the aggregators' games lists into the games table."""
+    unknown = set(names) - set(providers)
+    if unknown:
+        raise click.BadParameter(f"unknown providers {', '.join(sorted(unknown))}", param_hint="--provider")
+    adapters = [providers[name] for name in names or providers]
+
+    async def run():
+        while True:
+            failed = False
+            for adapter in adapters:
+                try:
+                    games = await adapter.fetch_games()
+                    async with GameService() as service:
+                        upserted, deactivated = await service.sync_games(adapter.name, games)
+                    print(f"Synced {upserted} {adapter.name} games, deactivated {deactivated}")
+                except Exception as e:
+                    # Lobbies keep serving the last synced catalog; one
+                    # aggregator failing doesn't hold up the others
+                    print(f"{adapter.name} games sync failed: {e}")
+                    failed = True
+            if not interval:
+                break
+            await asyncio.sleep(interval)
+        for adapter in adapters:
+            await adapter.client.close()
+        if failed and not interval:
+            raise SystemExit(1)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -21,11 +21,63 @@ class Settings:
     POSTGRES_HOST = os.environ.get("POSTGRES_HOST", "localhost")
     POSTGRES_DB = os.environ.get('POSTGRES_DB', 'postgres')
 
+    REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
     REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD')
     REDIS_PORT = os.environ.get('REDIS_PORT')
     REDIS_DATABASES = os.environ.get('REDIS_DATABASES')
 
+    # Wallet balance cache: "memory" (per process) or "redis" (shared by workers)
+    BALANCE_CACHE_BACKEND = os.environ.get('BALANCE_CACHE_BACKEND', 'memory')
+    BALANCE_CACHE_TTL = float(os.environ.get('BALANCE_CACHE_TTL', 30))
+    BALANCE_CACHE_MAXSIZE = int(os.environ.get('BALANCE_CACHE_MAXSIZE', 10_000))
+
+    # How often each worker reloads the set of active promo codes, seconds
+    PROMO_CODE_CACHE_TTL = float(os.environ.get('PROMO_CODE_CACHE_TTL', 60))
+
+    # Idempotency-Key of wallet mutations: how long responses are kept in
+    # Postgres, and the per-process LRU serving immediate retries
+    IDEMPOTENCY_KEY_TTL = float(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+    IDEMPOTENCY_CACHE_TTL = float(os.environ.get('IDEMPOTENCY_CACHE_TTL', 5 * 60))
+    IDEMPOTENCY_CACHE_MAXSIZE = int(os.environ.get('IDEMPOTENCY_CACHE_MAXSIZE', 10_000))
+
     # Pragmatic
     PRAGMATIC_BASE_API_URL = os.getenv("PRAGMATIC_BASE_API_URL")
     PRAGMATIC_MERCHANT_ID = os.getenv("PRAGMATIC_MERCHANT_ID")
-    PRAGMATIC_MERCHANT_KEY = os.getenv("PRAGMATIC_MERCHANT_KEY")
\ No newline at end of file
+    PRAGMATIC_MERCHANT_KEY = os.getenv("PRAGMATIC_MERCHANT_KEY")
+
+    # Pragmatic connection pool (per worker) and timeouts, seconds
+    PRAGMATIC_POOL_LIMIT = int(os.getenv("PRAGMATIC_POOL_LIMIT", 100))
+    PRAGMATIC_POOL_LIMIT_PER_HOST = int(os.getenv("PRAGMATIC_POOL_LIMIT_PER_HOST", 50))
+    PRAGMATIC_KEEPALIVE_TIMEOUT = float(os.getenv("PRAGMATIC_KEEPALIVE_TIMEOUT", 30))
+    PRAGMATIC_DNS_CACHE_TTL = int(os.getenv("PRAGMATIC_DNS_CACHE_TTL", 300))
+    PRAGMATIC_CONNECT_TIMEOUT = float(os.getenv("PRAGMATIC_CONNECT_TIMEOUT", 3))
+    PRAGMATIC_READ_TIMEOUT = float(os.getenv("PRAGMATIC_READ_TIMEOUT", 10))
+    PRAGMATIC_TOTAL_TIMEOUT = float(os.getenv("PRAGMATIC_TOTAL_TIMEOUT", 15))
+
+    # Pragmatic circuit breaker: consecutive failures that open it and seconds
+    # before a probe; calls in flight per worker and seconds a call may wait
+    # for a slot; deadline of a call over all its retries, seconds
+    PRAGMATIC_BREAKER_FAILURES = int(os.getenv("PRAGMATIC_BREAKER_FAILURES", 5))
+    PRAGMATIC_BREAKER_RESET_TIMEOUT = float(os.getenv("PRAGMATIC_BREAKER_RESET_TIMEOUT", 30))
+    PRAGMATIC_MAX_CONCURRENCY = int(os.getenv("PRAGMATIC_MAX_CONCURRENCY", 50))
+    PRAGMATIC_BULKHEAD_WAIT = float(os.getenv("PRAGMATIC_BULKHEAD_WAIT", 1))
+    PRAGMATIC_DEADLINE = float(os.getenv("PRAGMATIC_DEADLINE", 20))
+
+    # Bulk freespin campaigns: requests in flight and requests per second of a run
+    PRAGMATIC_FREESPIN_WORKERS = int(os.getenv("PRAGMATIC_FREESPIN_WORKERS", 10))
+    PRAGMATIC_FREESPIN_RATE = float(os.getenv("PRAGMATIC_FREESPIN_RATE", 20))
+    # How long a run holds the rows it claimed before another run may take them, seconds
+    PRAGMATIC_FREESPIN_LEASE = float(os.getenv("PRAGMATIC_FREESPIN_LEASE", 300))
+
+    # How long a Pragmatic catalog response past its TTL is still served while
+    # it is revalidated in the background, seconds
+    PRAGMATIC_CATALOG_STALE_TTL = float(os.getenv("PRAGMATIC_CATALOG_STALE_TTL", 600))
+
+    # Game sessions opened by games/init: lifetime, and the per-process cache
+    # resolving callbacks, swept of expired sessions every interval, seconds
+    GAME_SESSION_TTL = float(os.getenv("GAME_SESSION_TTL", 12 * 60 * 60))
+    GAME_SESSION_CACHE_MAXSIZE = int(os.getenv("GAME_SESSION_CACHE_MAXSIZE", 100_000))
+    GAME_SESSION_SWEEP_INTERVAL = float(os.getenv("GAME_SESSION_SWEEP_INTERVAL", 60))
+
+    # How often each worker reloads its game catalog index from the games table, seconds
+    GAMES_INDEX_TTL = float(os.getenv("GAMES_INDEX_TTL", 60))
@@ -0,0 +1,28 @@
+"""Setup shared by the tests that run against the configured Postgres database."""
+import uuid
+from decimal import Decimal
+
+import src.support.models  # noqa: F401  (registers Ticket/Message for the User mapper)
+from src.users.schemas import RegisterUser
+from src.users.service import UserService
+from src.wallet.models import PaymentSystem, TransactionStatus, TransactionType
+from src.wallet.schemas import CreateTransaction
+from src.wallet.service import TransactionService
+
+
+async def create_funded_user(amount: Decimal) -> int:
+    async with UserService() as service:
+        user = await service.register_user(RegisterUser(
+            username=uuid.uuid4().hex[:10],
+            password=uuid.uuid4().hex[:10],
+            fingerprint=uuid.uuid4().hex[:16],
+        ))
+    async with TransactionService() as service:
+        await service.create_transaction(CreateTransaction(
+            payment_system=PaymentSystem.card,
+            type=TransactionType.IN,
+            amount=amount,
+            user_id=user.id,
+            status=TransactionStatus.CONFIRMED
+        ))
+    return user.id
@@ -0,0 +1,50 @@
+"""Read-through fills of the balance cache racing with invalidations."""
+import asyncio
+from decimal import Decimal
+
+from src.wallet.cache import BalanceCache, MemoryBackend
+from src.wallet.schemas import ReadBalance
+
+
+def balances(amount: int) -> ReadBalance:
+    return ReadBalance(balance=Decimal(amount), bonus_balance=Decimal(0), pure_balance=Decimal(amount))
+
+
+def test_fill_read_before_an_invalidation_is_dropped():
+    async def run():
+        cache = BalanceCache(MemoryBackend(maxsize=100, ttl=30))
+        # A reader misses and reads the old balance, a writer commits and invalidates meanwhile
+        token = await cache.token(1)
+        await cache.invalidate(1)
+        await cache.set(1, balances(100), token)
+        stale = await cache.get(1)
+
+        token = await cache.token(1)
+        await cache.set(1, balances(90), token)
+        return stale, await cache.get(1), cache.stats()
+
+    stale, fresh, stats = asyncio.run(run())
+
+    assert stale is None
+    assert fresh.balance == Decimal(90)
+    assert stats['stale_fills'] == 1
+
+
+def test_fill_read_before_a_clear_is_dropped():
+    async def run():
+        cache = BalanceCache(MemoryBackend(maxsize=100, ttl=30))
+        token = await cache.token(1)
+        await cache.invalidate(2)
+        await cache.set(1, balances(100), token)
+        other_user = await cache.get(1)
+
+        token = await cache.token(1)
+        await cache.clear()
+        await cache.set(1, balances(100), token)
+        return other_user, await cache.get(1)
+
+    other_user, cleared = asyncio.run(run())
+
+    # Invalidating another user doesn't void the fill
+    assert other_user.balance == Decimal(100)
+    assert cleared is None
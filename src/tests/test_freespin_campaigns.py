@@ -0,0 +1,64 @@
+"""Bulk freespin campaigns issued against the fake Pragmatic API, runs against
+the configured Postgres database (see src/.env)."""
+import asyncio
+import time
+import uuid
+from decimal import Decimal
+
+from aiohttp import web
+from sqlalchemy import select
+
+from benchmarks.fake_pragmatic import Faults, FakePragmatic, Play
+from src.database import async_session, engine
+from src.providers.freespins import CampaignRun
+from src.providers.models import FreespinCampaign
+from src.providers.pragmatic.client import pragmatic_client
+from src.providers.service import FreespinCampaignService
+from src.settings import Settings
+from src.tests.helpers import create_funded_user
+
+PORT = 8802
+
+
+def test_concurrent_runs_send_every_player_once():
+    Settings.PRAGMATIC_BASE_API_URL = f"http://127.0.0.1:{PORT}"
+    Settings.PRAGMATIC_MERCHANT_ID = Settings.PRAGMATIC_MERCHANT_ID or "test"
+    Settings.PRAGMATIC_MERCHANT_KEY = Settings.PRAGMATIC_MERCHANT_KEY or "test"
+
+    async def run():
+        fake = FakePragmatic(Faults(latency=0.01, jitter=0.005), Play())
+        runner = web.AppRunner(fake.app())
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", PORT).start()
+        try:
+            user_ids = [await create_funded_user(Decimal(0)) for _ in range(40)]
+            campaign = f'test-{uuid.uuid4().hex[:10]}'
+            now = int(time.time())
+            async with FreespinCampaignService('pragmatic') as service:
+                await service.create_campaign(
+                    campaign,
+                    {'game_uuid': 'vs20doghouse', 'currency': 'USD', 'quantity': 10,
+                     'valid_from': now, 'valid_until': now + 86400},
+                    {'user_ids': user_ids}
+                )
+            # Small batches so both runs keep claiming from the same rows
+            await asyncio.gather(*(
+                CampaignRun(campaign, workers=4, rate=200, batch=5).run() for _ in range(2)
+            ))
+            async with async_session() as session:
+                statuses = (await session.execute(
+                    select(FreespinCampaign.status).where(FreespinCampaign.campaign == campaign)
+                )).scalars().all()
+        finally:
+            await pragmatic_client.close()
+            await runner.cleanup()
+            await engine.dispose()
+        return fake.snapshot(), statuses
+
+    server, statuses = asyncio.run(run())
+
+    assert server['requests']['/freespins/set'] == 40
+    # No row was claimed twice, so none needed checking for an earlier attempt
+    assert '/freespins/get' not in server['requests']
+    assert server['freespins'] == 40
+    assert statuses == ['issued'] * 40
@@ -0,0 +1,129 @@
+"""Statements issued by provider refunds and rollbacks, checked without a
+database: their number must not grow with the rolled back transactions and
+booked transactions must never be updated."""
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+import src.support.models  # noqa: F401  (registers Ticket/Message for the User mapper)
+from src.providers.service import ProviderWalletService
+from src.wallet.models import TransactionStatus, TransactionType
+
+
+class Result:
+    def __init__(self, value):
+        self.value = value
+
+    def all(self):
+        return self.value
+
+    def scalar_one_or_none(self):
+        return self.value
+
+
+class RecordingSession:
+    """Answers statements with canned results, in order, and keeps them."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.statements = []
+        self.committed = False
+
+    async def execute(self, stmt):
+        self.statements.append(stmt)
+        return Result(self.results.pop(0))
+
+    async def commit(self):
+        self.committed = True
+
+    async def rollback(self):
+        raise AssertionError('unexpected rollback')
+
+
+def claimed(transaction_id: str, action: str, amount: int, wallet_id: int):
+    return SimpleNamespace(provider_transaction_id=transaction_id, action=action,
+                           transaction_id=wallet_id, amount=Decimal(amount))
+
+
+def booked(wallet_id: int, type: TransactionType, amount: int):
+    return SimpleNamespace(id=wallet_id, user_id=1, type=type, status=TransactionStatus.CONFIRMED,
+                           amount=Decimal(amount), created_at=datetime.now())
+
+
+def params(stmt) -> dict:
+    return stmt.compile(dialect=postgresql.dialect()).params
+
+
+def rollback(session: RecordingSession, ids: list):
+    service = ProviderWalletService('test')
+    service.session = session
+    return asyncio.run(service.rollback(1, 'rollback', ids))
+
+
+def test_rollback_of_many_transactions_books_compensations_in_one_insert():
+    bets = [claimed(f'bet-{i}', 'bet', 2, i) for i in range(50)]
+    wins = [claimed(f'win-{i}', 'win', 3, 100 + i) for i in range(20)]
+    session = RecordingSession(
+        bets + wins,
+        [booked(1000 + i, TransactionType.REFUND, 2) for i in range(50)]
+        + [booked(2000 + i, TransactionType.REVERSAL, 3) for i in range(20)],
+        Decimal(140),
+        None,
+        None,
+        1,
+    )
+    ids = [target.provider_transaction_id for target in bets + wins]
+
+    result = rollback(session, ids + ids[:10] + ['unknown'])
+
+    claim, compensate, apply, rollups, void, record = session.statements
+    assert [stmt.table.name for stmt in session.statements] == [
+        'provider_transactions', 'transactions', 'wallet_balances',
+        'wallet_daily_rollups', 'provider_transactions', 'provider_transactions'
+    ]
+    # Duplicates are claimed once, in a single array parameter
+    assert params(claim)['ids'] == ids + ['unknown']
+    assert compensate.is_insert
+    types = [value for name, value in params(compensate).items() if name.startswith('type_m')]
+    assert types == [TransactionType.REFUND] * 50 + [TransactionType.REVERSAL] * 20
+    # The stakes come back, the wins are taken back
+    assert Decimal(100) - Decimal(60) in params(apply).values()
+    assert 'unknown' in params(void).values()
+    assert session.committed
+    assert result.balance == Decimal(140)
+
+
+def test_rollback_never_updates_booked_transactions():
+    session = RecordingSession(
+        [claimed('bet', 'bet', 5, 1)],
+        [booked(10, TransactionType.REFUND, 5)],
+        Decimal(5),
+        None,
+        1,
+    )
+
+    rollback(session, ['bet'])
+
+    assert not any(stmt.is_update and stmt.table.name == 'transactions' for stmt in session.statements)
+
+
+def test_refund_books_one_refund_of_the_stake():
+    session = RecordingSession(
+        [claimed('bet', 'bet', 7, 1)],
+        [booked(10, TransactionType.REFUND, 7)],
+        Decimal(7),
+        None,
+        1,
+    )
+    service = ProviderWalletService('test')
+    service.session = session
+
+    result = asyncio.run(service.refund(1, 'refund', 'bet'))
+
+    compensate = session.statements[1]
+    assert params(compensate)['type_m0'] == TransactionType.REFUND
+    assert params(compensate)['amount_m0'] == Decimal(7)
+    assert result.transaction_id == 10
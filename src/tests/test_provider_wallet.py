@@ -0,0 +1,165 @@
+"""Provider wallet callbacks: bets, wins, refunds and rollbacks settled
+against the ledger, runs against the configured Postgres database (see src/.env)."""
+import asyncio
+import os
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from src.database import engine
+from src.providers.service import ProviderWalletService
+from src.tests.helpers import create_funded_user
+from src.wallet.service import InsufficientFunds, TransactionService
+
+# p99 latency of a bet callback with many players betting in parallel
+MAX_BET_P99_SECONDS = float(os.environ.get('MAX_BET_P99_SECONDS', 0.25))
+
+
+async def bet(user_id: int, transaction_id: str, amount: Decimal):
+    async with ProviderWalletService('test') as service:
+        try:
+            return await service.bet(user_id, transaction_id, amount)
+        except InsufficientFunds:
+            return None
+
+
+def test_parallel_bets_never_overdraw_and_retries_settle_once():
+    async def run():
+        user_id = await create_funded_user(Decimal(100))
+        prefix = uuid.uuid4().hex
+        # 20 distinct bets, each delivered three times
+        results = await asyncio.gather(*(
+            bet(user_id, f'{prefix}-{i}', Decimal(10))
+            for i in range(20)
+            for _ in range(3)
+        ))
+        async with TransactionService() as service:
+            balances = await service.get_balances(user_id, cached=False)
+        await engine.dispose()
+        return results, balances
+
+    results, balances = asyncio.run(run())
+
+    booked = {result.transaction_id for result in results if result is not None}
+    assert len(booked) == 10
+    assert balances.balance == 0
+
+
+def test_refund_and_rollback_restore_the_balance_once():
+    async def run():
+        user_id = await create_funded_user(Decimal(100))
+        prefix = uuid.uuid4().hex
+        async with ProviderWalletService('test') as service:
+            await service.bet(user_id, f'{prefix}-bet-1', Decimal(30))
+        async with ProviderWalletService('test') as service:
+            await service.win(user_id, f'{prefix}-win-1', Decimal(50))
+        async with ProviderWalletService('test') as service:
+            await service.bet(user_id, f'{prefix}-bet-2', Decimal(20))
+        async with ProviderWalletService('test') as service:
+            refunded = await service.refund(user_id, f'{prefix}-refund', f'{prefix}-bet-2')
+        async with ProviderWalletService('test') as service:
+            # A second refund of the same bet returns nothing
+            await service.refund(user_id, f'{prefix}-refund-again', f'{prefix}-bet-2')
+        async with ProviderWalletService('test') as service:
+            rolled_back = await service.rollback(
+                user_id, f'{prefix}-rollback', [f'{prefix}-bet-1', f'{prefix}-win-1', f'{prefix}-late']
+            )
+        async with ProviderWalletService('test') as service:
+            # The bet rolled back before it arrived is never booked
+            late = await service.bet(user_id, f'{prefix}-late', Decimal(40))
+
+        async with TransactionService() as service:
+            balances = await service.get_balances(user_id, cached=False)
+            rebuilt = await service.aggregate_balances(user_id)
+        await engine.dispose()
+        return refunded, rolled_back, late, balances, rebuilt
+
+    refunded, rolled_back, late, balances, rebuilt = asyncio.run(run())
+
+    assert refunded.balance == Decimal(120)
+    assert rolled_back.balance == Decimal(100)
+    assert late.replayed and late.transaction_id is None
+    assert balances.balance == Decimal(100)
+    assert rebuilt.balance == balances.balance
+
+
+def test_rollback_of_many_bets_reverses_each_once():
+    async def run():
+        user_id = await create_funded_user(Decimal(100))
+        prefix = uuid.uuid4().hex
+        ids = [f'{prefix}-bet-{i}' for i in range(50)]
+        for transaction_id in ids:
+            await bet(user_id, transaction_id, Decimal(1))
+        async with ProviderWalletService('test') as service:
+            rolled_back = await service.rollback(user_id, f'{prefix}-rollback', ids + ids[:5])
+        async with ProviderWalletService('test') as service:
+            # Another rollback naming the same bets moves nothing
+            again = await service.rollback(user_id, f'{prefix}-rollback-again', ids[:10])
+
+        async with TransactionService() as service:
+            balances = await service.get_balances(user_id, cached=False)
+            rebuilt = await service.aggregate_balances(user_id)
+        await engine.dispose()
+        return rolled_back, again, balances, rebuilt
+
+    rolled_back, again, balances, rebuilt = asyncio.run(run())
+
+    assert rolled_back.balance == Decimal(100)
+    assert again.balance == Decimal(100) and again.transaction_id is None
+    assert balances.balance == Decimal(100)
+    assert rebuilt.balance == balances.balance
+
+
+def test_rollback_behind_a_balance_checkpoint():
+    async def run():
+        user_id = await create_funded_user(Decimal(100))
+        prefix = uuid.uuid4().hex
+        await bet(user_id, f'{prefix}-bet', Decimal(30))
+        async with ProviderWalletService('test') as service:
+            await service.win(user_id, f'{prefix}-win', Decimal(50))
+        async with TransactionService() as service:
+            # The bet and the win are now behind the watermark
+            watermark = await service.checkpoint_balance(user_id, lag=timedelta(0))
+        async with ProviderWalletService('test') as service:
+            rolled_back = await service.rollback(user_id, f'{prefix}-rollback', [f'{prefix}-bet', f'{prefix}-win'])
+
+        async with TransactionService() as service:
+            aggregated = await service.aggregate_balances(user_id)
+        async with TransactionService() as service:
+            await service.rebuild_balances(user_id)
+        async with TransactionService() as service:
+            rebuilt = await service.get_balances(user_id, cached=False)
+        await engine.dispose()
+        return watermark, rolled_back, aggregated, rebuilt
+
+    watermark, rolled_back, aggregated, rebuilt = asyncio.run(run())
+
+    assert watermark is not None
+    assert rolled_back.balance == Decimal(100)
+    assert aggregated.balance == Decimal(100)
+    assert rebuilt.balance == Decimal(100)
+
+
+def test_bet_latency_of_parallel_players():
+    # A player's spins come one after another, players play in parallel
+    players, bets = 5, 20
+
+    async def play(user_id: int, prefix: str) -> list:
+        latencies = []
+        for i in range(bets):
+            started = time.perf_counter()
+            await bet(user_id, f'{prefix}-{user_id}-{i}', Decimal(1))
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    async def run():
+        user_ids = await asyncio.gather(*(create_funded_user(Decimal(bets)) for _ in range(players)))
+        prefix = uuid.uuid4().hex
+        latencies = await asyncio.gather(*(play(user_id, prefix) for user_id in user_ids))
+        await engine.dispose()
+        return sorted(latency for player in latencies for latency in player)
+
+    latencies = asyncio.run(run())
+
+    assert latencies[int(len(latencies) * 0.99) - 1] <= MAX_BET_P99_SECONDS
@@ -0,0 +1,58 @@
+"""Circuit breaker and bulkhead of provider calls, without a provider."""
+import asyncio
+
+import aiohttp
+import pytest
+
+from src.providers.resilience import Bulkhead, BulkheadFull, CircuitBreaker, ProviderGuard
+
+
+async def fail():
+    raise aiohttp.ServerDisconnectedError()
+
+
+async def succeed():
+    return 'ok'
+
+
+def test_probe_rejected_by_a_full_bulkhead_is_given_back():
+    async def run():
+        guard = ProviderGuard('test', CircuitBreaker('test', failure_threshold=1, reset_timeout=0),
+                              Bulkhead('test', limit=1), deadline=1)
+        with pytest.raises(aiohttp.ServerDisconnectedError):
+            await guard.attempt(fail)
+        assert guard.breaker.state == CircuitBreaker.HALF_OPEN
+
+        # Another call holds the only slot when the probe comes
+        await guard.bulkhead.acquire()
+        with pytest.raises(BulkheadFull):
+            await guard.attempt(succeed)
+        guard.bulkhead.release()
+
+        return await guard.attempt(succeed), guard.breaker.state
+
+    result, state = asyncio.run(run())
+
+    assert result == 'ok'
+    assert state == CircuitBreaker.CLOSED
+
+
+def test_probe_cut_off_while_waiting_for_the_bulkhead_is_given_back():
+    async def run():
+        guard = ProviderGuard('test', CircuitBreaker('test', failure_threshold=1, reset_timeout=0),
+                              Bulkhead('test', limit=1, max_wait=10), deadline=0.05)
+        with pytest.raises(aiohttp.ServerDisconnectedError):
+            await guard.attempt(fail)
+
+        await guard.bulkhead.acquire()
+        with pytest.raises(TimeoutError):
+            await guard.run(lambda: guard.attempt(succeed))
+        guard.bulkhead.release()
+
+        return await guard.attempt(succeed), guard.breaker.state, guard.deadline_exceeded
+
+    result, state, deadline_exceeded = asyncio.run(run())
+
+    assert result == 'ok'
+    assert state == CircuitBreaker.CLOSED
+    assert deadline_exceeded == 1
@@ -0,0 +1,98 @@
+"""Concurrency stress test of the withdrawal path, runs against the configured
+Postgres database (see src/.env)."""
+import asyncio
+import os
+import time
+import uuid
+from decimal import Decimal
+
+from src.database import engine
+from src.tests.helpers import create_funded_user
+from src.wallet.idempotency import IdempotentRequest, idempotency_cache
+from src.wallet.models import PaymentSystem, WalletBalance
+from src.wallet.schemas import CreateDeposit, CreateWithdrawal, ReadTransaction
+from src.wallet.service import InsufficientFunds, TransactionService
+
+# Withdrawals per second the path must sustain with many users in parallel
+MIN_WITHDRAWALS_PER_SECOND = float(os.environ.get('MIN_WITHDRAWALS_PER_SECOND', 50))
+
+
+async def withdraw(user_id: int, amount: Decimal) -> bool:
+    async with TransactionService() as service:
+        try:
+            await service.create_withdrawal(user_id, CreateWithdrawal(
+                payment_system=PaymentSystem.card,
+                amount=amount
+            ))
+            return True
+        except InsufficientFunds:
+            return False
+
+
+def test_parallel_withdrawals_never_overdraw():
+    async def run():
+        user_id = await create_funded_user(Decimal(100))
+        results = await asyncio.gather(*(withdraw(user_id, Decimal(10)) for _ in range(50)))
+
+        async with TransactionService() as service:
+            wallet = await service.session.get(WalletBalance, user_id)
+        await engine.dispose()
+        return results, wallet
+
+    results, wallet = asyncio.run(run())
+
+    assert sum(results) == 10
+    assert wallet.reserved == Decimal(100)
+    assert wallet.balance - wallet.bonus - wallet.reserved == 0
+
+
+def test_parallel_withdrawals_of_different_users_are_not_serialized():
+    users, per_user = 20, 10
+
+    async def run():
+        user_ids = await asyncio.gather(*(create_funded_user(Decimal(per_user)) for _ in range(users)))
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            withdraw(user_id, Decimal(1))
+            for user_id in user_ids
+            for _ in range(per_user)
+        ))
+        elapsed = time.perf_counter() - started
+        await engine.dispose()
+        return results, elapsed
+
+    results, elapsed = asyncio.run(run())
+
+    assert all(results)
+    assert len(results) / elapsed >= MIN_WITHDRAWALS_PER_SECOND
+
+
+def test_retried_deposits_with_one_idempotency_key_create_one_transaction():
+    deposit = CreateDeposit(payment_system=PaymentSystem.card, amount=Decimal(10))
+
+    async def retry(user_id: int, key: str):
+        async with TransactionService() as service:
+            idempotency = IdempotentRequest(user_id, key, '/wallet/deposit', deposit)
+            stored = await service.claim_idempotency_key(idempotency)
+            if stored is not None:
+                return stored.body
+            db_transaction = await service.create_deposit(user_id, deposit, idempotency=idempotency)
+            return ReadTransaction.model_validate(db_transaction).model_dump(mode='json')
+
+    async def run():
+        user_id = await create_funded_user(Decimal(0))
+        key = uuid.uuid4().hex
+        responses = await asyncio.gather(*(retry(user_id, key) for _ in range(10)))
+        # The hot cache answers without Postgres, the table must answer alike
+        idempotency_cache.clear()
+        responses.append(await retry(user_id, key))
+
+        async with TransactionService() as service:
+            balances = await service.get_balances(user_id, cached=False)
+        await engine.dispose()
+        return responses, balances
+
+    responses, balances = asyncio.run(run())
+
+    assert len({response['id'] for response in responses}) == 1
+    assert balances.balance == Decimal(10)
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Awaitable, Callable, Dict, Hashable, NamedTuple, Optional
+
+from src.cache import TTLCache
+from src.settings import Settings
+
+from .schemas import ReadBalance
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """Per-process backend, only consistent when the API runs a single worker."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Version of the last invalidation of each user, and of the last clear
+        self._invalidated = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._cleared = 0
+        self._version = 0
+
+    async def get(self, user_id: int) -> Optional[ReadBalance]:
+        return self._cache.get(user_id)
+
+    async def token(self, user_id: int) -> int:
+        return self._version
+
+    async def set(self, user_id: int, balances: ReadBalance, token: int) -> bool:
+        if max(self._invalidated.get(user_id, 0), self._cleared) > token:
+            return False
+        self._cache.set(user_id, balances)
+        return True
+
+    async def delete(self, *user_ids: int):
+        self._version += 1
+        for user_id in user_ids:
+            self._cache.delete(user_id)
+            self._invalidated.set(user_id, self._version)
+
+    async def clear(self):
+        self._version += 1
+        self._cleared = self._version
+        self._cache.clear()
+
+
+class RedisBackend:
+    """Backend shared by all workers; eviction is left to Redis' maxmemory policy."""
+
+    prefix = 'wallet:balance:'
+    generation_prefix = 'wallet:balance-generation:'
+    epoch_key = 'wallet:balance-epoch'
+
+    # Stores the balances only if neither the user nor the whole cache was
+    # invalidated since the token was read
+    _set_if_current = """
+        local current = (redis.call('get', KEYS[1]) or '0') .. ':' .. (redis.call('get', KEYS[2]) or '0')
+        if current ~= ARGV[1] then
+            return 0
+        end
+        redis.call('set', KEYS[3], ARGV[2], 'px', ARGV[3])
+        return 1
+    """
+
+    def __init__(self, ttl: float):
+        from redis import asyncio as aioredis
+
+        self.ttl = ttl
+        self._redis = aioredis.Redis(
+            host=Settings.REDIS_HOST,
+            port=int(Settings.REDIS_PORT or 6379),
+            password=Settings.REDIS_PASSWORD,
+        )
+
+    async def get(self, user_id: int) -> Optional[ReadBalance]:
+        raw = await self._redis.get(f'{self.prefix}{user_id}')
+        return ReadBalance.model_validate_json(raw) if raw else None
+
+    async def token(self, user_id: int) -> str:
+        epoch, generation = await self._redis.mget(self.epoch_key, f'{self.generation_prefix}{user_id}')
+        return f"{int(epoch or 0)}:{int(generation or 0)}"
+
+    async def set(self, user_id: int, balances: ReadBalance, token: str) -> bool:
+        stored = await self._redis.eval(
+            self._set_if_current, 3,
+            self.epoch_key, f'{self.generation_prefix}{user_id}', f'{self.prefix}{user_id}',
+            token, balances.model_dump_json(), int(self.ttl * 1000)
+        )
+        return bool(stored)
+
+    async def delete(self, *user_ids: int):
+        if user_ids:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.delete(*(f'{self.prefix}{user_id}' for user_id in user_ids))
+                for user_id in user_ids:
+                    # Outlives any read that started before the invalidation
+                    pipe.incr(f'{self.generation_prefix}{user_id}')
+                    pipe.pexpire(f'{self.generation_prefix}{user_id}', int(self.ttl * 1000))
+                await pipe.execute()
+
+    async def clear(self):
+        await self._redis.incr(self.epoch_key)
+        async for key in self._redis.scan_iter(match=f'{self.prefix}*'):
+            await self._redis.delete(key)
+
+
+class BalanceCache:
+    """Read-through cache of `ReadBalance` by user id.
+
+    Writers must call `invalidate` after committing a `Transaction`. Readers
+    that miss take a `token` before querying the database and pass it to
+    `set`, which drops the fill if an invalidation came in between: the read
+    may predate that commit. Backend failures are logged and treated as
+    misses, the database stays the source of truth.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_fills = 0
+        self.errors = 0
+
+    async def get(self, user_id: int) -> Optional[ReadBalance]:
+        try:
+            balances = await self.backend.get(user_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Balance cache read failed for user {user_id}: {e}")
+            balances = None
+
+        if balances is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return balances
+
+    async def token(self, user_id: int) -> Optional[Hashable]:
+        try:
+            return await self.backend.token(user_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Balance cache token read failed for user {user_id}: {e}")
+            return None
+
+    async def set(self, user_id: int, balances: ReadBalance, token: Optional[Hashable]):
+        if token is None:
+            return
+        try:
+            if not await self.backend.set(user_id, balances, token):
+                self.stale_fills += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Balance cache write failed for user {user_id}: {e}")
+
+    async def invalidate(self, *user_ids: int):
+        self.invalidations += len(user_ids)
+        try:
+            await self.backend.delete(*user_ids)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Balance cache invalidation failed for users {user_ids}: {e}")
+
+    async def clear(self):
+        try:
+            await self.backend.clear()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Balance cache clear failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'stale_fills': self.stale_fills,
+            'errors': self.errors,
+        }
+
+
+def create_balance_cache() -> BalanceCache:
+    if Settings.BALANCE_CACHE_BACKEND == 'redis':
+        backend = RedisBackend(Settings.BALANCE_CACHE_TTL)
+    else:
+        backend = MemoryBackend(Settings.BALANCE_CACHE_MAXSIZE, Settings.BALANCE_CACHE_TTL)
+    return BalanceCache(backend)
+
+
+balance_cache = create_balance_cache()
+
+
+class ActivePromoCode(NamedTuple):
+    id: int
+    amount: Decimal
+    expires_at: Optional[datetime]
+
+
+class PromoCodeCache:
+    """Per-process snapshot of active promo codes.
+
+    Unknown codes are rejected without touching Postgres; a known code is
+    only a hint, the redemption UPDATE re-checks limits and expiry.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.rejected = 0
+        self._codes: Dict[str, ActivePromoCode] = {}
+        self._loaded_at = float('-inf')
+        self._lock = asyncio.Lock()
+
+    async def get(
+        self,
+        code: str,
+        load: Callable[[], Awaitable[Dict[str, ActivePromoCode]]]
+    ) -> Optional[ActivePromoCode]:
+        if time.monotonic() - self._loaded_at > self.ttl:
+            async with self._lock:
+                if time.monotonic() - self._loaded_at > self.ttl:
+                    self._codes = await load()
+                    self._loaded_at = time.monotonic()
+
+        promo = self._codes.get(code)
+        if promo is None or (promo.expires_at is not None and promo.expires_at <= datetime.now()):
+            self.rejected += 1
+            return None
+        return promo
+
+    def invalidate(self):
+        self._loaded_at = float('-inf')
+
+
+promo_code_cache = PromoCodeCache(Settings.PROMO_CODE_CACHE_TTL)
@@ -0,0 +1,43 @@
+import asyncio
+from datetime import timedelta
+
+import click
+
+import src.support.models  # noqa: F401  (registers Ticket/Message for the User mapper)
+from src.wallet.service import TransactionService
+
+
+async def compact(threshold: int, batch: int, lag: timedelta) -> int:
+    """Checkpoints every user whose delta grew past `threshold` rows."""
+    async with TransactionService() as service:
+        user_ids = await service.get_checkpoint_candidates(threshold, batch)
+
+    moved = 0
+    for user_id in user_ids:
+        async with TransactionService() as service:
+            if await service.checkpoint_balance(user_id, lag) is not None:
+                moved += 1
+    return moved
+
+
+@click.command()
+@click.option("--threshold", default=1000, type=int, help="Rows after the watermark that trigger a checkpoint.")
+@click.option("--batch", default=500, type=int, help="Maximum users checkpointed per run.")
+@click.option("--lag-minutes", default=10, type=int, help="Leave rows younger than this out of checkpoints.")
+@click.option("--interval", default=0, type=int, help="Seconds between runs; 0 runs once and exits.")
+def main(threshold: int, batch: int, lag_minutes: int, interval: int) -> None:
+    """Compacts transaction history into balance_checkpoints."""
+
+    async def run():
+        while True:
+            moved = await compact(threshold, batch, timedelta(minutes=lag_minutes))
+            print(f"Checkpointed {moved} users")
+            if not interval:
+                break
+            await asyncio.sleep(interval)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
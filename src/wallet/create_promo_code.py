@@ -0,0 +1,36 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+import click
+
+import src.support.models  # noqa: F401  (registers Ticket/Message for the User mapper)
+from src.wallet.service import PromoCodeService
+
+
+@click.command()
+@click.option("--code", required=True, type=str)
+@click.option("--amount", required=True, type=str)
+@click.option("--max-redemptions", required=False, type=int, help="Total redemptions allowed, unlimited if omitted.")
+@click.option("--per-user-limit", default=1, type=int)
+@click.option("--expires-at", required=False, type=click.DateTime(), help="Expiry time, never expires if omitted.")
+def main(
+    code: str,
+    amount: str,
+    max_redemptions: Optional[int],
+    per_user_limit: int,
+    expires_at: Optional[datetime]
+) -> None:
+    """Creates a promo code that credits `amount` bonuses when redeemed."""
+
+    async def create_promo_code():
+        async with PromoCodeService() as service:
+            await service.create_promo_code(code, Decimal(amount), max_redemptions, per_user_limit, expires_at)
+        print(f"Promo code {code} was created successfully")
+
+    asyncio.run(create_promo_code())
+
+
+if __name__ == "__main__":
+    main()
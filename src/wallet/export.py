@@ -0,0 +1,75 @@
+import csv
+import enum
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import AsyncIterator
+
+from sqlalchemy.engine import Row
+
+from .models import Transaction
+
+EXPORT_COLUMNS = (
+    Transaction.id,
+    Transaction.user_id,
+    Transaction.type,
+    Transaction.status,
+    Transaction.payment_system,
+    Transaction.amount,
+    Transaction.from_account,
+    Transaction.to_account,
+    Transaction.created_at,
+)
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+# Rows rendered per chunk handed to the response
+CHUNK_ROWS = 500
+
+MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def to_ndjson(rows: AsyncIterator[Row]) -> AsyncIterator[str]:
+    lines = []
+    async for row in rows:
+        lines.append(json.dumps({field: _plain(value) for field, value in zip(EXPORT_FIELDS, row)}))
+        if len(lines) >= CHUNK_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+async def to_csv(rows: AsyncIterator[Row]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+
+    written = 0
+    async for row in rows:
+        writer.writerow([_plain(value) for value in row])
+        written += 1
+        if written % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+FORMATTERS = {
+    'ndjson': to_ndjson,
+    'csv': to_csv,
+}
@@ -0,0 +1,121 @@
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, NamedTuple, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.cache import TTLCache
+from src.settings import Settings
+
+from .models import IdempotencyKey
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a different request."""
+    pass
+
+
+class StoredResponse(NamedTuple):
+    request_hash: str
+    status_code: int
+    body: Any
+
+
+# Immediate retries of the same worker are answered without a DB round trip
+idempotency_cache = TTLCache(maxsize=Settings.IDEMPOTENCY_CACHE_MAXSIZE, ttl=Settings.IDEMPOTENCY_CACHE_TTL)
+
+
+class IdempotentRequest:
+    """A wallet mutation sent with an `Idempotency-Key` header.
+
+    `claim` runs in the same transaction as the mutation and `save` right
+    before its commit, so the key, the response and the `Transaction` rows
+    become visible together. A concurrent duplicate blocks on the unique
+    index until then and replays the stored response; if the first request
+    rolls back, the duplicate claims the key and runs instead.
+    """
+
+    def __init__(self, user_id: int, key: str, endpoint: str, payload: BaseModel):
+        self.user_id = user_id
+        self.key = key
+        self.endpoint = endpoint
+        self.request_hash = hashlib.sha256(
+            f'{endpoint}\n{payload.model_dump_json()}'.encode()
+        ).hexdigest()
+        self._stored: Optional[StoredResponse] = None
+
+    async def claim(self, session: AsyncSession) -> Optional[StoredResponse]:
+        """Claims the key, or returns the response stored under it.
+
+        Raises `IdempotencyKeyReused` when the key belongs to another request.
+        """
+        stored = idempotency_cache.get((self.user_id, self.key))
+        if stored is None:
+            now = datetime.now()
+            values = dict(
+                user_id=self.user_id,
+                key=self.key,
+                endpoint=self.endpoint,
+                request_hash=self.request_hash,
+                status_code=None,
+                response=None,
+                created_at=now,
+                expires_at=now + timedelta(seconds=Settings.IDEMPOTENCY_KEY_TTL),
+            )
+            stmt = insert(IdempotencyKey).values(**values)
+            # An expired key is reclaimed in place instead of waiting for a purge
+            stmt = stmt.on_conflict_do_update(
+                constraint='uq_idempotency_keys_user_key',
+                set_={name: getattr(stmt.excluded, name) for name in values if name not in ('user_id', 'key')},
+                where=IdempotencyKey.expires_at <= now
+            ).returning(IdempotencyKey.id)
+            if (await session.execute(stmt)).first() is not None:
+                return None
+
+            row = (await session.execute(
+                select(IdempotencyKey.request_hash, IdempotencyKey.status_code, IdempotencyKey.response)
+                .where(IdempotencyKey.user_id == self.user_id, IdempotencyKey.key == self.key)
+            )).one()
+            stored = StoredResponse(row.request_hash, row.status_code, row.response)
+            self._remember(stored)
+
+        if stored.request_hash != self.request_hash:
+            raise IdempotencyKeyReused()
+        return stored
+
+    async def save(self, session: AsyncSession, body: Any, status_code: int = 200):
+        """Stores the response of the claimed key, call before committing."""
+        await session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.user_id == self.user_id, IdempotencyKey.key == self.key)
+            .values(status_code=status_code, response=body)
+        )
+        self._stored = StoredResponse(self.request_hash, status_code, body)
+
+    def committed(self):
+        """Caches the saved response once its transaction is committed."""
+        if self._stored is not None:
+            self._remember(self._stored)
+
+    def _remember(self, stored: StoredResponse):
+        idempotency_cache.set((self.user_id, self.key), stored)
+
+
+async def purge_expired_keys(session: AsyncSession, limit: int) -> int:
+    """Deletes up to `limit` expired keys, returns how many were removed."""
+    expired = (
+        select(IdempotencyKey.id)
+        .where(IdempotencyKey.expires_at <= datetime.now())
+        .order_by(IdempotencyKey.expires_at)
+        .limit(limit)
+    )
+    result = await session.execute(
+        delete(IdempotencyKey)
+        .where(IdempotencyKey.id.in_(expired.scalar_subquery()))
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return result.rowcount
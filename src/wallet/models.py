@@ -1,8 +1,10 @@
 import enum
 from datetime import datetime
 
-from sqlalchemy import (DECIMAL, Column, DateTime, Enum, ForeignKey, Integer,
-                        String)
+from sqlalchemy import (DECIMAL, Boolean, Column, Date, DateTime, Enum, ForeignKey,
+                        Index, Integer, PrimaryKeyConstraint, String,
+                        UniqueConstraint, text)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
 from src.database import Base
@@ -13,6 +15,12 @@ class TransactionType(enum.Enum):
     OUT = 1
     BONUS = 2
     REFERRAL = 3
+    # Game provider stakes, wins and refunded stakes, see `src.providers.service`
+    BET = 4
+    WIN = 5
+    REFUND = 6
+    # Takes back a win the provider rolled back
+    REVERSAL = 7
 
 
 class PaymentSystem(enum.Enum):
@@ -31,8 +39,9 @@ class TransactionStatus(enum.Enum):
 
 
 class Transaction(Base):
+    """Partitioned by month of `created_at`, see `src.wallet.partitions`."""
     __tablename__ = 'transactions'
-    id = Column(Integer, primary_key=True, unique=True)
+    id = Column(Integer, autoincrement=True)
     payment_system = Column(Enum(PaymentSystem), nullable=False)
     type = Column(Enum(TransactionType), nullable=False)
     amount = Column(DECIMAL, nullable=False)
@@ -40,10 +49,131 @@ class Transaction(Base):
     from_account = Column(String, default='')
     to_account = Column(String, default='')
 
-    created_at = Column(DateTime, default=datetime.now)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
 
     status = Column(Enum(TransactionStatus), default=TransactionStatus.CONFIRMED, nullable=False)
 
     user_id = Column(Integer, ForeignKey('users.id'))
     user = relationship('User', back_populates='transactions')
 
+    __table_args__ = (
+        # Unique constraints of a partitioned table must include the partition key
+        PrimaryKeyConstraint('id', 'created_at', name='transactions_pkey'),
+        # History pages (keyset on created_at, id), counts and balance
+        # aggregates; the INCLUDE columns make the latter index-only scans
+        Index(
+            'ix_transactions_user_created',
+            user_id, created_at.desc(), id.desc(),
+            postgresql_include=['type', 'status', 'amount']
+        ),
+        # Rows after a balance checkpoint watermark
+        Index(
+            'ix_transactions_user_id_id',
+            user_id, id,
+            postgresql_include=['type', 'status', 'amount']
+        ),
+        # Latest transaction of a type: last bonus earn, last withdrawal
+        Index('ix_transactions_user_type_created', user_id, type, created_at.desc()),
+        # Admin queue of withdrawals waiting for a decision
+        Index(
+            'ix_transactions_pending_withdrawals',
+            created_at,
+            postgresql_where=text("type = 'OUT' AND status = 'PENDING'")
+        ),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+    # Ids come from one sequence and stay unique across partitions
+    __mapper_args__ = {'primary_key': [id]}
+
+
+
+class WalletBalance(Base):
+    """Materialized balance ledger, kept in sync with `transactions`."""
+    __tablename__ = 'wallet_balances'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+
+    balance = Column(DECIMAL, nullable=False, default=0)
+    bonus = Column(DECIMAL, nullable=False, default=0)
+    pure = Column(DECIMAL, nullable=False, default=0)
+    # Sum of PENDING withdrawals, not yet debited but no longer available
+    reserved = Column(DECIMAL, nullable=False, default=0)
+
+    last_bonus_claim_at = Column(DateTime, nullable=True)
+
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class BalanceCheckpoint(Base):
+    """Confirmed balance components of all the user's transactions up to
+    `last_transaction_id`; balances are this snapshot plus the rows after it.
+    """
+    __tablename__ = 'balance_checkpoints'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    last_transaction_id = Column(Integer, nullable=False)
+
+    balance = Column(DECIMAL, nullable=False, default=0)
+    bonus = Column(DECIMAL, nullable=False, default=0)
+    pure = Column(DECIMAL, nullable=False, default=0)
+
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class WalletDailyRollup(Base):
+    """Sum and count of a user's transactions per creation day, type and
+    status; kept in sync with `transactions` like `WalletBalance`.
+    """
+    __tablename__ = 'wallet_daily_rollups'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    type = Column(Enum(TransactionType), primary_key=True)
+    status = Column(Enum(TransactionStatus), primary_key=True)
+
+    amount = Column(DECIMAL, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class PromoCode(Base):
+    __tablename__ = 'promo_codes'
+    id = Column(Integer, primary_key=True)
+    code = Column(String, nullable=False, unique=True, index=True)
+    amount = Column(DECIMAL, nullable=False)
+
+    # NULL means unlimited
+    max_redemptions = Column(Integer, nullable=True)
+    redemptions_count = Column(Integer, nullable=False, default=0)
+    per_user_limit = Column(Integer, nullable=False, default=1)
+
+    active = Column(Boolean, nullable=False, default=True)
+    expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class PromoCodeRedemption(Base):
+    __tablename__ = 'promo_code_redemptions'
+    promo_code_id = Column(Integer, ForeignKey('promo_codes.id'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    uses = Column(Integer, nullable=False, default=1)
+    last_used_at = Column(DateTime, default=datetime.now)
+
+
+class IdempotencyKey(Base):
+    """Response of a wallet mutation stored under the client's `Idempotency-Key`."""
+    __tablename__ = 'idempotency_keys'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    key = Column(String(255), nullable=False)
+    endpoint = Column(String, nullable=False)
+    # sha256 of the endpoint and request body, a reused key must match it
+    request_hash = Column(String(64), nullable=False)
+
+    # Written in the same transaction that claimed the key, so other
+    # requests never see them empty
+    status_code = Column(Integer, nullable=True)
+    response = Column(JSONB, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.now)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),
+    )
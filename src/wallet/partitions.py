@@ -0,0 +1,107 @@
+import asyncio
+from datetime import date, datetime
+from typing import List, Optional
+
+import click
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src.database import engine
+
+PARTITION_PREFIX = 'transactions_y'
+
+# Rows a detached partition may not hold: a PENDING status can still change,
+# rows after the owner's checkpoint watermark are still summed into balances
+UNSETTLED_ROWS = """
+    SELECT count(*) FROM {partition} t
+    LEFT JOIN balance_checkpoints c ON c.user_id = t.user_id
+    WHERE t.status = 'PENDING'
+       OR (t.user_id IS NOT NULL AND t.id > coalesce(c.last_transaction_id, 0))
+"""
+
+
+def add_months(month: date, months: int) -> date:
+    month_index = month.year * 12 + month.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{PARTITION_PREFIX}{month:%Y}m{month:%m}'
+
+
+async def get_partitions(conn: AsyncConnection) -> List[date]:
+    """First days of the months that have an attached partition."""
+    names = (await conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'transactions'::regclass AND c.relname LIKE :prefix
+    """), {'prefix': f'{PARTITION_PREFIX}%'})).scalars().all()
+    return sorted(date(int(name[-7:-3]), int(name[-2:]), 1) for name in names)
+
+
+async def create_partitions(conn: AsyncConnection, start: date, end: date) -> List[str]:
+    """Creates the missing monthly partitions for [start, end)."""
+    existing = set(await get_partitions(conn))
+    created = []
+    month = start.replace(day=1)
+    while month < end:
+        next_month = add_months(month, 1)
+        if month not in existing:
+            # Scans the DEFAULT partition for rows of this month, keep it empty
+            await conn.execute(text(
+                f"CREATE TABLE {partition_name(month)} PARTITION OF transactions "
+                f"FOR VALUES FROM ('{month}') TO ('{next_month}')"
+            ))
+            created.append(partition_name(month))
+        month = next_month
+    return created
+
+
+async def detach_partitions(before: date) -> List[str]:
+    """Detaches the partitions of months before `before` whose rows are all
+    settled and covered by balance checkpoints.
+
+    Each partition is detached in its own transaction, DETACH locks the whole
+    `transactions` table until commit. Detached tables are kept for
+    archiving; balances, history pages and exports no longer see them.
+    """
+    async with engine.connect() as conn:
+        months = [month for month in await get_partitions(conn) if month < before]
+
+    detached = []
+    for month in months:
+        name = partition_name(month)
+        async with engine.begin() as conn:
+            unsettled = (await conn.execute(text(UNSETTLED_ROWS.format(partition=name)))).scalar_one()
+            if unsettled:
+                click.echo(f"Keeping {name}: {unsettled} rows are pending or not covered by a balance checkpoint")
+                continue
+            await conn.execute(text(f'ALTER TABLE transactions DETACH PARTITION {name}'))
+        detached.append(name)
+    return detached
+
+
+@click.command()
+@click.option("--months-ahead", default=3, type=int, help="Months after the current one to create partitions for.")
+@click.option("--since", required=False, type=click.DateTime(["%Y-%m"]), help="Also create partitions from this month.")
+@click.option("--retention-months", required=False, type=int, help="Detach partitions older than this many months.")
+def main(months_ahead: int, since: Optional[datetime], retention_months: Optional[int]) -> None:
+    """Creates future monthly partitions of transactions and detaches old ones."""
+
+    async def run():
+        current = date.today().replace(day=1)
+        start = since.date() if since else current
+        async with engine.begin() as conn:
+            created = await create_partitions(conn, start, add_months(current, months_ahead + 1))
+        print(f"Created {len(created)} partitions: {', '.join(created)}")
+
+        if retention_months is not None:
+            detached = await detach_partitions(add_months(current, -retention_months))
+            print(f"Detached {len(detached)} partitions: {', '.join(detached)}")
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import asyncio
+
+import click
+
+import src.support.models  # noqa: F401  (registers Ticket/Message for the User mapper)
+import src.users.models  # noqa: F401
+from src.database import async_session
+from src.wallet.idempotency import purge_expired_keys
+
+
+@click.command()
+@click.option("--batch", default=10_000, type=int, help="Keys deleted per statement.")
+@click.option("--interval", default=0, type=int, help="Seconds between runs; 0 runs once and exits.")
+def main(batch: int, interval: int) -> None:
+    """Deletes expired idempotency keys."""
+
+    async def run():
+        while True:
+            purged = 0
+            async with async_session() as session:
+                while (deleted := await purge_expired_keys(session, batch)):
+                    purged += deleted
+            print(f"Purged {purged} idempotency keys")
+            if not interval:
+                break
+            await asyncio.sleep(interval)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import asyncio
+from typing import Optional
+
+import click
+
+import src.support.models  # noqa: F401  (registers Ticket/Message for the User mapper)
+from src.wallet.service import TransactionService
+
+
+@click.command()
+@click.option(
+    "--user-id",
+    required=False,
+    type=int,
+    help="Rebuild a single user's balance instead of the whole table.",
+)
+def main(user_id: Optional[int]) -> None:
+    """Rebuilds the wallet_balances ledger from the transactions history."""
+
+    async def rebuild():
+        async with TransactionService() as service:
+            rebuilt = await service.rebuild_balances(user_id)
+        print(f"Rebuilt {rebuilt} wallet balance rows")
+
+    asyncio.run(rebuild())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,56 @@
 import logging
-from datetime import timezone, datetime
-from decimal import Decimal
+from datetime import date, timedelta, timezone, datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Literal, Optional
 
+from src.users.models import UserRole
 from src.users.route import get_current_active_user
 from src.users.schemas import ReadProfile
-from src.database import async_session
 
-from .models import TransactionType, TransactionStatus, Transaction, PaymentSystem
-from src.users.models import User
+from .cache import balance_cache
+from .export import FORMATTERS, MEDIA_TYPES
+from .idempotency import IdempotencyKeyReused, IdempotentRequest
+from .models import TransactionType, TransactionStatus, PaymentSystem
 
 from .schemas import (
-    CreateDeposit, CreateTransaction, CreateWithdrawal,
-    ReadBalance, ReadBonusEarned, ReadTransaction,
-    ReadTransactionsPaginated
+    CreateDeposit, CreateWithdrawal,
+    BulkWithdrawalAction, ReadBalance, ReadBonusEarned,
+    ReadBulkWithdrawalAction, ReadStatement, ReadStatementEntry,
+    ReadTransaction, ReadTransactionsPaginated, ReadWithdrawalActionResult
+)
+from .service import (
+    InsufficientFunds, PromoCodeNotFound, PromoCodeService, PromoCodeUnavailable,
+    TooEarly, TransactionService, WalletException, encode_cursor
 )
-from .service import TooEarly, TransactionService, WalletException
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-async def check_and_apply_referral_bonus(user: ReadProfile, deposit_amount: float, session: AsyncSession):
-    if not user.has_deposited:
-        if user.referrer_id:
-            referrer = await session.get(User, user.referrer_id)
-            if referrer:
-                logger.info(f"Referrer found: {referrer.id}, username: {referrer.username}, referral_bonus_rate: {referrer.referral_bonus_rate}")
-
-                referral_bonus_rate = referrer.referral_bonus_rate or Decimal(0.1)
-                referral_bonus = Decimal(deposit_amount) * referral_bonus_rate
-
-                if referrer.referral_earnings is None:
-                    referrer.referral_earnings = Decimal(0)
-                referrer.referral_earnings += referral_bonus
-
-                referral_transaction = Transaction(
-                    payment_system=PaymentSystem.internal,
-                    amount=referral_bonus,
-                    type=TransactionType.REFERRAL,
-                    user_id=user.referrer_id,
-                    status=TransactionStatus.CONFIRMED
-                )
-                session.add(referral_transaction)
-            else:
-                logger.warning(f"Referrer with id {user.referrer_id} not found.")
-        else:
-            logger.info("No referrer_id provided.")
-        
-        user.has_deposited = True
-        session.add(user)
-        await session.commit()
-    else:
-        logger.info(f"User {user.id} has already made a deposit.")
+def _require_admin(user: ReadProfile):
+    if user.role not in (UserRole.admin, UserRole.superuser):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, 'Not enough rights')
+
+async def replay_idempotent_request(
+    service: TransactionService,
+    idempotency: Optional[IdempotentRequest]
+) -> Optional[JSONResponse]:
+    """Claims the request's Idempotency-Key, returns the stored response if
+    the request was already processed."""
+    if idempotency is None:
+        return None
+    try:
+        stored = await service.claim_idempotency_key(idempotency)
+    except IdempotencyKeyReused:
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, 'Idempotency-Key was used for a different request')
+    if stored is None:
+        return None
+
+    logger.info(f"Replaying {idempotency.endpoint} for user {idempotency.user_id}, key {idempotency.key}")
+    return JSONResponse(stored.body, status_code=stored.status_code, headers={'Idempotent-Replayed': 'true'})
 
 @router.post(
     '/wallet/deposit',
@@ -64,23 +58,18 @@ async def check_and_apply_referral_bonus(user: ReadProfile, deposit_amount: floa
 )
 async def create_deposit(
     deposit: CreateDeposit,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     user: ReadProfile = Depends(get_current_active_user)
 ):
-    async with async_session() as session:
-        await check_and_apply_referral_bonus(user, deposit.amount, session)
-
-        transaction = CreateTransaction(
-            payment_system=deposit.payment_system,
-            amount=deposit.amount,
-            type=TransactionType.IN,
-            user_id=user.id,
-            status=TransactionStatus.CONFIRMED
-        )
-
-        async with TransactionService() as service:
-            db_transaction = await service.create_transaction(transaction)
-            logger.info(f"Deposit created: {db_transaction}")
-            return ReadTransaction.model_validate(db_transaction)
+    idempotency = (
+        IdempotentRequest(user.id, idempotency_key, '/wallet/deposit', deposit) if idempotency_key else None
+    )
+    async with TransactionService() as service:
+        if replay := await replay_idempotent_request(service, idempotency):
+            return replay
+        db_transaction = await service.create_deposit(user.id, deposit, idempotency=idempotency)
+        logger.info(f"Deposit created: {db_transaction}")
+        return ReadTransaction.model_validate(db_transaction)
 
 @router.post(
     '/wallet/bonus-deposit',
@@ -88,23 +77,18 @@ async def create_deposit(
 )
 async def create_bonus_deposit(
     deposit: CreateDeposit,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     user: ReadProfile = Depends(get_current_active_user)
 ):
-    async with async_session() as session:
-        await check_and_apply_referral_bonus(user, deposit.amount, session)
-
-        transaction = CreateTransaction(
-            payment_system=deposit.payment_system,
-            amount=deposit.amount,
-            type=TransactionType.BONUS,
-            user_id=user.id,
-            status=TransactionStatus.CONFIRMED
-        )
-
-        async with TransactionService() as service:
-            db_transaction = await service.create_transaction(transaction)
-            logger.info(f"Bonus deposit created: {db_transaction}")
-            return ReadTransaction.model_validate(db_transaction)
+    idempotency = (
+        IdempotentRequest(user.id, idempotency_key, '/wallet/bonus-deposit', deposit) if idempotency_key else None
+    )
+    async with TransactionService() as service:
+        if replay := await replay_idempotent_request(service, idempotency):
+            return replay
+        db_transaction = await service.create_deposit(user.id, deposit, TransactionType.BONUS, idempotency)
+        logger.info(f"Bonus deposit created: {db_transaction}")
+        return ReadTransaction.model_validate(db_transaction)
 
 @router.post(
     '/wallet/withdrawal',
@@ -112,27 +96,21 @@ async def create_bonus_deposit(
 )
 async def create_withdrawal(
     withdrawal: CreateWithdrawal,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     user: ReadProfile = Depends(get_current_active_user)
 ):
-    transaction = CreateTransaction(
-        payment_system=withdrawal.payment_system,
-        amount=withdrawal.amount,
-        type=TransactionType.OUT,
-        user_id=user.id,
-        status=TransactionStatus.PENDING
+    idempotency = (
+        IdempotentRequest(user.id, idempotency_key, '/wallet/withdrawal', withdrawal) if idempotency_key else None
     )
-
     async with TransactionService() as service:
-        balance = await service.get_balance(user.id)
-        bonus_balance = await service.get_bonus_balance(user.id)
-        pure_balance = balance - bonus_balance
-
-        logger.info(f"User {user.id} is attempting to withdraw {withdrawal.amount}. Balance: {balance}, Pure balance: {pure_balance}")
-
-        if withdrawal.amount > pure_balance:
+        if replay := await replay_idempotent_request(service, idempotency):
+            return replay
+        try:
+            db_transaction = await service.create_withdrawal(user.id, withdrawal, idempotency)
+        except InsufficientFunds:
+            logger.warning(f"User {user.id} has insufficient pure balance to withdraw {withdrawal.amount}")
             raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Insufficient pure balance to withdraw')
 
-        db_transaction = await service.create_transaction(transaction)
         logger.info(f"Withdrawal request created: {db_transaction}")
         return ReadTransaction.model_validate(db_transaction)
 
@@ -141,22 +119,55 @@ async def create_withdrawal(
     tags=['Wallet']
 )
 async def get_history(
-    page: int = Query(1),
-    limit: int = Query(5),
+    page: int = Query(1, ge=1),
+    limit: int = Query(5, ge=1, le=100),
     types: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
     user: ReadProfile = Depends(get_current_active_user)
 ) -> ReadTransactionsPaginated:
     async with TransactionService() as service:
-        db_transactions = await service.get_transactions(page, limit, user.id, types)
+        try:
+            db_transactions = await service.get_transactions(
+                page, limit, user.id, types, cursor, date_from, date_to
+            )
+        except WalletException as e:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e))
         transactions = [
             ReadTransaction.model_validate(t)
             for t in db_transactions
         ]
-        total = await service.get_total_transactions_by_user(user.id, types)
+        total = await service.get_total_transactions_by_user(user.id, types, date_from, date_to)
         logger.info(f"Retrieved {len(transactions)} transactions for user {user.id}. Total: {total}")
         return ReadTransactionsPaginated(
             total=total,
-            transactions=transactions
+            transactions=transactions,
+            next_cursor=encode_cursor(db_transactions[-1]) if len(db_transactions) == limit else None
+        )
+
+@router.get(
+    '/wallet/statement',
+    tags=['Wallet']
+)
+async def get_statement(
+    date_from: date = Query(...),
+    date_to: Optional[date] = Query(None, description='Exclusive, defaults to tomorrow'),
+    granularity: Literal['day', 'month'] = Query('day'),
+    user: ReadProfile = Depends(get_current_active_user)
+) -> ReadStatement:
+    date_to = date_to or date.today() + timedelta(days=1)
+    if date_from >= date_to:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, 'date_from must be before date_to')
+
+    async with TransactionService() as service:
+        rows = await service.get_statement(user.id, date_from, date_to, granularity)
+        logger.info(f"Statement for user {user.id} from {date_from} to {date_to}: {len(rows)} entries")
+        return ReadStatement(
+            date_from=date_from,
+            date_to=date_to,
+            granularity=granularity,
+            entries=[ReadStatementEntry.model_validate(row) for row in rows]
         )
 
 @router.get(
@@ -167,11 +178,10 @@ async def get_balance(
     user: ReadProfile = Depends(get_current_active_user)
 ) -> ReadBalance:
     async with TransactionService() as service:
-        balance = await service.get_balance(user.id)
-        bonus_balance = await service.get_bonus_balance(user.id)
-        pure_balance = await service.get_pure_balance(user.id)
-        logger.info(f"User {user.id} balance: {balance}, Bonus balance: {bonus_balance}, Pure balance: {pure_balance}")
-        return ReadBalance(balance=balance, bonus_balance=bonus_balance, pure_balance=pure_balance)
+        balances = await service.get_balances(user.id)
+        logger.info(f"User {user.id} balance: {balances.balance}, Bonus balance: {balances.bonus_balance}, "
+                    f"Pure balance: {balances.pure_balance}")
+        return balances
 
 @router.get(
     '/wallet/bonus'
@@ -200,11 +210,11 @@ async def get_time_of_last_bonus_earn(
     user: ReadProfile = Depends(get_current_active_user)
 ):
     async with TransactionService() as service:
-        transaction = await service.get_latest_bonus_earn_transaction(user.id)
-        if transaction is None:
+        last_claim_at = await service.get_last_bonus_claim_at(user.id)
+        if last_claim_at is None:
             raise HTTPException(status_code=404, detail="No bonus transactions found for this user")
         
-        created_at_utc = transaction.created_at.astimezone(timezone.utc).isoformat()
+        created_at_utc = last_claim_at.astimezone(timezone.utc).isoformat()
         logger.info(f"User {user.id} last bonus earn time: {created_at_utc}")
         
         return {"created_at": created_at_utc}
@@ -217,24 +227,15 @@ async def apply_promo_code(
     promo_code: str,
     user: ReadProfile = Depends(get_current_active_user)
 ):
-    async with async_session() as session:
-        async with TransactionService() as service:
-            promo = next((p for p in promo_codes if p["code"] == promo_code), None)
-            
-            if not promo:
-                logger.warning(f"Promo code {promo_code} not found for user {user.id}.")
-                raise HTTPException(status.HTTP_404_NOT_FOUND, 'Promo code not found')
-            
-            if promo["used"]:
-                logger.warning(f"Promo code {promo_code} already used for user {user.id}.")
-                raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Promo code already used')
-
-            await service.add_bonuses(user.id, promo["amount"])
-            
-            promo["used"] = True
+    async with PromoCodeService() as service:
+        try:
+            amount = await service.redeem(user.id, promo_code)
+        except PromoCodeNotFound:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, 'Promo code not found')
+        except PromoCodeUnavailable:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Promo code already used')
 
-            logger.info(f"Promo code {promo_code} applied for user {user.id}, amount: {promo['amount']}.")
-            return {"message": "Promo code applied successfully", "amount": promo["amount"]}
+        return {"message": "Promo code applied successfully", "amount": amount}
 
 
 # Новый маршрут для получения всех заявок на вывод средств
@@ -249,6 +250,68 @@ async def get_pending_withdrawals(
         pending_withdrawals = await service.get_pending_withdrawals()
         return [ReadTransaction.model_validate(w) for w in pending_withdrawals]
 
+def _export_response(export_format: str, filename: str, **filters) -> StreamingResponse:
+    async def rows():
+        async with TransactionService() as service:
+            async for row in service.stream_transactions(**filters):
+                yield row
+
+    return StreamingResponse(
+        FORMATTERS[export_format](rows()),
+        media_type=MEDIA_TYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{export_format}"'}
+    )
+
+# Потоковая выгрузка заявок на вывод, ожидающих решения
+@router.get(
+    '/wallet/export/withdrawals/pending',
+    tags=['Admin']
+)
+async def export_pending_withdrawals(
+    export_format: Literal['ndjson', 'csv'] = Query('ndjson', alias='format'),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    payment_system: Optional[PaymentSystem] = Query(None),
+    user: ReadProfile = Depends(get_current_active_user)
+):
+    _require_admin(user)
+    return _export_response(
+        export_format,
+        'pending_withdrawals',
+        date_from=date_from,
+        date_to=date_to,
+        payment_system=payment_system,
+        status=TransactionStatus.PENDING,
+        type=TransactionType.OUT
+    )
+
+# Потоковая выгрузка журнала транзакций для бухгалтерии
+@router.get(
+    '/wallet/export/transactions',
+    tags=['Admin']
+)
+async def export_transactions(
+    export_format: Literal['ndjson', 'csv'] = Query('ndjson', alias='format'),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    payment_system: Optional[PaymentSystem] = Query(None),
+    transaction_status: Optional[TransactionStatus] = Query(None, alias='status'),
+    transaction_type: Optional[TransactionType] = Query(None, alias='type'),
+    user_id: Optional[int] = Query(None),
+    user: ReadProfile = Depends(get_current_active_user)
+):
+    _require_admin(user)
+    return _export_response(
+        export_format,
+        'transactions',
+        date_from=date_from,
+        date_to=date_to,
+        payment_system=payment_system,
+        status=transaction_status,
+        type=transaction_type,
+        user_id=user_id
+    )
+
 # Маршрут для подтверждения заявки на вывод средств
 @router.post(
     '/wallet/withdrawals/confirm',
@@ -281,6 +344,43 @@ async def reject_withdrawal(
         except WalletException as e:
             raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e))
 
+def _bulk_result(results: dict) -> ReadBulkWithdrawalAction:
+    succeeded = sum(results.values())
+    return ReadBulkWithdrawalAction(
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        results=[
+            ReadWithdrawalActionResult(transaction_id=transaction_id, success=success)
+            for transaction_id, success in results.items()
+        ]
+    )
+
+# Подтверждение пачки заявок на вывод одним запросом
+@router.post(
+    '/wallet/withdrawals/confirm/bulk',
+    tags=['Admin']
+)
+async def confirm_withdrawals(
+    action: BulkWithdrawalAction,
+    user: ReadProfile = Depends(get_current_active_user)
+) -> ReadBulkWithdrawalAction:
+    _require_admin(user)
+    async with TransactionService() as service:
+        return _bulk_result(await service.confirm_withdrawals(action.transaction_ids))
+
+# Отклонение пачки заявок на вывод одним запросом
+@router.post(
+    '/wallet/withdrawals/reject/bulk',
+    tags=['Admin']
+)
+async def reject_withdrawals(
+    action: BulkWithdrawalAction,
+    user: ReadProfile = Depends(get_current_active_user)
+) -> ReadBulkWithdrawalAction:
+    _require_admin(user)
+    async with TransactionService() as service:
+        return _bulk_result(await service.reject_withdrawals(action.transaction_ids))
+
 @router.get(
     '/wallet/withdrawals/last',
     tags=['Wallet']
@@ -295,4 +395,14 @@ async def get_last_withdrawal_attempt(
             # Если нет записи о последнем выводе, возвращаем 1 сентября 1900 года
             return {"created_at": datetime(1900, 9, 1)}
 
-        return {"created_at": last_withdrawal.created_at}
\ No newline at end of file
+        return {"created_at": last_withdrawal.created_at}
+
+@router.get(
+    '/wallet/cache/stats',
+    tags=['Admin']
+)
+async def get_balance_cache_stats(
+    user: ReadProfile = Depends(get_current_active_user)
+):
+    _require_admin(user)
+    return balance_cache.stats()
@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -46,6 +46,7 @@ class ReadTransaction(ORM):
 class ReadTransactionsPaginated(ORM):
     total: int
     transactions: List[ReadTransaction]
+    next_cursor: Optional[str] = None
 
 
 class ReadBalance(BaseModel):
@@ -54,6 +55,36 @@ class ReadBalance(BaseModel):
     pure_balance: Decimal
 
 
+class ReadStatementEntry(ORM):
+    period: date
+    type: TransactionType
+    status: TransactionStatus
+    amount: Decimal
+    count: int
+
+
+class ReadStatement(BaseModel):
+    date_from: date
+    date_to: date
+    granularity: str
+    entries: List[ReadStatementEntry]
+
+
 class ReadBonusEarned(BaseModel):
     amount: Decimal
     balance: Decimal
+
+
+class BulkWithdrawalAction(BaseModel):
+    transaction_ids: List[int] = Field(min_length=1, max_length=1000)
+
+
+class ReadWithdrawalActionResult(BaseModel):
+    transaction_id: int
+    success: bool
+
+
+class ReadBulkWithdrawalAction(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[ReadWithdrawalActionResult]
@@ -1,11 +1,27 @@
+import base64
+import binascii
 import logging
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from decimal import Decimal
-from typing import List, Optional
+from random import randint
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import (Date, Integer, Numeric, and_, any_, bindparam, cast, func,
+                        literal, or_, text, true, tuple_, update)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from src.service import BaseService
-from .models import PaymentSystem, Transaction, TransactionType, TransactionStatus
-from .schemas import CreateTransaction
+from src.users.models import User
+from .cache import ActivePromoCode, balance_cache, promo_code_cache
+from .export import EXPORT_COLUMNS
+from .idempotency import IdempotentRequest, StoredResponse
+from .models import (
+    BalanceCheckpoint, PaymentSystem, PromoCode, PromoCodeRedemption,
+    Transaction, TransactionStatus, TransactionType, WalletBalance,
+    WalletDailyRollup
+)
+from .schemas import CreateDeposit, CreateTransaction, CreateWithdrawal, ReadBalance, ReadTransaction
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -22,87 +38,695 @@ class BonusException(Exception):
 class TooEarly(BonusException):
     pass
 
+class PromoCodeException(Exception):
+    pass
+
+class PromoCodeNotFound(PromoCodeException):
+    pass
+
+class PromoCodeUnavailable(PromoCodeException):
+    pass
+
+ZERO = Decimal(0)
+
+BONUS_CLAIM_INTERVAL = timedelta(hours=24)
+
+# Share of the first deposit credited to the referrer when their own rate is unset
+REFERRAL_BONUS_RATE = Decimal('0.1')
+
+# Transaction types that increase the total balance once confirmed
+CREDIT_TYPES = (
+    TransactionType.IN, TransactionType.BONUS, TransactionType.REFERRAL,
+    TransactionType.WIN, TransactionType.REFUND
+)
+# Transaction types that decrease it; only withdrawals touch the pure balance
+DEBIT_TYPES = (TransactionType.OUT, TransactionType.BET, TransactionType.REVERSAL)
+
+
+def balance_deltas(
+    transaction: Transaction,
+    status: Optional[TransactionStatus] = None
+) -> Tuple[Decimal, Decimal, Decimal, Decimal]:
+    """Returns the (balance, bonus, pure, reserved) contribution of the
+    transaction to the ledger in its current status, or in `status` if given.
+
+    A pending withdrawal only reserves its amount; once confirmed it is
+    debited instead, once rejected it contributes nothing.
+    """
+    amount = Decimal(transaction.amount)
+    status = status or transaction.status
+    if status == TransactionStatus.PENDING:
+        if transaction.type == TransactionType.OUT:
+            return ZERO, ZERO, ZERO, amount
+        return ZERO, ZERO, ZERO, ZERO
+
+    if status != TransactionStatus.CONFIRMED:
+        return ZERO, ZERO, ZERO, ZERO
+
+    if transaction.type == TransactionType.OUT:
+        return -amount, ZERO, -amount, ZERO
+    if transaction.type in DEBIT_TYPES:
+        return -amount, ZERO, ZERO, ZERO
+
+    balance = amount if transaction.type in CREDIT_TYPES else ZERO
+    bonus = amount if transaction.type == TransactionType.BONUS else ZERO
+    pure = amount if transaction.type == TransactionType.IN else ZERO
+    return balance, bonus, pure, ZERO
+
+
+async def apply_balance_delta(
+    session: AsyncSession,
+    user_id: int,
+    balance: Decimal = ZERO,
+    bonus: Decimal = ZERO,
+    pure: Decimal = ZERO,
+    reserved: Decimal = ZERO
+):
+    """Adds deltas to the user's ledger row, creating it on first write.
+
+    Runs inside the caller's transaction, so the ledger is committed together
+    with the `transactions` rows that caused the change. The upsert holds the
+    row lock until commit, which serializes writers of the same user only.
+    """
+    stmt = insert(WalletBalance).values(
+        user_id=user_id,
+        balance=balance,
+        bonus=bonus,
+        pure=pure,
+        reserved=reserved,
+        updated_at=datetime.now()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WalletBalance.user_id],
+        set_={
+            'balance': WalletBalance.balance + stmt.excluded.balance,
+            'bonus': WalletBalance.bonus + stmt.excluded.bonus,
+            'pure': WalletBalance.pure + stmt.excluded.pure,
+            'reserved': WalletBalance.reserved + stmt.excluded.reserved,
+            'updated_at': stmt.excluded.updated_at,
+        }
+    )
+    await session.execute(stmt)
+
+
+async def apply_balance_deltas(session: AsyncSession, deltas: Dict[int, List[Decimal]]):
+    """Multi-row `apply_balance_delta`: one upsert for (balance, bonus, pure,
+    reserved) deltas of several users, locking their rows in user_id order.
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    now = datetime.now()
+    stmt = insert(WalletBalance).values([
+        dict(user_id=user_id, balance=balance, bonus=bonus, pure=pure, reserved=reserved, updated_at=now)
+        for user_id, (balance, bonus, pure, reserved) in sorted(deltas.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WalletBalance.user_id],
+        set_={
+            'balance': WalletBalance.balance + stmt.excluded.balance,
+            'bonus': WalletBalance.bonus + stmt.excluded.bonus,
+            'pure': WalletBalance.pure + stmt.excluded.pure,
+            'reserved': WalletBalance.reserved + stmt.excluded.reserved,
+            'updated_at': stmt.excluded.updated_at,
+        }
+    )
+    await session.execute(stmt)
+
+
+def collect_balance_deltas(transactions) -> Dict[int, List[Decimal]]:
+    """Sums `balance_deltas` of the transactions per user."""
+    deltas: Dict[int, List[Decimal]] = {}
+    for transaction in transactions:
+        user_deltas = deltas.setdefault(transaction.user_id, [ZERO, ZERO, ZERO, ZERO])
+        for i, delta in enumerate(balance_deltas(transaction)):
+            user_deltas[i] += delta
+    return deltas
+
+
+async def apply_transaction_to_balance(session: AsyncSession, transaction: Transaction):
+    deltas = balance_deltas(transaction)
+    if any(deltas):
+        await apply_balance_delta(session, transaction.user_id, *deltas)
+
+
+RollupKey = Tuple[int, date, TransactionType, TransactionStatus]
+
+
+def collect_rollup_deltas(rows, status: Optional[TransactionStatus] = None, sign: int = 1) -> Dict[RollupKey, list]:
+    """Sums (amount, count) of the rows per rollup key, in `status` instead
+    of their own if given; `sign=-1` takes them out of the rollups.
+    """
+    deltas: Dict[RollupKey, list] = {}
+    for row in rows:
+        if row.user_id is None:
+            continue
+        key = (row.user_id, row.created_at.date(), row.type, status or row.status)
+        delta = deltas.setdefault(key, [ZERO, 0])
+        delta[0] += sign * Decimal(row.amount)
+        delta[1] += sign
+    return deltas
+
+
+async def apply_rollup_deltas(session: AsyncSession, *deltas: Dict[RollupKey, list]):
+    """Adds (amount, count) deltas to `wallet_daily_rollups` in one upsert,
+    inside the caller's transaction like `apply_balance_deltas`.
+    """
+    merged: Dict[RollupKey, list] = {}
+    for part in deltas:
+        for key, (amount, count) in part.items():
+            delta = merged.setdefault(key, [ZERO, 0])
+            delta[0] += amount
+            delta[1] += count
+    merged = {key: delta for key, delta in merged.items() if delta[1] or delta[0]}
+    if not merged:
+        return
+
+    # Sorted keys keep the row lock order stable between concurrent writers
+    stmt = insert(WalletDailyRollup).values([
+        dict(user_id=user_id, day=day, type=type, status=status, amount=amount, count=count)
+        for (user_id, day, type, status), (amount, count)
+        in sorted(merged.items(), key=lambda item: (item[0][0], item[0][1], item[0][2].name, item[0][3].name))
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WalletDailyRollup.user_id, WalletDailyRollup.day,
+                        WalletDailyRollup.type, WalletDailyRollup.status],
+        set_={
+            'amount': WalletDailyRollup.amount + stmt.excluded.amount,
+            'count': WalletDailyRollup.count + stmt.excluded.count,
+        }
+    )
+    await session.execute(stmt)
+
+
+async def record_transactions(session: AsyncSession, transactions: List[Transaction]) -> Dict[int, List[Decimal]]:
+    """Inserts new transactions and applies them to the balance ledger and
+    the daily rollups; returns the balance deltas per user.
+    """
+    session.add_all(transactions)
+    # created_at is only assigned on insert and decides the rollup day
+    await session.flush()
+    deltas = collect_balance_deltas(transactions)
+    await apply_balance_deltas(session, deltas)
+    await apply_rollup_deltas(session, collect_rollup_deltas(transactions))
+    return deltas
+
+
+async def ensure_wallet(session: AsyncSession, user_id: int):
+    """Creates an empty ledger row for a user without transactions."""
+    await session.execute(
+        insert(WalletBalance).values(
+            user_id=user_id,
+            balance=ZERO,
+            bonus=ZERO,
+            pure=ZERO,
+            reserved=ZERO,
+            updated_at=datetime.now()
+        ).on_conflict_do_nothing(index_elements=[WalletBalance.user_id])
+    )
+
+
+async def lock_wallet(session: AsyncSession, user_id: int) -> WalletBalance:
+    """Locks the user's ledger row (SELECT ... FOR UPDATE) until commit."""
+    query = (
+        select(WalletBalance)
+        .where(WalletBalance.user_id == user_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    wallet = (await session.execute(query)).scalar_one_or_none()
+    if wallet is None:
+        await ensure_wallet(session, user_id)
+        wallet = (await session.execute(query)).scalar_one()
+    return wallet
+
+
+def _sum_confirmed(*types: TransactionType):
+    return func.coalesce(
+        func.sum(Transaction.amount).filter(and_(
+            Transaction.type.in_(types),
+            Transaction.status == TransactionStatus.CONFIRMED
+        )),
+        0
+    )
+
+
+def balance_aggregates():
+    """SQL expressions computing (balance, bonus, pure, reserved) over `transactions` rows."""
+    withdrawn = _sum_confirmed(TransactionType.OUT)
+    return (
+        (_sum_confirmed(*CREDIT_TYPES) - _sum_confirmed(*DEBIT_TYPES)).label('balance'),
+        _sum_confirmed(TransactionType.BONUS).label('bonus'),
+        (_sum_confirmed(TransactionType.IN) - withdrawn).label('pure'),
+        func.coalesce(
+            func.sum(Transaction.amount).filter(and_(
+                Transaction.type == TransactionType.OUT,
+                Transaction.status == TransactionStatus.PENDING
+            )),
+            0
+        ).label('reserved'),
+    )
+
+
+def encode_cursor(transaction: Transaction) -> str:
+    """Opaque keyset cursor pointing right after the given transaction."""
+    raw = f"{transaction.created_at.isoformat()}|{transaction.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, transaction_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(transaction_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise WalletException("Invalid cursor")
+
+
+def _filter_types(query, types: Optional[str]):
+    if types:
+        type_values = [TransactionType(int(t)) for t in types.split(',')]
+        query = query.where(Transaction.type.in_(type_values))
+    return query
+
+
+def _filter_period(query, date_from: Optional[datetime], date_to: Optional[datetime]):
+    """Bounds `created_at`, which lets Postgres skip the monthly partitions outside [date_from, date_to)."""
+    if date_from is not None:
+        query = query.where(Transaction.created_at >= date_from)
+    if date_to is not None:
+        query = query.where(Transaction.created_at < date_to)
+    return query
+
+
 class TransactionService(BaseService):
 
     async def create_transaction(self, transaction: CreateTransaction):
         logger.info(f"Creating transaction: {transaction}")
         db_transaction = Transaction(**transaction.model_dump())
-        self.session.add(db_transaction)
+        await record_transactions(self.session, [db_transaction])
         await self.session.commit()
+        await balance_cache.invalidate(db_transaction.user_id)
         await self.session.refresh(db_transaction)
         logger.info(f"Transaction created with ID: {db_transaction.id}")
         return db_transaction
 
-    async def get_total_transactions_by_user(self, user_id: int, types: Optional[str] = None):
-        logger.info(f"Fetching total transactions for user {user_id} with types {types}")
-        query = select(Transaction).where(Transaction.user_id == user_id)
+    async def create_deposit(
+        self,
+        user_id: int,
+        deposit: CreateDeposit,
+        type: TransactionType = TransactionType.IN,
+        idempotency: Optional[IdempotentRequest] = None
+    ) -> Transaction:
+        """Deposit pipeline: the deposit, the referrer's REFERRAL bonus, their
+        `referral_earnings` and the `has_deposited` flag share one commit.
+
+        Flipping `has_deposited` with a conditional UPDATE both detects the
+        first deposit and guards it, so the referral bonus is paid once even
+        for concurrent deposits.
+        """
+        logger.info(f"Creating deposit for user {user_id}: {deposit.amount}, type: {type}")
+        first_deposit = (await self.session.execute(
+            update(User)
+            .where(User.id == user_id, User.has_deposited.isnot(True))
+            .values(has_deposited=True)
+            .returning(User.referrer_id)
+            .execution_options(synchronize_session=False)
+        )).first()
+
+        transactions = [Transaction(
+            payment_system=deposit.payment_system,
+            amount=deposit.amount,
+            type=type,
+            user_id=user_id,
+            status=TransactionStatus.CONFIRMED
+        )]
+
+        if first_deposit is not None and first_deposit.referrer_id is not None:
+            referral_bonus = Decimal(deposit.amount) * cast(
+                func.coalesce(User.referral_bonus_rate, REFERRAL_BONUS_RATE), Numeric
+            )
+            referrer = (await self.session.execute(
+                update(User)
+                .where(User.id == first_deposit.referrer_id)
+                .values(referral_earnings=func.coalesce(User.referral_earnings, 0) + referral_bonus)
+                .returning(User.id, referral_bonus.label('bonus'))
+                .execution_options(synchronize_session=False)
+            )).first()
+
+            if referrer is not None:
+                logger.info(f"Referral bonus {referrer.bonus} for referrer {referrer.id}")
+                transactions.append(Transaction(
+                    payment_system=PaymentSystem.internal,
+                    amount=referrer.bonus,
+                    type=TransactionType.REFERRAL,
+                    user_id=referrer.id,
+                    status=TransactionStatus.CONFIRMED
+                ))
+            else:
+                logger.warning(f"Referrer with id {first_deposit.referrer_id} not found.")
+
+        deltas = await record_transactions(self.session, transactions)
+        await self._save_idempotent_response(idempotency, transactions[0])
+        await self.session.commit()
+        await balance_cache.invalidate(*deltas)
+        if idempotency is not None:
+            idempotency.committed()
+
+        logger.info(f"Deposit created: {transactions[0].id}")
+        return transactions[0]
+
+    async def create_withdrawal(
+        self,
+        user_id: int,
+        withdrawal: CreateWithdrawal,
+        idempotency: Optional[IdempotentRequest] = None
+    ) -> Transaction:
+        """Creates a PENDING withdrawal while holding the user's ledger row lock.
+
+        Concurrent withdrawals of the same user are checked one after another
+        against the balance minus bonuses and already reserved withdrawals;
+        other users are not blocked.
+        """
+        wallet = await lock_wallet(self.session, user_id)
+        available = wallet.balance - wallet.bonus - wallet.reserved
+        logger.info(f"User {user_id} is attempting to withdraw {withdrawal.amount}. Balance: {wallet.balance}, "
+                    f"Available: {available}")
+
+        if withdrawal.amount > available:
+            await self.session.rollback()
+            raise InsufficientFunds()
+
+        db_transaction = Transaction(
+            payment_system=withdrawal.payment_system,
+            amount=withdrawal.amount,
+            type=TransactionType.OUT,
+            user_id=user_id,
+            status=TransactionStatus.PENDING
+        )
+        self.session.add(db_transaction)
+        wallet.reserved += withdrawal.amount
+        wallet.updated_at = datetime.now()
+        await self.session.flush()
+        await apply_rollup_deltas(self.session, collect_rollup_deltas([db_transaction]))
+
+        await self._save_idempotent_response(idempotency, db_transaction)
+        await self.session.commit()
+        await balance_cache.invalidate(user_id)
+        if idempotency is not None:
+            idempotency.committed()
+        await self.session.refresh(db_transaction)
+        logger.info(f"Withdrawal request created: {db_transaction.id}")
+        return db_transaction
+
+    async def claim_idempotency_key(self, idempotency: IdempotentRequest) -> Optional[StoredResponse]:
+        """Claims the key for a following create_deposit/create_withdrawal in
+        this session, or returns the response of the request that used it.
+        """
+        return await idempotency.claim(self.session)
 
-        if types:
-            type_values = [TransactionType(int(t)) for t in types.split(',')]
-            query = query.where(Transaction.type.in_(type_values))
+    async def _save_idempotent_response(self, idempotency: Optional[IdempotentRequest], transaction: Transaction):
+        if idempotency is None:
+            return
+        await self.session.flush()
+        response = ReadTransaction.model_validate(transaction).model_dump(mode='json')
+        await idempotency.save(self.session, response)
 
-        result = await self.session.execute(query)
-        total_transactions = len(result.scalars().all())
+    async def get_total_transactions_by_user(
+        self,
+        user_id: int,
+        types: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> int:
+        logger.info(f"Counting transactions for user {user_id} with types {types} from {date_from} to {date_to}")
+        query = _filter_types(
+            select(func.count()).select_from(Transaction).where(Transaction.user_id == user_id),
+            types
+        )
+        query = _filter_period(query, date_from, date_to)
+        total_transactions = (await self.session.execute(query)).scalar_one()
         logger.info(f"Total transactions found: {total_transactions}")
         return total_transactions
 
-    async def get_transactions(self, page: int = 1, limit: int = 5, user_id: int = None, types: Optional[str] = None):
-        logger.info(f"Fetching transactions for user {user_id} - Page: {page}, Limit: {limit}, Types: {types}")
-        query = select(Transaction).where(Transaction.user_id == user_id)
+    async def get_transactions(
+        self,
+        page: int = 1,
+        limit: int = 5,
+        user_id: int = None,
+        types: Optional[str] = None,
+        cursor: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ):
+        """Returns the user's transactions newest first.
 
-        if types:
-            type_values = [TransactionType(int(t)) for t in types.split(',')]
-            query = query.where(Transaction.type.in_(type_values))
+        With a `cursor` the page is located by `(created_at, id)` keyset, so
+        every page costs the same; `page` is kept for older clients.
+        """
+        logger.info(f"Fetching transactions for user {user_id} - Page: {page}, Cursor: {cursor}, "
+                    f"Limit: {limit}, Types: {types}, From: {date_from}, To: {date_to}")
+        query = _filter_types(select(Transaction).where(Transaction.user_id == user_id), types)
+        query = _filter_period(query, date_from, date_to)
 
-        query = query.offset((page - 1) * limit).limit(limit)
+        if cursor:
+            query = query.where(tuple_(Transaction.created_at, Transaction.id) < decode_cursor(cursor))
+        else:
+            query = query.offset((page - 1) * limit)
+
+        query = query.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit)
 
         transactions = (await self.session.execute(query)).scalars().all()
         logger.info(f"Transactions fetched: {len(transactions)}")
         return transactions
 
-    async def get_balance(self, user_id: int):
-        logger.info(f"Calculating balance for user {user_id}")
-        query = select(Transaction).where(Transaction.user_id == user_id)
-        transactions = await self.session.execute(query)
-        balance = Decimal(0.0)
-        
-        for transaction in transactions.scalars().all():
-            logger.info(f"Transaction: {transaction.id}, Type: {transaction.type}, Amount: {transaction.amount}, Status: {transaction.status}")
-            
-            if transaction.type in [TransactionType.IN, TransactionType.BONUS, TransactionType.REFERRAL] and transaction.status == TransactionStatus.CONFIRMED:
-                balance += transaction.amount
-                logger.info(f"Balance increased by {transaction.amount}, new balance: {balance}")
-            elif transaction.type == TransactionType.OUT and transaction.status == TransactionStatus.CONFIRMED:
-                balance -= transaction.amount
-                logger.info(f"Balance decreased by {transaction.amount}, new balance: {balance}")
-        
-        logger.info(f"Final balance for user {user_id}: {balance}")
-        return balance
+    async def get_statement(
+        self,
+        user_id: int,
+        date_from: date,
+        date_to: date,
+        granularity: str = 'day'
+    ) -> List[Row]:
+        """Totals per day or month, type and status over [date_from, date_to),
+        read from `wallet_daily_rollups` at a cost proportional to the days.
+        """
+        logger.info(f"Building {granularity} statement for user {user_id} from {date_from} to {date_to}")
+        if granularity == 'month':
+            period = cast(func.date_trunc('month', WalletDailyRollup.day), Date)
+        else:
+            period = WalletDailyRollup.day
+
+        result = await self.session.execute(
+            select(
+                period.label('period'),
+                WalletDailyRollup.type,
+                WalletDailyRollup.status,
+                func.sum(WalletDailyRollup.amount).label('amount'),
+                func.sum(WalletDailyRollup.count).label('count'),
+            ).where(
+                WalletDailyRollup.user_id == user_id,
+                WalletDailyRollup.day >= date_from,
+                WalletDailyRollup.day < date_to
+            ).group_by(
+                period, WalletDailyRollup.type, WalletDailyRollup.status
+            ).having(
+                func.sum(WalletDailyRollup.count) > 0
+            ).order_by(
+                period, WalletDailyRollup.type, WalletDailyRollup.status
+            )
+        )
+        return result.all()
+
+    async def get_balance(self, user_id: int) -> Decimal:
+        return (await self.get_balances(user_id)).balance
 
     async def get_bonus_balance(self, user_id: int) -> Decimal:
-        logger.info(f"Calculating bonus balance for user {user_id}")
-        query = select(Transaction).where(Transaction.user_id == user_id)
-        transactions = await self.session.execute(query)
-        balance = Decimal(0.0)
-        for transaction in transactions.scalars().all():
-            if transaction.type == TransactionType.BONUS and transaction.status == TransactionStatus.CONFIRMED:
-                balance += transaction.amount
-                logger.info(f"Bonus balance increased by {transaction.amount}, new bonus balance: {balance}")
-        logger.info(f"Final bonus balance for user {user_id}: {balance}")
-        return balance
-
-    async def get_pure_balance(self, user_id: int):
-        logger.info(f"Calculating pure balance for user {user_id}")
-        query = select(Transaction).where(Transaction.user_id == user_id)
-        transactions = await self.session.execute(query)
-        balance = Decimal(0.0)
-        for transaction in transactions.scalars().all():
-            if transaction.type == TransactionType.IN and transaction.status == TransactionStatus.CONFIRMED:
-                balance += transaction.amount
-            elif transaction.type == TransactionType.OUT and transaction.status == TransactionStatus.CONFIRMED:
-                balance -= transaction.amount
-        logger.info(f"Final pure balance for user {user_id}: {balance}")
-        return balance
+        return (await self.get_balances(user_id)).bonus_balance
+
+    async def get_pure_balance(self, user_id: int) -> Decimal:
+        return (await self.get_balances(user_id)).pure_balance
+
+    async def aggregate_balances(self, user_id: int) -> ReadBalance:
+        """Computes all balance figures as checkpoint + SUM(rows after its watermark)."""
+        watermark = select(BalanceCheckpoint.last_transaction_id).where(
+            BalanceCheckpoint.user_id == user_id
+        ).scalar_subquery()
+        delta = select(*balance_aggregates()).where(
+            Transaction.user_id == user_id,
+            Transaction.id > func.coalesce(watermark, 0)
+        ).subquery()
+        checkpoint = select(BalanceCheckpoint).where(BalanceCheckpoint.user_id == user_id).subquery()
+
+        row = (await self.session.execute(
+            select(
+                (delta.c.balance + func.coalesce(checkpoint.c.balance, 0)).label('balance'),
+                (delta.c.bonus + func.coalesce(checkpoint.c.bonus, 0)).label('bonus'),
+                (delta.c.pure + func.coalesce(checkpoint.c.pure, 0)).label('pure'),
+            ).select_from(delta.outerjoin(checkpoint, true()))
+        )).one()
+        return ReadBalance(balance=row.balance, bonus_balance=row.bonus, pure_balance=row.pure)
+
+    async def checkpoint_balance(self, user_id: int, lag: timedelta = timedelta(minutes=10)) -> Optional[int]:
+        """Moves the user's checkpoint forward, returns the new watermark.
+
+        The watermark never passes a PENDING row, since its status may still
+        change, nor rows younger than `lag`, whose ids may belong to
+        transactions that have not committed yet.
+        """
+        checkpoint = await self.session.get(BalanceCheckpoint, user_id, with_for_update=True)
+        old_watermark = checkpoint.last_transaction_id if checkpoint else 0
+
+        bounds = (await self.session.execute(
+            select(
+                func.min(Transaction.id).filter(
+                    Transaction.status == TransactionStatus.PENDING
+                ).label('first_pending'),
+                func.max(Transaction.id).filter(
+                    Transaction.created_at < datetime.now() - lag
+                ).label('last_settled'),
+            ).where(
+                Transaction.user_id == user_id,
+                Transaction.id > old_watermark
+            )
+        )).one()
+
+        watermark = bounds.last_settled
+        if watermark is not None and bounds.first_pending is not None:
+            watermark = min(watermark, bounds.first_pending - 1)
+        if watermark is None or watermark <= old_watermark:
+            await self.session.rollback()
+            return None
+
+        delta = (await self.session.execute(
+            select(*balance_aggregates()).where(
+                Transaction.user_id == user_id,
+                Transaction.id > old_watermark,
+                Transaction.id <= watermark
+            )
+        )).one()
+
+        if checkpoint is None:
+            checkpoint = BalanceCheckpoint(user_id=user_id, balance=ZERO, bonus=ZERO, pure=ZERO)
+            self.session.add(checkpoint)
+        checkpoint.last_transaction_id = watermark
+        checkpoint.balance += delta.balance
+        checkpoint.bonus += delta.bonus
+        checkpoint.pure += delta.pure
+        checkpoint.created_at = datetime.now()
+
+        await self.session.commit()
+        logger.info(f"Balance checkpoint for user {user_id} moved from {old_watermark} to {watermark}")
+        return watermark
+
+    async def get_checkpoint_candidates(self, threshold: int, limit: int) -> List[int]:
+        """Users with at least `threshold` transactions after their checkpoint."""
+        result = await self.session.execute(
+            select(Transaction.user_id)
+            .outerjoin(BalanceCheckpoint, BalanceCheckpoint.user_id == Transaction.user_id)
+            .where(
+                Transaction.user_id.isnot(None),
+                Transaction.id > func.coalesce(BalanceCheckpoint.last_transaction_id, 0)
+            )
+            .group_by(Transaction.user_id)
+            .having(func.count() >= threshold)
+            .order_by(func.count().desc())
+            .limit(limit)
+        )
+        return result.scalars().all()
+
+    async def get_balances(self, user_id: int, cached: bool = True) -> ReadBalance:
+        """Returns all balance figures of the user.
+
+        Pass `cached=False` when the result guards a money movement.
+        """
+        if cached:
+            balances = await balance_cache.get(user_id)
+            if balances is not None:
+                return balances
+            # Taken before the read, so a commit invalidated meanwhile voids the fill
+            token = await balance_cache.token(user_id)
+
+        logger.info(f"Fetching balances for user {user_id}")
+        row = (await self.session.execute(
+            select(WalletBalance.balance, WalletBalance.bonus, WalletBalance.pure)
+            .where(WalletBalance.user_id == user_id)
+        )).one_or_none()
+
+        if row is None:
+            # No ledger row yet, e.g. before the backfill ran for this user
+            balances = await self.aggregate_balances(user_id)
+        else:
+            balances = ReadBalance(balance=row.balance, bonus_balance=row.bonus, pure_balance=row.pure)
+
+        logger.info(f"Balances for user {user_id}: {balances}")
+        if cached:
+            await balance_cache.set(user_id, balances, token)
+        return balances
+
+    async def rebuild_balances(self, user_id: Optional[int] = None) -> int:
+        """Recomputes `wallet_balances` from balance checkpoints plus the
+        `transactions` after their watermarks, as `aggregate_balances` does;
+        partitions detached by `src.wallet.partitions` are not needed.
+
+        The ledger table is locked for the duration, so concurrent writers wait
+        and apply their deltas on top of the rebuilt rows.
+        """
+        logger.info(f"Rebuilding wallet balances for user {user_id or 'all'}")
+        await self.session.execute(text('LOCK TABLE wallet_balances IN EXCLUSIVE MODE'))
+
+        delta = select(
+            Transaction.user_id,
+            *balance_aggregates()
+        ).outerjoin(
+            BalanceCheckpoint, BalanceCheckpoint.user_id == Transaction.user_id
+        ).where(
+            Transaction.user_id.isnot(None),
+            Transaction.id > func.coalesce(BalanceCheckpoint.last_transaction_id, 0)
+        ).group_by(Transaction.user_id)
+        checkpoints = select(BalanceCheckpoint)
+        # Reset rather than delete, rows also carry non-derived state like the bonus claim time
+        clear = update(WalletBalance).values(balance=ZERO, bonus=ZERO, pure=ZERO, reserved=ZERO)
+
+        if user_id is not None:
+            delta = delta.where(Transaction.user_id == user_id)
+            checkpoints = checkpoints.where(BalanceCheckpoint.user_id == user_id)
+            clear = clear.where(WalletBalance.user_id == user_id)
+
+        delta = delta.subquery()
+        checkpoints = checkpoints.subquery()
+        query = select(
+            func.coalesce(delta.c.user_id, checkpoints.c.user_id),
+            func.coalesce(delta.c.balance, 0) + func.coalesce(checkpoints.c.balance, 0),
+            func.coalesce(delta.c.bonus, 0) + func.coalesce(checkpoints.c.bonus, 0),
+            func.coalesce(delta.c.pure, 0) + func.coalesce(checkpoints.c.pure, 0),
+            func.coalesce(delta.c.reserved, 0),
+            func.now()
+        ).select_from(
+            delta.outerjoin(checkpoints, delta.c.user_id == checkpoints.c.user_id, full=True)
+        )
+
+        await self.session.execute(clear.execution_options(synchronize_session=False))
+        stmt = insert(WalletBalance).from_select(
+            ['user_id', 'balance', 'bonus', 'pure', 'reserved', 'updated_at'],
+            query
+        )
+        result = await self.session.execute(stmt.on_conflict_do_update(
+            index_elements=[WalletBalance.user_id],
+            set_={
+                'balance': stmt.excluded.balance,
+                'bonus': stmt.excluded.bonus,
+                'pure': stmt.excluded.pure,
+                'reserved': stmt.excluded.reserved,
+                'updated_at': stmt.excluded.updated_at,
+            }
+        ))
+        await self.session.commit()
+        if user_id is None:
+            await balance_cache.clear()
+        else:
+            await balance_cache.invalidate(user_id)
+        logger.info(f"Wallet balances rebuilt: {result.rowcount}")
+        return result.rowcount
 
     async def get_latest_bonus_earn_transaction(self, user_id: int) -> Optional[Transaction]:
         logger.info(f"Fetching latest bonus earn transaction for user {user_id}")
@@ -133,27 +757,56 @@ class TransactionService(BaseService):
             user_id=user_id
         ))
 
-    async def earn_bonuses(self, user_id: int) -> Optional[Decimal]:
+    async def get_last_bonus_claim_at(self, user_id: int) -> Optional[datetime]:
+        result = await self.session.execute(
+            select(WalletBalance.last_bonus_claim_at).where(WalletBalance.user_id == user_id)
+        )
+        return result.scalar_one_or_none()
+
+    async def earn_bonuses(self, user_id: int) -> Decimal:
+        """Claims the daily bonus.
+
+        The claim is one conditional UPDATE of `last_bonus_claim_at`, so
+        double clicks and parallel requests can't earn twice in 24 hours.
+        """
         logger.info(f"User {user_id} attempting to earn bonuses")
         now = datetime.now()
 
-        transaction = await self.get_latest_bonus_earn_transaction(user_id)
+        await ensure_wallet(self.session, user_id)
+        claimed = await self.session.execute(
+            update(WalletBalance)
+            .where(
+                WalletBalance.user_id == user_id,
+                or_(
+                    WalletBalance.last_bonus_claim_at.is_(None),
+                    WalletBalance.last_bonus_claim_at <= now - BONUS_CLAIM_INTERVAL
+                )
+            )
+            .values(last_bonus_claim_at=now)
+            .returning(WalletBalance.user_id)
+            .execution_options(synchronize_session=False)
+        )
+        if claimed.first() is None:
+            await self.session.rollback()
+            logger.info(f"Too early to earn bonuses for user {user_id}")
+            raise TooEarly()
 
-        if transaction is None:
-            earned_bonuses = Decimal(randint(10, 100))  # Генерация случайной суммы бонусов
-            await self.add_bonuses(user_id, earned_bonuses)  # Передача сгенерированной суммы
-            logger.info(f"Bonuses earned: {earned_bonuses}")
-            return earned_bonuses
+        earned_bonuses = Decimal(randint(10, 100))  # Генерация случайной суммы бонусов
+        bonus = Transaction(
+            payment_system=PaymentSystem.internal,
+            type=TransactionType.BONUS,
+            from_account='system',
+            to_account=str(user_id),
+            amount=earned_bonuses,
+            user_id=user_id,
+            status=TransactionStatus.CONFIRMED
+        )
+        await record_transactions(self.session, [bonus])
+        await self.session.commit()
+        await balance_cache.invalidate(user_id)
 
-        seconds_from_last_bonus_earn = (now - transaction.created_at).total_seconds()
-        if seconds_from_last_bonus_earn >= 86400:  # 24 hours
-            earned_bonuses = Decimal(randint(10, 100))
-            await self.add_bonuses(user_id, earned_bonuses)
-            logger.info(f"Bonuses earned after 24 hours: {earned_bonuses}")
-            return earned_bonuses
-        else:
-            logger.info(f"Too early to earn bonuses for user {user_id}, time left: {86400 - seconds_from_last_bonus_earn} seconds")
-            raise TooEarly()
+        logger.info(f"Bonuses earned: {earned_bonuses}")
+        return earned_bonuses
 
     async def get_pending_withdrawals(self) -> List[Transaction]:
         logger.info("Fetching pending withdrawals")
@@ -167,25 +820,92 @@ class TransactionService(BaseService):
         logger.info(f"Pending withdrawals found: {len(pending_withdrawals)}")
         return pending_withdrawals
 
+    async def stream_transactions(
+        self,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        payment_system: Optional[PaymentSystem] = None,
+        status: Optional[TransactionStatus] = None,
+        type: Optional[TransactionType] = None,
+        user_id: Optional[int] = None,
+        batch_size: int = 1000
+    ) -> AsyncIterator[Row]:
+        """Yields plain rows through a server-side cursor, `batch_size` at a time."""
+        logger.info(f"Streaming transactions from {date_from} to {date_to}, payment system: {payment_system}, "
+                    f"status: {status}, type: {type}, user: {user_id}")
+        query = _filter_period(select(*EXPORT_COLUMNS), date_from, date_to)
+        if payment_system is not None:
+            query = query.where(Transaction.payment_system == payment_system)
+        if status is not None:
+            query = query.where(Transaction.status == status)
+        if type is not None:
+            query = query.where(Transaction.type == type)
+        if user_id is not None:
+            query = query.where(Transaction.user_id == user_id)
+
+        result = await self.session.stream(
+            query.order_by(Transaction.created_at, Transaction.id).execution_options(yield_per=batch_size)
+        )
+        async for row in result:
+            yield row
+
+    async def _transition_withdrawals(self, transaction_ids: List[int], status: TransactionStatus) -> Dict[int, bool]:
+        """Moves every eligible PENDING withdrawal to `status` in one UPDATE.
+
+        Returns per-id success; ids that don't exist, aren't withdrawals or
+        aren't pending anymore are reported as failed.
+        """
+        ids = list(dict.fromkeys(transaction_ids))
+        result = await self.session.execute(
+            update(Transaction)
+            .where(
+                Transaction.id == any_(bindparam('ids', ids, type_=ARRAY(Integer))),
+                Transaction.type == TransactionType.OUT,
+                Transaction.status == TransactionStatus.PENDING
+            )
+            .values(status=status)
+            .returning(Transaction.id, Transaction.user_id, Transaction.type,
+                       Transaction.status, Transaction.amount, Transaction.created_at)
+            .execution_options(synchronize_session=False)
+        )
+        transitioned = result.all()
+
+        deltas = collect_balance_deltas(transitioned)
+        for row in transitioned:
+            # The row no longer holds its pending reservation
+            deltas[row.user_id][3] -= row.amount
+        await apply_balance_deltas(self.session, deltas)
+        await apply_rollup_deltas(
+            self.session,
+            collect_rollup_deltas(transitioned, TransactionStatus.PENDING, sign=-1),
+            collect_rollup_deltas(transitioned)
+        )
+
+        await self.session.commit()
+        if deltas:
+            await balance_cache.invalidate(*deltas)
+
+        done = {row.id for row in transitioned}
+        logger.info(f"Withdrawals moved to {status.name}: {len(done)} of {len(ids)}")
+        return {transaction_id: transaction_id in done for transaction_id in ids}
+
+    async def confirm_withdrawals(self, transaction_ids: List[int]) -> Dict[int, bool]:
+        logger.info(f"Confirming withdrawals with transaction IDs: {transaction_ids}")
+        return await self._transition_withdrawals(transaction_ids, TransactionStatus.CONFIRMED)
+
+    async def reject_withdrawals(self, transaction_ids: List[int]) -> Dict[int, bool]:
+        logger.info(f"Rejecting withdrawals with transaction IDs: {transaction_ids}")
+        return await self._transition_withdrawals(transaction_ids, TransactionStatus.REJECTED)
+
     async def confirm_withdrawal(self, transaction_id: int):
-        logger.info(f"Confirming withdrawal with transaction ID: {transaction_id}")
-        transaction = await self.session.get(Transaction, transaction_id)
-        if transaction and transaction.status == TransactionStatus.PENDING:
-            transaction.status = TransactionStatus.CONFIRMED
-            await self.session.commit()
-            logger.info(f"Withdrawal confirmed: {transaction_id}")
-        else:
+        results = await self.confirm_withdrawals([transaction_id])
+        if not results[transaction_id]:
             logger.warning(f"Transaction not found or not pending: {transaction_id}")
             raise WalletException("Transaction not found or not in pending status")
 
     async def reject_withdrawal(self, transaction_id: int):
-        logger.info(f"Rejecting withdrawal with transaction ID: {transaction_id}")
-        transaction = await self.session.get(Transaction, transaction_id)
-        if transaction and transaction.status == TransactionStatus.PENDING:
-            transaction.status = TransactionStatus.REJECTED
-            await self.session.commit()
-            logger.info(f"Withdrawal rejected: {transaction_id}")
-        else:
+        results = await self.reject_withdrawals([transaction_id])
+        if not results[transaction_id]:
             logger.warning(f"Transaction not found or not pending: {transaction_id}")
             raise WalletException("Transaction not found or not in pending status")
 
@@ -202,4 +922,100 @@ class TransactionService(BaseService):
             logger.info(f"Last withdrawal attempt found: {last_withdrawal.created_at}")
         else:
             logger.info("No withdrawal attempts found")
-        return last_withdrawal
\ No newline at end of file
+        return last_withdrawal
+
+
+class PromoCodeService(BaseService):
+
+    async def get_active_promo_codes(self) -> Dict[str, ActivePromoCode]:
+        result = await self.session.execute(
+            select(PromoCode.code, PromoCode.id, PromoCode.amount, PromoCode.expires_at).where(
+                PromoCode.active.is_(True),
+                or_(PromoCode.expires_at.is_(None), PromoCode.expires_at > datetime.now())
+            )
+        )
+        return {row.code: ActivePromoCode(row.id, row.amount, row.expires_at) for row in result}
+
+    async def create_promo_code(
+        self,
+        code: str,
+        amount: Decimal,
+        max_redemptions: Optional[int] = None,
+        per_user_limit: int = 1,
+        expires_at: Optional[datetime] = None
+    ) -> PromoCode:
+        promo = PromoCode(
+            code=code,
+            amount=amount,
+            max_redemptions=max_redemptions,
+            per_user_limit=per_user_limit,
+            expires_at=expires_at
+        )
+        self.session.add(promo)
+        await self.session.commit()
+        await self.session.refresh(promo)
+        promo_code_cache.invalidate()
+        logger.info(f"Promo code created: {promo.code}")
+        return promo
+
+    async def redeem(self, user_id: int, code: str) -> Decimal:
+        """Redeems the code and credits its bonus in one database transaction.
+
+        The global counter and the per-user counter are both bumped by a
+        single conditional statement, so concurrent redemptions on any number
+        of workers can't exceed either limit.
+        """
+        promo = await promo_code_cache.get(code, self.get_active_promo_codes)
+        if promo is None:
+            logger.warning(f"Promo code {code} not found for user {user_id}.")
+            raise PromoCodeNotFound()
+
+        now = datetime.now()
+        claimed = (
+            update(PromoCode)
+            .where(
+                PromoCode.id == promo.id,
+                PromoCode.active.is_(True),
+                or_(PromoCode.expires_at.is_(None), PromoCode.expires_at > now),
+                or_(PromoCode.max_redemptions.is_(None), PromoCode.redemptions_count < PromoCode.max_redemptions)
+            )
+            .values(redemptions_count=PromoCode.redemptions_count + 1)
+            .returning(PromoCode.id)
+            .cte('claimed')
+        )
+        redemption = insert(PromoCodeRedemption).from_select(
+            ['promo_code_id', 'user_id', 'uses', 'last_used_at'],
+            select(claimed.c.id, literal(user_id), literal(1), literal(now))
+        )
+        redemption = redemption.on_conflict_do_update(
+            index_elements=[PromoCodeRedemption.promo_code_id, PromoCodeRedemption.user_id],
+            set_={
+                'uses': PromoCodeRedemption.uses + 1,
+                'last_used_at': redemption.excluded.last_used_at,
+            },
+            where=PromoCodeRedemption.uses < select(PromoCode.per_user_limit).where(
+                PromoCode.id == promo.id
+            ).scalar_subquery()
+        ).add_cte(claimed).returning(PromoCodeRedemption.promo_code_id)
+
+        if (await self.session.execute(redemption)).first() is None:
+            # Limits reached or expired; also undoes the global counter bump
+            await self.session.rollback()
+            logger.warning(f"Promo code {code} is not available for user {user_id}.")
+            raise PromoCodeUnavailable()
+
+        bonus = Transaction(
+            payment_system=PaymentSystem.internal,
+            type=TransactionType.BONUS,
+            from_account=f'promo:{code}',
+            to_account=str(user_id),
+            amount=promo.amount,
+            user_id=user_id,
+            status=TransactionStatus.CONFIRMED
+        )
+        await record_transactions(self.session, [bonus])
+        await self.session.commit()
+        await balance_cache.invalidate(user_id)
+
+        logger.info(f"Promo code {code} applied for user {user_id}, amount: {promo.amount}.")
+        return promo.amount